@@ -8,13 +8,18 @@ Date: 17-05-2024
 import pygame
 from PIL import Image
 import math
-import json
 import logging
 import os
+import sys
 import random
 import threading
 import time
 
+# the character registry is shared with the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CharacterRegistry import CharacterRegistry
+from simulation_clock import SimulationClock, ms_to_ticks
+
 # Initialize pygame
 pygame.init()
 
@@ -44,6 +49,7 @@ MAP_IMAGE_PATH = r'../Assets/Map/map.png'
 PLAYER_COLLISION_MAP_PATH = r'../Assets/Map/player_collision.png'
 BULLET_COLLISION_MAP_PATH = r'../Assets/Map/bullet_collision.png'
 CHARACTER_STATS_FILE_PATH = r"../Characters.json"
+CHARACTERS = CharacterRegistry(CHARACTER_STATS_FILE_PATH)
 MAIN_MENU_IMAGE_PATH = r'../Assets/Map/map.png'
 WINNING_IMAGE_PATH = r'../Assets/GUI/WinTextImage.png'
 LOSING_IMAGE_PATH = r'../Assets/GUI/LostTextImage.png'
@@ -208,7 +214,8 @@ class Player:
 
         # default qualities
         self.dead = False
-        self.last_shot_time = 0
+        self.hidden = False  # the player is outside of the client's area of interest, the server stopped moving it
+        self.last_shot_tick = None  # the game tick of the player's last shot, None until it shoots
         self.bullets = []  # Store bullets for each player
         self.rect = pygame.Rect(x, y, width, height)
         self.direction = 'down'  # Initial direction
@@ -226,6 +233,8 @@ class Player:
         self.sprites = character.sprites
         self.bullet_damage = character.bullet_damage
         self.shooting_cooldown = character.shooting_cooldown
+        self.bullet_lifespan = character.bullet_lifespan
+        self.cooldown_ticks = ms_to_ticks(character.shooting_cooldown)
 
     def draw(self, camera):
         """
@@ -276,16 +285,16 @@ class Player:
         self.rect.x = self.x
         self.rect.y = self.y
 
-    def shoot(self, dx, dy):
+    def shoot(self, dx, dy, tick):
         """
-        make the player shoot a bullet
+        make the player shoot a bullet, if its cooldown passed
         :param dx: the x vector of the bullet
         :param dy: the y vector of the bullet
+        :param tick: the current game tick
         :return:
         """
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_shot_time > self.shooting_cooldown:
-            self.last_shot_time = current_time
+        if self.last_shot_tick is None or tick - self.last_shot_tick >= self.cooldown_ticks:
+            self.last_shot_tick = tick
 
             # Adjust the mouse coordinates based on the camera's offset
             # Since the camera's x and y represent the top-left corner of the view,
@@ -295,18 +304,28 @@ class Player:
             center_x = self.x + self.width // 2
             center_y = self.y + self.height // 2
 
-            # Create and add the new bullet to the bullets list
-            self.bullets.append(Bullet(
-                center_x,
-                center_y,
-                dx,
-                dy,
-                3,
-                self.bullet_damage,
-                self,
-                self.shooting_cooldown,
-                self.bullet_image)
-            )
+            self.add_bullet(center_x, center_y, dx, dy)
+
+    def add_bullet(self, x, y, dx, dy):
+        """
+        create a bullet of the player at a given position, without checking the shooting cooldown
+        :param x: the bullet's x coordinate
+        :param y: the bullet's y coordinate
+        :param dx: the x vector of the bullet
+        :param dy: the y vector of the bullet
+        :return:
+        """
+        self.bullets.append(Bullet(
+            x,
+            y,
+            dx,
+            dy,
+            3,
+            self.bullet_damage,
+            self,
+            self.bullet_lifespan,
+            self.bullet_image)
+        )
 
     def take_damage(self, damage):
         """
@@ -437,6 +456,7 @@ class Game:
             thread = threading.Thread(target=self.play_random_music)
             thread.start()
             self.player = None
+            self.clock = SimulationClock()  # moves a tick every frame, cooldowns are counted in its ticks
 
         except Exception as e:
             logger.error(f"Game initialization error: {e}")
@@ -482,6 +502,7 @@ class Game:
         :return: None
         """
         try:
+            self.clock.advance()
             self.update_bullets()
             self.draw_game_objects()
             if self.player:
@@ -556,13 +577,20 @@ class Game:
 
     def create_player(self, player_id, character_name, x, y):
         """
-        Create and register a new player in the game.
+        Create and register a new player in the game. A player the game has already, which the server sent again
+        when it entered the client's area, is only moved, so its hp, death and bullets are kept.
         :param player_id: Unique identifier for the player
         :param character_name: The name of the character model to load
         :param x: The initial x-coordinate for the player
         :param y: The initial y-coordinate for the player
         :return: None
         """
+        if player_id in self.players:
+            player = self.players[player_id]
+            player.x, player.y = x, y
+            player.rect.x, player.rect.y = x, y
+            player.hidden = False
+            return
         character = self.load_character_from_json(character_name)
         player = Player(
             character,
@@ -576,6 +604,16 @@ class Game:
             self.player = player
         # logger.info(f"Created new player ({character_name}) in x = {x}, y = {y}")
 
+    def hide_player(self, player_id):
+        """
+        Stop drawing a player which left the client's area of interest. It is kept, so its hp and death are
+        still known, and shown again when the server sends it back.
+        :param player_id: The unique identifier of the player to hide
+        :return: None
+        """
+        if player_id in self.players:
+            self.players[player_id].hidden = True
+
     def delete_player(self, player_id):
         """
         Remove a player from the game based on their unique identifier.
@@ -604,7 +642,33 @@ class Game:
         :return: None
         """
         if player_id in self.players:
-            self.players[player_id].shoot(dx, dy)
+            self.players[player_id].shoot(dx, dy, self.clock.tick)
+
+    def add_bullet(self, player_id, x, y, dx, dy):
+        """
+        Add a bullet the server reported, at the position it was shot from.
+        :param player_id: The unique identifier of the shooting player
+        :param x: The x-coordinate the bullet was shot from
+        :param y: The y-coordinate the bullet was shot from
+        :param dx: The x-component of the bullet's velocity
+        :param dy: The y-component of the bullet's velocity
+        :return: None
+        """
+        if player_id in self.players:
+            self.players[player_id].add_bullet(x, y, dx, dy)
+
+    def sync_player_hp(self, player_id, hp):
+        """
+        Bring a player's hp down to the hp the server reported. hp only ever goes down,
+        so an older report arriving late never heals the player back.
+        :param player_id: The unique identifier of the player
+        :param hp: The hp reported by the server
+        :return: None
+        """
+        if player_id in self.players:
+            player = self.players[player_id]
+            if hp < player.hp:
+                player.take_damage(player.hp - hp)
 
     def update_bullets(self):
         """
@@ -627,7 +691,7 @@ class Game:
         :return: Boolean indicating if a hit was detected (True if it was, False otherwise)
         """
         for player_id, player in self.players.items():
-            if player_id != shooter_id and player.rect.collidepoint(bullet.x, bullet.y):
+            if player_id != shooter_id and not player.hidden and player.rect.collidepoint(bullet.x, bullet.y):
                 return True  # Bullet hit a player
         return False  # No hit detected
 
@@ -651,14 +715,14 @@ class Game:
             self.screen.blit(MAP_IMAGE, (map_offset_x, map_offset_y))
             # First, draw all dead players
             for player in self.players.values():
-                if player.dead:  # Check if the player is dead
+                if player.dead and not player.hidden:  # Check if the player is dead
                     player.draw(self.camera)
                     for bullet in player.bullets:
                         bullet.draw(self.camera)
 
             # Second, draw all players who are not the main player and are not dead
             for player in self.players.values():
-                if not player.dead and player != self.player:
+                if not player.dead and not player.hidden and player != self.player:
                     player.draw(self.camera)
                     for bullet in player.bullets:
                         bullet.draw(self.camera)
@@ -732,31 +796,12 @@ class Game:
     @staticmethod
     def load_character_from_json(name):
         """
-        Load character data from a JSON file.
+        Load character data from the character registry, which parses the json file only when it changes.
         :param name: The name of the character to load
         :return: A Character object
         """
         try:
-            with open(CHARACTER_STATS_FILE_PATH, 'r') as file:
-                data = json.load(file)
-            for char_data in data['characters']:
-                if char_data['name'] == name:
-                    return Character(
-                        name=char_data['name'],
-                        hp=char_data['hp'],
-                        speed=char_data['speed'],
-                        bullet_speed=char_data['bullet_speed'],
-                        bullet_damage=char_data['bullet_damage'],
-                        bullet_lifespan=char_data['bullet_lifespan'],
-                        shooting_cooldown=char_data['shooting_cooldown']
-                    )
-            raise ValueError(f"No character found with the name {name}")
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON Decode Error: {e}")
-            raise
-        except FileNotFoundError as e:
-            logger.error(f"File not found: {e}")
-            raise
+            return Character(**CHARACTERS.get(name)._asdict())
         except Exception as e:
             logger.error(f"Error loading character data: {e}")
             raise
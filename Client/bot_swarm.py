@@ -0,0 +1,547 @@
+"""
+Author: Yoni Reichert
+Program name: bot_swarm.py
+Description: A headless load generator for the server. Spawns many bots from one process (or a few of them), which
+             talk to the server with the same messages the game client sends, move and shoot in scripted patterns,
+             and measure the packet rates, the snapshot loss and how long it takes until an action is seen in a
+             snapshot. Run it from the Client folder, for example: python bot_swarm.py --bots 500 --spawn-server
+Date: 17-10-2026
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import deque
+from threading import Thread
+
+# the protocol module and the reliable channel are shared with the server, the bots use them like GameClient does
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+from reliability import ReliableChannel, validate_parameters
+from CharacterRegistry import CharacterRegistry
+
+logger = logging.getLogger("bot_swarm")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+SERVER_IP = '127.0.0.1'
+SERVER_PORT = 12345
+SPAWNED_SERVER_PORT = 12346  # the port of the server started by --spawn-server
+SERVER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server')
+CHARACTERS_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Characters.json')
+
+DEFAULT_BOTS = 100
+DEFAULT_DURATION = 30  # seconds
+RAMP_UP_TIME = 2.0  # seconds over which the bots join, so the server doesn't get all of the inits at once
+MOVE_INTERVAL = 0.2  # seconds between two moves of a bot, the client's update delay
+SHOOT_INTERVAL = 1.0  # seconds between two shots of a bot
+MOVE_STEP = 6  # pixels a bot moves in every move
+CIRCLE_RADIUS = 60
+PATTERNS = ('walk', 'circle', 'idle')
+
+MAX_PENDING_ACTIONS = 32  # actions kept per bot while waiting for them to show up in a snapshot
+ACTION_ECHO_TIMEOUT = 2.0  # seconds, an action that didn't show up by then was dropped or overwritten
+MAX_LATENCY_SAMPLES = 100000  # per process, older samples are replaced at random once there are more
+PERCENTILES = (50, 90, 99)
+
+# Action types
+MOVE_PLAYER = 'move'
+SHOOT_PLAYER = 'shoot'
+PLAYER_INIT = 'player_init'
+HIT_PLAYER = 'hit'
+SNAPSHOT = 'snapshot'
+SNAPSHOT_ACK = 'snapshot_ack'
+RELIABLE = 'reliable'
+ACK = 'ack'
+
+ACTION_TYPE = 'type'
+ACTION_PARAMETERS = 'action_parameters'
+PLAYER_ID = 'player_id'
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class SwarmStats:
+    def __init__(self):
+        """
+        Initialize the counters of the bots of one process.
+        """
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.snapshots_expected = 0
+        self.snapshots_received = 0
+        self.rejoins = 0
+        self.samples = {'move_echo_ms': [], 'shot_echo_ms': [], 'snapshot_interval_ms': []}
+        self.sample_counts = {name: 0 for name in self.samples}
+
+    def add_sample(self, name, value):
+        """
+        Keep a latency sample, at most MAX_LATENCY_SAMPLES of each kind (reservoir sampling).
+        :param name: the kind of the sample
+        :param value: the sample, in milliseconds
+        """
+        samples = self.samples[name]
+        self.sample_counts[name] += 1
+        if len(samples) < MAX_LATENCY_SAMPLES:
+            samples.append(value)
+        else:
+            index = random.randrange(self.sample_counts[name])
+            if index < MAX_LATENCY_SAMPLES:
+                samples[index] = value
+
+    def as_dict(self):
+        """
+        :return: dictionary of the counters and samples, which can be sent between processes
+        """
+        return {'packets_sent': self.packets_sent,
+                'bytes_sent': self.bytes_sent,
+                'packets_received': self.packets_received,
+                'bytes_received': self.bytes_received,
+                'snapshots_expected': self.snapshots_expected,
+                'snapshots_received': self.snapshots_received,
+                'rejoins': self.rejoins,
+                'samples': self.samples}
+
+
+class Bot(asyncio.DatagramProtocol):
+    def __init__(self, bot_id, character_name, pattern, stats):
+        """
+        Initialize a bot, it joins once its socket is ready.
+        :param bot_id: the bot's index, it also picks the bot's shooting direction
+        :param character_name: the character the bot plays
+        :param pattern: how the bot moves, one of PATTERNS
+        :param stats: the SwarmStats of the bot's process
+        """
+        self.bot_id = bot_id
+        self.character_name = character_name
+        self.pattern = pattern
+        self.stats = stats
+        self.transport = None
+        self.encoding = protocol.ENCODING_BINARY
+        self.session = 0
+        self.reliable = ReliableChannel(self.encoding)
+        self.position = None  # known once the server sends the bot's own player init
+        self.step = 0
+        self.heading = random.uniform(0, 2 * math.pi)
+        self.pending_moves = {}  # (x, y) -> when the move was sent
+        self.pending_shots = deque()  # when every shot not yet seen in a snapshot was sent
+
+        # the snapshot ids of the bot's current room, to count the lost ones
+        self.first_snapshot_id = None
+        self.last_snapshot_id = None
+        self.last_snapshot_time = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def join(self):
+        """
+        Choose the bot's character, like the client does when the game starts.
+        """
+        self.send_message({ACTION_TYPE: PLAYER_INIT, ACTION_PARAMETERS: [self.character_name]}, reliable=True)
+
+    def send_message(self, message, reliable=False):
+        """
+        Serialize and send a message to the server, the same way GameClient.send_message does.
+        :param message: the message dictionary to send
+        :param reliable: send the message on the reliable channel
+        """
+        message[protocol.SESSION] = self.session
+        data = protocol.encode_message(message, self.encoding)
+        if reliable:
+            data = self.reliable.wrap(data, self.session)
+        self.send_datagrams([data])
+
+    def send_datagrams(self, messages):
+        """
+        Send encoded messages, bundled with the due retransmissions and the ack of the reliable channel.
+        :param messages: list of the encoded messages, can be empty
+        """
+        messages = messages + self.reliable.due_retransmissions()
+        ack = self.reliable.build_ack(self.session)
+        if ack:
+            messages.append(ack)
+        for datagram in protocol.bundle_messages(messages, self.encoding):
+            self.transport.sendto(datagram)
+            self.stats.packets_sent += 1
+            self.stats.bytes_sent += len(datagram)
+
+    async def run(self, delay, end):
+        """
+        Join after a delay, then run the bot's script every MOVE_INTERVAL until the end.
+        :param delay: seconds to wait before joining
+        :param end: when to stop, in time.perf_counter seconds
+        """
+        await asyncio.sleep(delay)
+        self.join()
+        while time.perf_counter() < end:
+            await asyncio.sleep(MOVE_INTERVAL)
+            self.tick(time.perf_counter())
+
+    def tick(self, now):
+        """
+        Run a step of the bot's script: move along its pattern, and shoot every SHOOT_INTERVAL.
+        :param now: the current time, in seconds
+        """
+        if self.position is None:
+            self.send_datagrams([])
+            return
+        self.step += 1
+        if self.pattern != 'idle':
+            x, y = self.next_position()
+            self.position = (x, y)
+            self.pending_moves[(x, y)] = now
+            if len(self.pending_moves) > MAX_PENDING_ACTIONS:
+                del self.pending_moves[next(iter(self.pending_moves))]
+            self.send_message({ACTION_TYPE: MOVE_PLAYER, ACTION_PARAMETERS: [x, y]})
+        shoot_steps = max(round(SHOOT_INTERVAL / MOVE_INTERVAL), 1)
+        if self.step % shoot_steps == self.bot_id % shoot_steps:
+            angle = self.heading + self.step
+            self.pending_shots.append(now)
+            if len(self.pending_shots) > MAX_PENDING_ACTIONS:
+                self.pending_shots.popleft()
+            self.send_message({ACTION_TYPE: SHOOT_PLAYER, ACTION_PARAMETERS: [math.cos(angle), math.sin(angle)]})
+        elif self.pattern == 'idle':
+            self.send_datagrams([])
+
+    def next_position(self):
+        """
+        :return: the bot's next position, always a different one, so every move shows up in the next snapshot
+        """
+        x, y = self.position
+        if self.pattern == 'circle':
+            angle = self.step * MOVE_STEP / CIRCLE_RADIUS
+            return (int(x + MOVE_STEP * math.cos(angle)) or x + 1,
+                    int(y + MOVE_STEP * math.sin(angle)))
+        if random.random() < 0.1:
+            self.heading = random.uniform(0, 2 * math.pi)
+        dx, dy = int(MOVE_STEP * math.cos(self.heading)), int(MOVE_STEP * math.sin(self.heading))
+        return x + (dx or 1), y + dy
+
+    def datagram_received(self, data, addr):
+        """
+        Decode a datagram of the server and handle its messages.
+        :param data: the datagram
+        :param addr: the server's address
+        """
+        self.stats.packets_received += 1
+        self.stats.bytes_received += len(data)
+        game_updates, _ = protocol.decode_datagram(data)
+        for game_update in game_updates:
+            session = game_update.get(protocol.SESSION)
+            if session and session != self.session:
+                if self.session:
+                    self.rejoin()
+                self.session = session
+            self.handle_game_update(game_update)
+
+    def rejoin(self):
+        """
+        The server gave the bot a new session, since its room was closed. Join again like a new client.
+        """
+        self.stats.rejoins += 1
+        self.finish_room()
+        self.reliable = ReliableChannel(self.encoding)
+        self.position = None
+        self.pending_moves.clear()
+        self.pending_shots.clear()
+        self.join()
+
+    def handle_game_update(self, game_update):
+        """
+        Handle a game update, the messages of the reliable channel are handed over in order.
+        :param game_update: a decoded game update
+        """
+        action_type = game_update[ACTION_TYPE]
+        parameters = game_update[ACTION_PARAMETERS]
+        if action_type in (ACK, RELIABLE) and not validate_parameters(action_type, parameters):
+            return
+        if action_type == ACK:
+            self.reliable.acknowledge(*parameters)
+        elif action_type == RELIABLE:
+            for delivered in self.reliable.receive(*parameters):
+                if delivered:
+                    self.handle_game_update(delivered)
+        elif action_type == PLAYER_INIT:
+            if game_update[PLAYER_ID] == protocol.SELF_PLAYER_ID and len(parameters) >= 3:
+                self.position = (int(parameters[1]), int(parameters[2]))
+        elif action_type == SNAPSHOT:
+            self.handle_snapshot(*parameters)
+
+    def handle_snapshot(self, snapshot_id, baseline_id, changed, removed, bullets):
+        """
+        Acknowledge a snapshot, count the snapshots lost before it, and find the bot's own actions in it.
+        :param snapshot_id: the snapshot's id
+        :param baseline_id: the snapshot it is a delta against
+        :param changed: list of the changed players
+        :param removed: list of the removed player ids
+        :param bullets: list of the new bullets
+        """
+        now = time.perf_counter()
+        self.send_message({ACTION_TYPE: SNAPSHOT_ACK, ACTION_PARAMETERS: [snapshot_id]})
+        if self.last_snapshot_id is not None and snapshot_id <= self.last_snapshot_id:
+            return  # arrived out of order, it was already counted as lost
+        if self.first_snapshot_id is None:
+            self.first_snapshot_id = snapshot_id
+        elif self.last_snapshot_time is not None:
+            self.stats.add_sample('snapshot_interval_ms',
+                                  (now - self.last_snapshot_time) * 1000 / (snapshot_id - self.last_snapshot_id))
+        self.last_snapshot_id = snapshot_id
+        self.last_snapshot_time = now
+        self.stats.snapshots_received += 1
+
+        for player in changed:
+            if player[0] == protocol.SELF_PLAYER_ID:
+                sent = self.pending_moves.pop((player[1], player[2]), None)
+                if sent is not None:
+                    self.stats.add_sample('move_echo_ms', (now - sent) * 1000)
+                    # the moves sent before it were overwritten by it
+                    for position in [position for position, time_sent in self.pending_moves.items()
+                                     if time_sent <= sent]:
+                        del self.pending_moves[position]
+        for bullet in bullets:
+            if bullet[1] == protocol.SELF_PLAYER_ID:
+                while self.pending_shots and now - self.pending_shots[0] > ACTION_ECHO_TIMEOUT:
+                    self.pending_shots.popleft()  # dropped by the shooting cooldown, or lost
+                if self.pending_shots:
+                    self.stats.add_sample('shot_echo_ms', (now - self.pending_shots.popleft()) * 1000)
+
+    def finish_room(self):
+        """
+        Count the snapshots the bot should have got in its room, before it leaves the room.
+        """
+        if self.first_snapshot_id is not None:
+            self.stats.snapshots_expected += self.last_snapshot_id - self.first_snapshot_id + 1
+        self.first_snapshot_id = self.last_snapshot_id = self.last_snapshot_time = None
+
+    def error_received(self, exc):
+        logger.info(f"Bot {self.bot_id} got a socket error: {exc}")
+
+
+async def run_swarm(bot_ids, server_address, duration, patterns, character_names):
+    """
+    Run bots on an asyncio event loop, each bot on a socket of its own.
+    :param bot_ids: the indexes of the bots to run
+    :param server_address: the server's (ip, port)
+    :param duration: how many seconds to run, after all of the bots joined
+    :param patterns: the movement patterns the bots take turns using
+    :param character_names: the characters the bots take turns playing
+    :return: the SwarmStats of the bots, as a dictionary
+    """
+    loop = asyncio.get_running_loop()
+    stats = SwarmStats()
+    bots = []
+    for bot_id in bot_ids:
+        bot = Bot(bot_id, character_names[bot_id % len(character_names)], patterns[bot_id % len(patterns)], stats)
+        await loop.create_datagram_endpoint(lambda: bot, remote_addr=server_address)
+        bots.append(bot)
+
+    # the bots join spread over the ramp up
+    end = time.perf_counter() + RAMP_UP_TIME + duration
+    await asyncio.gather(*[bot.run(RAMP_UP_TIME * index / len(bots), end) for index, bot in enumerate(bots)])
+
+    for bot in bots:
+        bot.finish_room()
+        bot.transport.close()
+    return stats.as_dict()
+
+
+def run_process(bot_ids, server_address, duration, patterns, character_names, results):
+    """
+    The entry point of a swarm process.
+    :param bot_ids: the indexes of the process' bots
+    :param server_address: the server's (ip, port)
+    :param duration: how many seconds to run
+    :param patterns: the movement patterns
+    :param character_names: the characters
+    :param results: a multiprocessing Queue the stats are put in
+    """
+    results.put(asyncio.run(run_swarm(bot_ids, server_address, duration, patterns, character_names)))
+
+
+def run_server(port, tick_rate, stop_event, results):
+    """
+    The entry point of a server process started by --spawn-server. When stop_event is set the server stops,
+    and its tick timings and received packet counts are put in results.
+    :param port: the port to listen on
+    :param tick_rate: the server's tick rate
+    :param stop_event: a multiprocessing Event
+    :param results: a multiprocessing Queue
+    """
+    os.chdir(SERVER_DIRECTORY)  # the server loads its map and assets relative to its folder
+    sys.path.insert(0, SERVER_DIRECTORY)
+    import server
+    server.SERVER_PORT = port
+    commands_server = server.CommandsServer(tick_rate)
+
+    received = {'packets': 0, 'bytes': 0}
+    handle_datagram = commands_server.handle_datagram
+
+    def counting_handle_datagram(data, client_address):
+        received['packets'] += 1
+        received['bytes'] += len(data)
+        handle_datagram(data, client_address)
+
+    commands_server.handle_datagram = counting_handle_datagram
+    Thread(target=lambda: (stop_event.wait(), commands_server.stop()), daemon=True).start()
+    asyncio.run(commands_server.start_async_server())
+    results.put({'tick_stats': commands_server.scheduler.stats.as_dict(),
+                 'packets_received': received['packets'],
+                 'bytes_received': received['bytes'],
+                 'rooms': sum(1 for _ in commands_server.rooms)})
+
+
+def percentiles(samples):
+    """
+    :param samples: list of numbers
+    :return: dictionary of the PERCENTILES and the max of the samples, empty if there are none
+    """
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {f'p{percent}': samples[min(int(len(samples) * percent / 100), len(samples) - 1)]
+              for percent in PERCENTILES}
+    result['max'] = samples[-1]
+    return result
+
+
+def merge_results(process_results):
+    """
+    Sum the stats of every swarm process.
+    :param process_results: list of SwarmStats dictionaries
+    :return: one SwarmStats dictionary
+    """
+    merged = SwarmStats().as_dict()
+    for result in process_results:
+        for key, value in result.items():
+            if key == 'samples':
+                for name, samples in value.items():
+                    merged['samples'][name].extend(samples)
+            else:
+                merged[key] += value
+    return merged
+
+
+def build_report(swarm, server_stats, bots, duration):
+    """
+    :param swarm: the merged SwarmStats dictionary
+    :param server_stats: the stats of the spawned server, or None
+    :param bots: the number of bots
+    :param duration: how many seconds the bots ran, the ramp up included
+    :return: the report dictionary
+    """
+    report = {
+        'bots': bots,
+        'duration_s': duration,
+        'client_out_packets_per_s': swarm['packets_sent'] / duration,
+        'client_out_bytes_per_s': swarm['bytes_sent'] / duration,
+        'client_in_packets_per_s': swarm['packets_received'] / duration,
+        'client_in_bytes_per_s': swarm['bytes_received'] / duration,
+        'snapshot_loss': 1 - swarm['snapshots_received'] / swarm['snapshots_expected']
+        if swarm['snapshots_expected'] else None,
+        'rejoins': swarm['rejoins'],
+    }
+    for name, samples in swarm['samples'].items():
+        report[name] = percentiles(samples)
+    if server_stats:
+        report['server_tick'] = server_stats['tick_stats']
+        report['server_rooms_open'] = server_stats['rooms']
+        report['upstream_loss'] = 1 - server_stats['packets_received'] / swarm['packets_sent'] \
+            if swarm['packets_sent'] else None
+    return report
+
+
+def print_report(report):
+    """
+    Print a report in a readable form.
+    :param report: the report dictionary
+    """
+    print(f"{report['bots']} bots for {report['duration_s']:.0f} seconds, rejoined {report['rejoins']} times")
+    print(f"  out: {report['client_out_packets_per_s']:.0f} packets/s, {report['client_out_bytes_per_s']:.0f} bytes/s")
+    print(f"  in:  {report['client_in_packets_per_s']:.0f} packets/s, {report['client_in_bytes_per_s']:.0f} bytes/s")
+    if report['snapshot_loss'] is not None:
+        print(f"  snapshot loss: {report['snapshot_loss']:.2%}")
+    if report.get('upstream_loss') is not None:
+        print(f"  upstream loss: {report['upstream_loss']:.2%}")
+    for name in ('move_echo_ms', 'shot_echo_ms', 'snapshot_interval_ms'):
+        if report[name]:
+            print(f"  {name}: " + ', '.join(f"{key} {value:.1f}" for key, value in report[name].items()))
+    if 'server_tick' in report:
+        tick = report['server_tick']
+        print(f"  server tick: average {tick['average_ms']:.2f} ms, max {tick['max_ms']:.2f} ms, "
+              f"{tick['over_budget_ticks']} of {tick['ticks']} over the {tick['budget_ms']:.1f} ms budget, "
+              f"{tick['skipped_ticks']} skipped")
+        for name, phase in tick['phases'].items():
+            print(f"    {name}: average {phase['average_ms']:.3f} ms, max {phase['max_ms']:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a swarm of headless bots against the game server")
+    parser.add_argument('--bots', type=int, default=DEFAULT_BOTS, help="how many bots to run")
+    parser.add_argument('--processes', type=int, default=1, help="how many processes to spread the bots over")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="seconds to run after ramp up")
+    parser.add_argument('--server-ip', default=SERVER_IP)
+    parser.add_argument('--server-port', type=int, default=SERVER_PORT)
+    parser.add_argument('--patterns', default=','.join(PATTERNS),
+                        help=f"comma separated movement patterns the bots take turns using, of {', '.join(PATTERNS)}")
+    parser.add_argument('--spawn-server', action='store_true',
+                        help="start a server in a process of its own and report its tick timings too")
+    parser.add_argument('--tick-rate', type=int, default=60, help="tick rate of the spawned server")
+    parser.add_argument('--json', help="also write the report as json to this file")
+    args = parser.parse_args()
+
+    patterns = args.patterns.split(',')
+    for pattern in patterns:
+        if pattern not in PATTERNS:
+            parser.error(f"unknown pattern {pattern}")
+    character_names = CharacterRegistry(CHARACTERS_FILE_PATH).names()
+    server_address = (args.server_ip, args.server_port)
+
+    server_process = None
+    server_results = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    if args.spawn_server:
+        server_address = ('127.0.0.1', SPAWNED_SERVER_PORT)
+        server_process = multiprocessing.Process(target=run_server,
+                                                 args=(SPAWNED_SERVER_PORT, args.tick_rate, stop_event,
+                                                       server_results))
+        server_process.start()
+        time.sleep(1)  # let the server bind its socket
+
+    results = multiprocessing.Queue()
+    processes = []
+    for index in range(args.processes):
+        bot_ids = list(range(index, args.bots, args.processes))
+        processes.append(multiprocessing.Process(target=run_process,
+                                                 args=(bot_ids, server_address, args.duration, patterns,
+                                                       character_names, results)))
+    for process in processes:
+        process.start()
+    process_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    server_stats = None
+    if server_process:
+        stop_event.set()
+        server_stats = server_results.get()
+        server_process.join()
+
+    report = build_report(merge_results(process_results), server_stats, args.bots, RAMP_UP_TIME + args.duration)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,9 @@ Date: 17-05-2024
 """
 
 import socket
-import json
+import select
 import sys
+import os
 import time
 import pygame
 import GameMenu
@@ -16,6 +17,11 @@ from threading import Thread
 import logging
 from queue import Queue
 
+# the protocol module is shared with the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+from reliability import ReliableChannel, validate_parameters
+
 
 logging.basicConfig(
     filename='client.log',
@@ -35,6 +41,11 @@ MOVE_PLAYER = 'move'
 SHOOT_PLAYER = 'shoot'
 PLAYER_INIT = 'player_init'
 HIT_PLAYER = 'hit'
+SNAPSHOT = 'snapshot'
+SNAPSHOT_ACK = 'snapshot_ack'
+RELIABLE = 'reliable'
+ACK = 'ack'
+LEAVE_VIEW = 'leave_view'
 
 # Server response keys
 ACTION_TYPE = 'type'
@@ -43,7 +54,15 @@ PLAYER_ID = 'player_id'
 
 UPDATE_DELAY = 0.2
 
-MESSAGE_DIVIDER = '!'
+# a player standing still only sends its position this often, to keep the connection alive. player inits and
+# hits come on the reliable channel, so the server doesn't need to hear the same position every update delay
+KEEPALIVE_INTERVAL = 1.0
+
+# how many received snapshots are kept, the server builds its deltas against one of them
+SNAPSHOT_HISTORY_SIZE = 64
+
+# the server answers in whatever encoding the client's first message used
+USE_BINARY_PROTOCOL = True
 
 # -------------------------------------------------------------------------------------------------------------------
 
@@ -61,12 +80,20 @@ class GameClient:
         self.server_port = SERVER_PORT
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.client_socket.settimeout(1.0)  # Set timeout to 1 second
+        # every datagram is received into this buffer, and parsed straight out of it
+        self.receive_buffer = bytearray(protocol.MAX_DATAGRAM_SIZE)  # snapshots can be big
+        self.receive_view = memoryview(self.receive_buffer)
         self.running = True
         # the amount of seconds which the client will update the server
         self.update_delay = update_delay
         self.action_queue = Queue()
         self.character_name = character_name
+        self.encoding = protocol.ENCODING_BINARY if USE_BINARY_PROTOCOL else protocol.ENCODING_JSON
+        self.session = 0  # the session token is given by the server in the header of its messages
+        self.reliable = ReliableChannel(self.encoding)
         self.target_positions = {}
+        self.snapshots = {}  # snapshot id -> {player id: (x, y, hp)}
+        self.last_snapshot_id = 0
         self.threads = []
 
     def send_character_init(self, character_name) -> None:
@@ -75,7 +102,7 @@ class GameClient:
         :param character_name: The name of the character chosen by the user
         """
         message = {'type': PLAYER_INIT, 'action_parameters': [character_name]}
-        self.send_message(message)
+        self.send_message(message, reliable=True)
 
     def send_move_action(self, x, y) -> None:
         """
@@ -96,68 +123,94 @@ class GameClient:
         message = {'type': SHOOT_PLAYER, 'action_parameters': [dx, dy]}
         self.send_message(message)
 
-    def send_message(self, message) -> None:
+    def send_snapshot_ack(self, snapshot_id) -> None:
+        """
+        Tell the server a snapshot was received, so it can send the next one as a delta against it.
+        :param snapshot_id: the id of the received snapshot
+        """
+        message = {'type': SNAPSHOT_ACK, 'action_parameters': [snapshot_id]}
+        self.send_message(message)
+
+    def send_message(self, message, reliable=False) -> None:
         """
-        Serialize and send a message to the server.
+        Serialize and send a message to the server, along with the client's session token.
         :param message: The message dictionary to send
+        :param reliable: send the message on the reliable channel, it is sent again until the server acks it
         """
         try:
-            message_str = json.dumps(message)
-            message_length = len(message_str)
-            full_message = str(message_length) + MESSAGE_DIVIDER + message_str
-            self.client_socket.sendto(full_message.encode(), (self.server_ip, self.server_port))
+            message[protocol.SESSION] = self.session
+            full_message = protocol.encode_message(message, self.encoding)
+            if reliable:
+                full_message = self.reliable.wrap(full_message, self.session)
+            self.send_datagrams([full_message])
+        except (TypeError, ValueError) as e:
+            logger.error(f"Encode error during message sending: {e}")
+
+    def send_datagrams(self, messages) -> None:
+        """
+        Send encoded messages to the server, bundled with the reliable messages that weren't acked in time
+        and the ack of the reliable messages the server sent.
+        :param messages: list of the encoded messages, can be empty
+        """
+        messages = messages + self.reliable.due_retransmissions()
+        ack = self.reliable.build_ack(self.session)
+        if ack:
+            messages.append(ack)
+        try:
+            for datagram in protocol.bundle_messages(messages, self.encoding):
+                self.client_socket.sendto(datagram, (self.server_ip, self.server_port))
         except socket.error as e:
             logger.error(f"Socket error during message sending: {e}")
-        except json.JSONEncoder as e:
-            logger.error(f"JSON encode error during message sending: {e}")
 
     def receive_game_update(self) -> None:
         """
-        Receive and process the updated game state from the server.
+        Receive and process the updated game state from the server. Waits for a datagram,
+        then handles every other datagram that is already waiting too.
         if the game update isn't valid, dump the message
         """
         try:
-            # Read the entire datagram
-            data, _ = self.client_socket.recvfrom(1024)  # Adjust buffer size as needed
-            data = data.decode()
-
-            # Initialize variables to parse the message
-            length_str = ""
-            index = 0
-
-            # Read the length of the message
-            while index < len(data):
-                char = data[index]
-                if char.isdigit():
-                    length_str += char
-                    index += 1
-                elif char == '!':
-                    index += 1
-                    break
-                else:
-                    logger.error(f"Invalid char while reading message length: {char}")
-                    return
-
-            # Convert the length string to an integer
-            length = int(length_str)
-
-            # Read the message content of the specified length
-            message = data[index:index + length]
-
-            # Check if the message length matches the specified length
-            if len(message) != length:
-                logger.error(f"Message length mismatch. Expected {length}, got {len(message)}")
-                return
-            game_update = json.loads(message)
-            if validate_json_game_update(game_update):
-                self.action_queue.put(game_update)
-            else:
-                logger.error(f"Error while validating game update, the game update: {game_update}")
+            size, _ = self.client_socket.recvfrom_into(self.receive_buffer)
+            self.handle_datagram(self.receive_view[:size])
+            while select.select([self.client_socket], [], [], 0)[0]:
+                size, _ = self.client_socket.recvfrom_into(self.receive_buffer)
+                self.handle_datagram(self.receive_view[:size])
         except socket.timeout:
             pass
         except socket.error:
             pass
 
+    def handle_datagram(self, data) -> None:
+        """
+        Decode a datagram and queue its game updates, the server bundles all of the messages of a tick
+        into as few datagrams as it can.
+        :param data: the datagram, a view of the receive buffer which is overwritten by the next datagram
+        """
+        game_updates, _ = protocol.decode_datagram(data)
+        for game_update in game_updates:
+            if isinstance(game_update, dict) and game_update.get(protocol.SESSION):
+                self.session = game_update[protocol.SESSION]
+            self.handle_game_update(game_update)
+
+    def handle_game_update(self, game_update) -> None:
+        """
+        Queue a game update, acks and reliable messages are taken by the reliable channel,
+        which hands over the messages inside of them in the order the server sent them.
+        :param game_update: a decoded game update
+        """
+        if isinstance(game_update, dict) and game_update.get(ACTION_TYPE) in (ACK, RELIABLE):
+            parameters = game_update.get(ACTION_PARAMETERS)
+            if not validate_parameters(game_update[ACTION_TYPE], parameters):
+                logger.error(f"Error while validating reliable channel message: {game_update}")
+            elif game_update[ACTION_TYPE] == ACK:
+                self.reliable.acknowledge(*parameters)
+            else:
+                for delivered in self.reliable.receive(*parameters):
+                    self.handle_game_update(delivered)
+        elif validate_json_game_update(game_update):
+            self.action_queue.put(game_update)
+        else:
+            logger.error(f"Error while validating game update, the game update: {game_update}")
+
     def handle_key_events(self) -> None:
         """
         Process keyboard events and update the game object accordingly
@@ -216,6 +269,9 @@ class GameClient:
                 if action_type == PLAYER_INIT:
                     logger.info(f"Got the player from server! {action_params[0], action_params[1], action_params[2]}")
                     self.game.create_player(player_id, *action_params)
+                    if player_id != '0' and player_id in self.target_positions:
+                        # it appears where it is, instead of walking there from where it was last seen
+                        self.target_positions[player_id] = tuple(action_params[1:3])
 
                 elif action_type == MOVE_PLAYER and player_id != '0':
                     x, y = action_params[0], action_params[1]
@@ -225,21 +281,83 @@ class GameClient:
                     self.game.shoot_player(player_id, *action_params)
 
                 elif action_type == HIT_PLAYER:
-                    self.game.players[player_id].take_damage(action_params[0])
+                    if len(action_params) > 1:
+                        self.game.sync_player_hp(player_id, action_params[1])
+                    else:
+                        self.game.players[player_id].take_damage(action_params[0])
                     print(f"He was shot! {action_params}")
+
+                elif action_type == LEAVE_VIEW:
+                    self.game.hide_player(player_id)
+
+                elif action_type == SNAPSHOT:
+                    self.apply_snapshot(*action_params)
         except KeyError as key_error:
             logger.error(f"Key error processing action queue: {key_error}")
 
+    def apply_snapshot(self, snapshot_id, baseline_id, changed, removed, bullets) -> None:
+        """
+        Rebuild the world state from a delta snapshot and apply it to the game.
+        The delta is relative to an older snapshot (the baseline), which has to still be stored.
+        :param snapshot_id: the id of the snapshot
+        :param baseline_id: the id of the snapshot the delta is relative to, 0 for a full snapshot
+        :param changed: list of [player id, x, y, hp] of players that changed since the baseline
+        :param removed: list of ids of the players that left since the baseline
+        :param bullets: list of [spawn snapshot id, owner id, x, y, dx, dy] of bullets shot since the baseline
+        """
+        if snapshot_id <= self.last_snapshot_id:
+            return  # an older snapshot that arrived late
+        if baseline_id and baseline_id not in self.snapshots:
+            logger.error(f"Missing baseline {baseline_id} for snapshot {snapshot_id}")
+            return
+
+        state = dict(self.snapshots[baseline_id]) if baseline_id else {}
+        for player_id, x, y, hp in changed:
+            state[player_id] = (x, y, hp)
+        for player_id in removed:
+            state.pop(player_id, None)
+
+        for player_id, (x, y, hp) in state.items():
+            # the client's own position is predicted locally
+            if player_id != '0' and player_id in self.game.players:
+                self.target_positions[player_id] = (x, y)
+            self.game.sync_player_hp(player_id, hp)
+        for player_id in list(self.game.players):
+            if player_id not in state and player_id in self.snapshots.get(self.last_snapshot_id, {}):
+                self.game.delete_player(player_id)
+                self.target_positions.pop(player_id, None)
+
+        # bullets from snapshots that were already applied are in the game already
+        for spawn_id, owner_id, x, y, dx, dy in bullets:
+            if spawn_id > self.last_snapshot_id:
+                self.game.add_bullet(owner_id, x, y, dx, dy)
+
+        self.snapshots[snapshot_id] = state
+        self.last_snapshot_id = snapshot_id
+        for old_id in [old_id for old_id in self.snapshots if old_id <= snapshot_id - SNAPSHOT_HISTORY_SIZE]:
+            del self.snapshots[old_id]
+        self.send_snapshot_ack(snapshot_id)
+
     def send_player_state(self):
         """
-        in every update delay, send the player coordinates
+        in every update delay, send the player coordinates if they changed, or every KEEPALIVE_INTERVAL if they
+        didn't. otherwise only the reliable messages waiting to be sent again and the acks are sent
         :return:
         """
+        last_position = None
+        last_sent = 0
         while self.running:
             if self.game.player:
-                x, y = self.game.player.x, self.game.player.y
-                self.send_move_action(x, y)
-                time.sleep(self.update_delay)
+                position = (self.game.player.x, self.game.player.y)
+                if position != last_position or time.time() - last_sent >= KEEPALIVE_INTERVAL:
+                    self.send_move_action(*position)
+                    last_position = position
+                    last_sent = time.time()
+                else:
+                    self.send_datagrams([])
+            else:
+                self.send_datagrams([])
+            time.sleep(self.update_delay)
 
     def get_server_updates(self):
         while self.running:
@@ -296,7 +414,9 @@ def validate_json_game_update(game_update):
     if ACTION_TYPE not in game_update or game_update[ACTION_TYPE] not in [MOVE_PLAYER,
                                                                           SHOOT_PLAYER,
                                                                           PLAYER_INIT,
-                                                                          HIT_PLAYER]:
+                                                                          HIT_PLAYER,
+                                                                          SNAPSHOT,
+                                                                          LEAVE_VIEW]:
         return False
 
     if ACTION_PARAMETERS not in game_update:
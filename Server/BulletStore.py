@@ -0,0 +1,168 @@
+"""
+Author: Yoni Reichert
+Program name: BulletStore.py
+Description: Keeps all of the bullets of a game in contiguous arrays and updates them together every tick
+Date: 17-10-2026
+"""
+
+import numpy as np
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+INITIAL_CAPACITY = 256
+BULLET_RADIUS = 3
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class BulletStore:
+    def __init__(self, capacity=INITIAL_CAPACITY, radius=BULLET_RADIUS):
+        """
+        Initializes an empty bullet store, one array per bullet attribute.
+        :param capacity: The number of bullets to allocate room for, the arrays grow when it runs out
+        :param radius: The radius of every bullet
+        """
+        self.radius = radius
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.dx = np.zeros(capacity, dtype=np.float64)
+        self.dy = np.zeros(capacity, dtype=np.float64)
+        self.lifespan = np.zeros(capacity, dtype=np.int32)
+        self.damage = np.zeros(capacity, dtype=np.int32)
+        self.owner = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def arrays(self):
+        """
+        :return: All of the attribute arrays, in a fixed order
+        """
+        return self.x, self.y, self.dx, self.dy, self.lifespan, self.damage, self.owner
+
+    def grow(self):
+        """
+        Doubles the capacity of every array.
+        """
+        capacity = len(self.x) * 2
+        for name in ('x', 'y', 'dx', 'dy', 'lifespan', 'damage', 'owner'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, dx, dy, lifespan, damage, owner):
+        """
+        Adds a bullet.
+        :param x: Initial x-coordinate of the bullet
+        :param y: Initial y-coordinate of the bullet
+        :param dx: X-component of the bullet's movement
+        :param dy: Y-component of the bullet's movement
+        :param lifespan: How many ticks the bullet exists before disappearing
+        :param damage: Damage the bullet inflicts
+        :param owner: ID of the player who shot the bullet
+        """
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.lifespan[i] = lifespan
+        self.damage[i] = damage
+        self.owner[i] = owner
+        self.count += 1
+
+    def remove(self, remove_mask):
+        """
+        Removes bullets by swapping bullets from the end of the arrays into the freed places,
+        so only as many bullets as were removed are moved.
+        :param remove_mask: Boolean array over the live bullets, True for the bullets to remove
+        """
+        new_count = self.count - int(np.count_nonzero(remove_mask))
+        holes = np.flatnonzero(remove_mask[:new_count])
+        movers = new_count + np.flatnonzero(~remove_mask[new_count:])
+        for array in self.arrays():
+            array[holes] = array[movers]
+        self.count = new_count
+
+    def remove_owner(self, owner):
+        """
+        Removes all of the bullets of a player.
+        :param owner: ID of the player
+        """
+        self.remove(self.owner[:self.count] == owner)
+
+    def update(self, collision_map, map_width, map_height, player_grid, perimeter=False):
+        """
+        Advances every bullet by one tick, and removes the bullets which expired, hit a wall,
+        left the map or hit a player.
+        :param collision_map: The CollisionMap bullets collide with
+        :param map_width: Width of the map
+        :param map_height: Height of the map
+        :param player_grid: The SpatialGrid of the players that can be hit
+        :param perimeter: Only check the edges of a bullet against the walls, like the game's check_collision
+        :return: List of (hit player ID, damage) for every bullet that hit a player, in bullet order
+        """
+        n = self.count
+        if n == 0:
+            return []
+        x, y, dx, dy = self.x[:n], self.y[:n], self.dx[:n], self.dy[:n]
+        lifespan, damage = self.lifespan[:n], self.damage[:n]
+
+        lifespan -= 1
+        expired = lifespan <= 0
+
+        # move every bullet whose next position is free, the others hit a wall
+        free = collision_map.are_free(x + dx, y + dy, self.radius, self.radius, perimeter)
+        moving = free & ~expired
+        x[moving] += dx[moving]
+        y[moving] += dy[moving]
+        hit_wall = ~free & ~expired
+
+        out_of_bounds = ~((0 <= x) & (x <= map_width) & (0 <= y) & (y <= map_height))
+
+        hits = []
+        hit_player = np.zeros(n, dtype=bool)
+        alive = np.flatnonzero(~expired & ~out_of_bounds)
+        if len(player_grid) and len(alive):
+            for bullet, player_id in self.find_hits(alive, player_grid):
+                hit_player[bullet] = True
+                hits.append((player_id, int(damage[bullet])))
+
+        self.remove(expired | hit_wall | out_of_bounds | hit_player)
+        return hits
+
+    def find_hits(self, bullets, player_grid):
+        """
+        Finds the player each bullet is inside of, never the bullet's own shooter.
+        Every bullet is only tested against the players touching the grid cell the bullet is in.
+        :param bullets: Indexes of the bullets to check
+        :param player_grid: The SpatialGrid of the players
+        :return: List of (bullet index, hit player ID) for the bullets that hit someone
+        """
+        player_ids, rects, cell_rows, members = player_grid.build_lookup()
+        x = self.x[bullets]
+        y = self.y[bullets]
+        cells = player_grid.cells_of_points(x, y)
+        rows = np.where(cells >= 0, cell_rows[cells], -1)
+        candidates = np.flatnonzero(rows >= 0)
+        if len(candidates) == 0:
+            return []
+
+        x = x[candidates, None]
+        y = y[candidates, None]
+        candidate_players = members[rows[candidates]]
+        rect = rects[candidate_players]
+        inside = ((candidate_players >= 0)
+                  & (rect[..., 0] <= x) & (x < rect[..., 0] + rect[..., 2])
+                  & (rect[..., 1] <= y) & (y < rect[..., 1] + rect[..., 3]))
+        owner_ids = np.asarray(player_ids)[candidate_players]
+        inside &= owner_ids != self.owner[bullets[candidates], None]
+
+        first = inside.argmax(axis=1)
+        hit = inside[np.arange(len(candidates)), first]
+        return [(int(bullets[candidates[i]]), player_ids[candidate_players[i, first[i]]])
+                for i in np.flatnonzero(hit)]
@@ -0,0 +1,208 @@
+"""
+Author: Yoni Reichert
+Program name: CollisionMap.py
+Description: Holds a collision map as a boolean array with a summed-area table, for constant time rectangle checks,
+             and the index of every free position on it
+Date: 17-10-2026
+"""
+
+import random
+import numpy as np
+from PIL import Image
+
+
+class CollisionMap:
+    def __init__(self, blocked, table=None):
+        """
+        Initializes a collision map from a boolean array.
+        :param blocked: 2D boolean array indexed [y, x], True where the map blocks movement
+        :param table: The already computed summed-area table of blocked, for example one in shared memory
+        """
+        self.blocked = np.ascontiguousarray(blocked, dtype=bool)
+        self.height, self.width = self.blocked.shape
+
+        # summed-area table, table[y, x] is the number of blocked pixels above and left of (x, y)
+        if table is None:
+            table = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+            np.cumsum(np.cumsum(self.blocked, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+        self.table = table
+
+    @classmethod
+    def from_image(cls, image_path):
+        """
+        Loads a collision map from an image, every pixel which isn't fully transparent is blocked.
+        :param image_path: Path to the collision image
+        :return: A CollisionMap of the image
+        """
+        with Image.open(image_path) as img:
+            alpha = np.asarray(img.convert('RGBA'))[:, :, 3]
+        return cls(alpha != 0)
+
+    def is_blocked(self, x, y):
+        """
+        Checks a single pixel, pixels outside of the map are blocked.
+        :param x: X-coordinate of the pixel
+        :param y: Y-coordinate of the pixel
+        :return: True if the pixel is blocked
+        """
+        x = int(x)
+        y = int(y)
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+        return bool(self.blocked[y, x])
+
+    def blocked_count(self, x, y, width, height):
+        """
+        Counts the blocked pixels inside a rectangle that is entirely within the map, in constant time.
+        :param x: X-coordinate of the top-left corner
+        :param y: Y-coordinate of the top-left corner
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :return: The number of blocked pixels
+        """
+        table = self.table
+        return int(table[y + height, x + width] - table[y, x + width] - table[y + height, x] + table[y, x])
+
+    def contains(self, x, y, width, height):
+        """
+        :return: True if the rectangle is entirely within the map
+        """
+        return 0 <= x and 0 <= y and x + width <= self.width and y + height <= self.height
+
+    def is_free(self, x, y, width, height):
+        """
+        Checks that no pixel of a rectangle is blocked.
+        :param x: X-coordinate of the top-left corner
+        :param y: Y-coordinate of the top-left corner
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :return: True if the whole rectangle is free, False if any pixel is blocked or outside of the map
+        """
+        x = int(x)
+        y = int(y)
+        if not self.contains(x, y, width, height):
+            return False
+        return self.blocked_count(x, y, width, height) == 0
+
+    def is_perimeter_free(self, x, y, width, height):
+        """
+        Checks only the edges of a rectangle, like the original pixel by pixel check did.
+        An obstacle entirely inside of the rectangle isn't detected.
+        :param x: X-coordinate of the top-left corner
+        :param y: Y-coordinate of the top-left corner
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :return: True if all of the rectangle's edges are free
+        """
+        x = int(x)
+        y = int(y)
+        if not self.contains(x, y, width, height):
+            return False
+        return (self.blocked_count(x, y, width, 1) == 0  # top
+                and self.blocked_count(x, y + height - 1, width, 1) == 0  # bottom
+                and self.blocked_count(x, y, 1, height) == 0  # left
+                and self.blocked_count(x + width - 1, y, 1, height) == 0)  # right
+
+    def are_free(self, xs, ys, width, height, perimeter=False):
+        """
+        Checks many rectangles of the same size in one call.
+        :param xs: Array of the X-coordinates of the top-left corners
+        :param ys: Array of the Y-coordinates of the top-left corners
+        :param width: Width of the rectangles
+        :param height: Height of the rectangles
+        :param perimeter: Only check the edges of the rectangles, like is_perimeter_free
+        :return: Boolean array, True where the rectangle (or its edges) is free
+        """
+        xs = np.asarray(xs).astype(np.int64)
+        ys = np.asarray(ys).astype(np.int64)
+        inside = (xs >= 0) & (ys >= 0) & (xs + width <= self.width) & (ys + height <= self.height)
+
+        # clip the rectangles that are outside, their result is overridden by the inside mask anyway
+        x0 = np.clip(xs, 0, self.width - width)
+        y0 = np.clip(ys, 0, self.height - height)
+        if perimeter:
+            free = ((self.blocked_counts(x0, y0, width, 1) == 0)  # top
+                    & (self.blocked_counts(x0, y0 + height - 1, width, 1) == 0)  # bottom
+                    & (self.blocked_counts(x0, y0, 1, height) == 0)  # left
+                    & (self.blocked_counts(x0 + width - 1, y0, 1, height) == 0))  # right
+        else:
+            free = self.blocked_counts(x0, y0, width, height) == 0
+        return inside & free
+
+    def blocked_counts(self, xs, ys, width, height):
+        """
+        Counts the blocked pixels inside many rectangles that are entirely within the map.
+        :param xs: Array of the X-coordinates of the top-left corners
+        :param ys: Array of the Y-coordinates of the top-left corners
+        :param width: Width of the rectangles
+        :param height: Height of the rectangles
+        :return: Array of the number of blocked pixels in every rectangle
+        """
+        table = self.table
+        x1 = xs + width
+        y1 = ys + height
+        return table[y1, x1] - table[ys, x1] - table[y1, xs] + table[ys, xs]
+
+    def free_positions(self, width, height):
+        """
+        Finds every top-left position where a rectangle of the given size is entirely free.
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :return: Array of the free positions as y * map width + x
+        """
+        table = self.table
+        counts = (table[height:, width:] - table[:-height, width:]
+                  - table[height:, :-width] + table[:-height, :-width])
+        ys, xs = np.nonzero(counts == 0)
+        return (ys * self.width + xs).astype(np.int32)
+
+
+class SpawnIndex:
+    def __init__(self, collision_map, width, height, positions=None):
+        """
+        Initializes the index of every free top-left position for entities of a given size.
+        :param collision_map: The CollisionMap the entities collide with
+        :param width: Width of the entities
+        :param height: Height of the entities
+        :param positions: The already computed free positions, for example ones in shared memory
+        """
+        self.map_width = collision_map.width
+        if positions is None:
+            positions = collision_map.free_positions(width, height)
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def position_at(self, index):
+        """
+        :param index: Index into the free positions
+        :return: Tuple (x, y) of the position
+        """
+        y, x = divmod(int(self.positions[index]), self.map_width)
+        return x, y
+
+    def sample(self, avoid=(), min_distance=0, max_attempts=100):
+        """
+        Picks a uniformly random free position, optionally at least min_distance away from the given points.
+        If no such position is found within max_attempts, the farthest position tried is returned.
+        :param avoid: List of (x, y) points to keep away from
+        :param min_distance: The minimum distance from every point in avoid
+        :param max_attempts: How many positions to try before giving up on the distance
+        :return: Tuple (x, y), or None if there are no free positions at all
+        """
+        if len(self.positions) == 0:
+            return None
+        if not avoid or min_distance <= 0:
+            return self.position_at(random.randrange(len(self.positions)))
+
+        points = np.asarray(avoid, dtype=np.float64)
+        best_position, best_distance = None, -1.0
+        for _ in range(max_attempts):
+            x, y = self.position_at(random.randrange(len(self.positions)))
+            distance = float(np.min(np.hypot(points[:, 0] - x, points[:, 1] - y)))
+            if distance >= min_distance:
+                return x, y
+            if distance > best_distance:
+                best_position, best_distance = (x, y), distance
+        return best_position
@@ -1,31 +1,33 @@
 """
 Author: Yoni Reichert
 Program name: client.py
-Description: Runs the ninja game logic without displaying it on screen according to server actions
+Description: Runs the ninja game logic without displaying it on screen according to server actions.
+             Headless, it doesn't use pygame and loads the map data only when it is first needed
 Date: 17-05-2024
 """
 
-import pygame
 from PIL import Image
-import json
-import random
 import logging
-
-# Initialize logger
+import sys
+import os
+from CollisionMap import CollisionMap, SpawnIndex
+from BulletStore import BulletStore, BULLET_RADIUS
+from SpatialGrid import SpatialGrid
+
+# the character registry is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CharacterRegistry import CharacterRegistry
+from simulation_clock import SimulationClock, ms_to_ticks, scale_ticks, SIMULATION_TICK_RATE
+
+# Initialize logger, the messages go to the log of the process which imports the game logic
 logger = logging.getLogger("GameLogic")
 logger.setLevel(logging.DEBUG)
-file_handler = logging.FileHandler('GameLogic.log')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s - Line: %(lineno)d',
-                                            datefmt='%Y-%m-%d %H:%M:%S'))
-logger.addHandler(file_handler)
 
 # Configure PIL logger to not propagate messages to the root logger
 pil_logger = logging.getLogger('PIL')
 pil_logger.setLevel(logging.WARNING)
 pil_logger.propagate = False
 
-pygame.display.set_caption("Ninja Game")
-
 # ------------------------------------------------ CONSTANTS ----------------------------------------------------------
 
 # Assets paths
@@ -34,20 +36,109 @@ PLAYER_COLLISION_MAP_PATH = r'../Assets/Map/player_collision.png'
 BULLET_COLLISION_MAP_PATH = r'../Assets/Map/bullet_collision.png'
 CHARACTER_STATS_FILE_PATH = "../Characters.json"
 
-MAP_WIDTH = 0
-MAP_HEIGHT = 0
+# Character stats, parsed once and reloaded when the file changes
+CHARACTERS = CharacterRegistry(CHARACTER_STATS_FILE_PATH)
 
-# Load images
-PLAYER_COLLISION_MAP = Image.open(PLAYER_COLLISION_MAP_PATH)
-BULLET_COLLISION_MAP = Image.open(BULLET_COLLISION_MAP_PATH)
+# Only check the edges of a rectangle (an obstacle entirely inside of it isn't a collision), like the client does,
+# so the server agrees with the client's prediction at the walls. False checks the whole area instead
+PERIMETER_COLLISION = True
 
 # player qualities
 CHARACTER_WIDTH = 32
 CHARACTER_HEIGHT = 32
 
+# how far (in pixels) a new player should spawn from the existing ones, when there's room
+SPAWN_MIN_DISTANCE = CHARACTER_WIDTH * 4
+
+# (width, height) -> SpawnIndex of the player collision map, shared by every game
+SPAWN_INDEXES = {}
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 
+class MapData:
+    def __init__(self, map_image_path, player_collision_map_path, bullet_collision_map_path):
+        """
+        Holds the map's size and collision maps, each of them is loaded only when it is first used.
+        :param map_image_path: Path to the map image, only its size is read
+        :param player_collision_map_path: Path to the collision image players collide with
+        :param bullet_collision_map_path: Path to the collision image bullets collide with
+        """
+        self.map_image_path = map_image_path
+        self.player_collision_map_path = player_collision_map_path
+        self.bullet_collision_map_path = bullet_collision_map_path
+        self._size = None
+        self._player_collision_map = None
+        self._bullet_collision_map = None
+
+    @property
+    def size(self):
+        """
+        :return: Tuple (width, height) of the map
+        """
+        if self._size is None:
+            self._size = get_image_dimensions(self.map_image_path)
+        return self._size
+
+    @property
+    def player_collision_map(self):
+        """
+        :return: The CollisionMap players collide with
+        """
+        if self._player_collision_map is None:
+            self._player_collision_map = CollisionMap.from_image(self.player_collision_map_path)
+        return self._player_collision_map
+
+    @property
+    def bullet_collision_map(self):
+        """
+        :return: The CollisionMap bullets collide with
+        """
+        if self._bullet_collision_map is None:
+            self._bullet_collision_map = CollisionMap.from_image(self.bullet_collision_map_path)
+        return self._bullet_collision_map
+
+    def install(self, size, player_collision_map, bullet_collision_map):
+        """
+        Uses map data that was already loaded elsewhere instead of loading it from the images.
+        :param size: Tuple (width, height) of the map
+        :param player_collision_map: The CollisionMap players collide with
+        :param bullet_collision_map: The CollisionMap bullets collide with
+        """
+        self._size = size
+        self._player_collision_map = player_collision_map
+        self._bullet_collision_map = bullet_collision_map
+
+
+MAP_DATA = MapData(MAP_IMAGE_PATH, PLAYER_COLLISION_MAP_PATH, BULLET_COLLISION_MAP_PATH)
+
+
+class Rect:
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x, y, width, height):
+        """
+        A minimal rectangle, the server only needs its position and point checks.
+        :param x: X-coordinate of the top-left corner
+        :param y: Y-coordinate of the top-left corner
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        """
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def collidepoint(self, x, y):
+        """
+        Checks if a point is inside the rectangle, the right and bottom edges are outside like in pygame.
+        :param x: X-coordinate of the point
+        :param y: Y-coordinate of the point
+        :return: True if the point is inside the rectangle
+        """
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+
 class Character:
     def __init__(self, name, hp, speed, bullet_speed, bullet_damage, bullet_lifespan, shooting_cooldown):
         """
@@ -57,8 +148,8 @@ class Character:
         :param speed: Movement speed of the character
         :param bullet_speed: Speed of the bullets fired by this character
         :param bullet_damage: Damage dealt by each bullet
-        :param bullet_lifespan: How long the bullet exists before disappearing
-        :param shooting_cooldown: Cooldown time between shots
+        :param bullet_lifespan: How long the bullet exists before disappearing, in ticks at the simulation tick rate
+        :param shooting_cooldown: Cooldown time between shots, in milliseconds at the simulation tick rate
         """
         self.name = name
         self.hp = hp
@@ -70,7 +161,7 @@ class Character:
 
 
 class Player:
-    def __init__(self, character, x, y, width, height):
+    def __init__(self, character, x, y, width, height, tick_rate=SIMULATION_TICK_RATE):
         """
         Initializes a new player with specific position and dimensions.
         :param character: A Character object representing the player's character
@@ -78,6 +169,7 @@ class Player:
         :param y: Initial y-coordinate of the player
         :param width: Width of the player
         :param height: Height of the player
+        :param tick_rate: The ticks per second of the player's game, the character stats are tuned for 60
         """
         self.x = x
         self.y = y
@@ -85,9 +177,8 @@ class Player:
         self.height = height
 
         # default qualities
-        self.last_shot_time = 0
-        self.bullets = []  # Store bullets for each player
-        self.rect = pygame.Rect(x, y, width, height)
+        self.last_shot_tick = None  # the game tick of the player's last shot, None until it shoots
+        self.rect = Rect(x, y, width, height)
         self.direction = 'down'  # Initial direction
         self.anim_frame = 0
         self.anim_speed = 10  # Number of frames to wait before switching animation frames
@@ -100,6 +191,11 @@ class Player:
         self.bullet_speed = character.bullet_speed
         self.bullet_damage = character.bullet_damage
         self.shooting_cooldown = character.shooting_cooldown
+        self.bullet_lifespan = character.bullet_lifespan
+        self.cooldown_ticks = ms_to_ticks(character.shooting_cooldown, tick_rate)
+        # bullets move and expire per tick, so at another tick rate they do so at the same speed in seconds
+        self.bullet_lifespan_ticks = scale_ticks(self.bullet_lifespan, tick_rate)
+        self.bullet_step_scale = SIMULATION_TICK_RATE / tick_rate
 
     def set_cords(self, x, y):
         """
@@ -150,16 +246,17 @@ class Player:
         self.rect.x = self.x
         self.rect.y = self.y
 
-    def shoot(self, dx, dy):
+    def shoot(self, dx, dy, tick):
         """
         Handles the shooting mechanics for a player, creating a bullet if the cooldown period has passed.
         :param dx: X-component of the bullet's direction
         :param dy: Y-component of the bullet's direction
+        :param tick: The current game tick
+        :return: The new bullet, or None if the player is still cooling down
         """
 
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_shot_time > self.shooting_cooldown:
-            self.last_shot_time = current_time
+        if self.last_shot_tick is None or tick - self.last_shot_tick >= self.cooldown_ticks:
+            self.last_shot_tick = tick
 
             # Adjust the mouse coordinates based on the camera's offset
             # Since the camera's x and y represent the top-left corner of the view,
@@ -169,17 +266,18 @@ class Player:
             center_x = self.x + self.width // 2
             center_y = self.y + self.height // 2
 
-            # Create and add the new bullet to the bullets list
-            self.bullets.append(Bullet(
+            # Create the new bullet, the game keeps it in its bullet store
+            return Bullet(
                 center_x,
                 center_y,
-                dx,
-                dy,
-                3,
+                dx * self.bullet_step_scale,
+                dy * self.bullet_step_scale,
+                BULLET_RADIUS,
                 self.bullet_damage,
                 self,
-                self.shooting_cooldown)
+                self.bullet_lifespan_ticks
             )
+        return None
 
     def take_damage(self, damage):
         """
@@ -217,7 +315,7 @@ class Bullet:
         self.anim_speed = 10  # You can adjust this to make the animation faster or slower
         self.anim_count = 0
 
-        self.rect = pygame.Rect(x - radius, y - radius, radius * 2, radius * 2)
+        self.rect = Rect(x - radius, y - radius, radius * 2, radius * 2)
 
     def move(self):
         """
@@ -241,16 +339,32 @@ class Bullet:
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, tick_rate=SIMULATION_TICK_RATE):
         """
         Initializes the game environment, setting up the map dimensions and camera.
+        :param tick_rate: How many times a second the game is stepped, cooldowns and bullets are converted to it
         """
-        global MAP_WIDTH, MAP_HEIGHT
-        MAP_WIDTH, MAP_HEIGHT = get_image_dimensions(MAP_IMAGE_PATH)
-        # screen = pygame.display.set_mode((screen_width, screen_height))
-        # self.screen = screen
-        self.map_width, self.map_height = get_image_dimensions(MAP_IMAGE_PATH)
+        self.map_width, self.map_height = MAP_DATA.size
+        self.tick_rate = tick_rate
         self.players: dict[str, Player] = {}
+        self.bullets = BulletStore()
+        self.player_grid = SpatialGrid(self.map_width, self.map_height, CHARACTER_WIDTH)
+        self.clock = SimulationClock()  # only moves when the game steps, cooldowns are counted in its ticks
+        get_spawn_index(CHARACTER_WIDTH, CHARACTER_HEIGHT)
+
+    def step(self, ticks=1):
+        """
+        Advances the game by ticks, as fast as they can be computed. Every tick moves the clock and the bullets,
+        nothing depends on the wall clock, so stepping the same game the same way always gives the same result.
+        :param ticks: How many ticks to advance
+        :return: List of the bullet hits of all of the ticks, in order
+        """
+
+        bullet_hits = []
+        for _ in range(ticks):
+            self.clock.advance()
+            bullet_hits.extend(self.update_bullets())
+        return bullet_hits
 
     def create_player(self, player_id, character_name):
         """
@@ -263,37 +377,48 @@ class Game:
         x, y = self.find_random_free_position(CHARACTER_WIDTH, CHARACTER_HEIGHT)
         if not x:
             logger.error("Didn't found any x,y for the player to be created")
-        character = load_character_from_json(CHARACTER_STATS_FILE_PATH, character_name)
+        self.add_player(player_id, character_name, x, y)
+        # logger.info(f"Created new player ({character_name}) in x = {x}, y = {y}")
+        # return 20, 30
+        return x, y
+
+    def add_player(self, player_id, character_name, x, y):
+        """
+        Adds a player at a given position, for example the position a replayed player was created in.
+        :param player_id: Identifier for the new player
+        :param character_name: Name of the character to base the player on
+        :param x: The x-coordinate of the player
+        :param y: The y-coordinate of the player
+        """
+
+        character = load_character(character_name)
         player = Player(
             character,
             x,
             y,
             CHARACTER_WIDTH,
-            CHARACTER_HEIGHT
+            CHARACTER_HEIGHT,
+            self.tick_rate
         )
         self.players[player_id] = player
-        # logger.info(f"Created new player ({character_name}) in x = {x}, y = {y}")
-        # return 20, 30
-        return x, y
+        self.player_grid.update(player_id, x, y, CHARACTER_WIDTH, CHARACTER_HEIGHT)
 
-    @staticmethod
-    def find_random_free_position(character_width, character_height):
+    def find_random_free_position(self, character_width, character_height, min_distance=SPAWN_MIN_DISTANCE):
         """
         Find a random position within the map where an object of the given size can be placed without collision.
+        The position is sampled from the precomputed index of free positions, away from the existing players if possible.
 
         :param character_width: The width of the object to place
         :param character_height: The height of the object to place
+        :param min_distance: The distance to keep from the existing players, 0 to place anywhere
         :return: A tuple (x, y) representing the top-left corner of the free area found
         """
-        max_attempts = 100  # Limit the number of attempts to find a free spot
-        for _ in range(max_attempts):
-            x = random.randint(0, MAP_WIDTH - character_width)
-            y = random.randint(0, MAP_HEIGHT - character_height)
+        avoid = [(player.x, player.y) for player in self.players.values()]
+        position = get_spawn_index(character_width, character_height).sample(avoid, min_distance)
+        if position:
+            return position
 
-            if check_collision(x, y, character_width, character_height, True):
-                return x, y  # Found a free spot
-
-        # If no free spot is found after max_attempts
+        # If the map has no free spot at all
         return 100, 50
 
     def delete_player(self, player_id):
@@ -304,6 +429,8 @@ class Game:
 
         if player_id in self.players:
             del self.players[player_id]
+            self.bullets.remove_owner(player_id)
+            self.player_grid.remove(player_id)
 
     def set_cords(self, player_id, x, y):
         """
@@ -314,7 +441,9 @@ class Game:
         :param y: New y-coordinate
         """
         if player_id in self.players:
-            self.players[player_id].set_cords(x, y)
+            player = self.players[player_id]
+            player.set_cords(x, y)
+            self.player_grid.update(player_id, x, y, player.width, player.height)
 
     def shoot_player(self, player_id, dx, dy):
         """
@@ -322,29 +451,27 @@ class Game:
         :param player_id: Identifier of the shooting player
         :param dx: X-component of the bullet's direction
         :param dy: Y-component of the bullet's direction
+        :return: The new bullet, or None if no bullet was shot
         """
 
         if player_id in self.players:
-            self.players[player_id].shoot(dx, dy)
+            bullet = self.players[player_id].shoot(dx, dy, self.clock.tick)
+            if bullet:
+                self.bullets.add(bullet.x, bullet.y, bullet.dx, bullet.dy, bullet.lifespan, bullet.damage, player_id)
+            return bullet
+        return None
 
     def update_bullets(self):
         """
-        Updates the positions of all bullets, checks for hits, and manages out-of-bounds bullets.
+        Updates the positions of all bullets, checks for hits, and removes the bullets that expired,
+        hit a wall, left the map or hit a player. All of the bullets are updated together by the bullet store.
         :return: bullet_hits: List of bullet hits including the impacted player IDs and the damage dealt
         """
 
-        bullet_hits = []
-        for player_id, player in self.players.items():
-            for bullet in player.bullets[:]:
-                bullet.move()  # Assuming 'move' method updates the bullet's position
-
-                # Check if the bullet is out of bounds or hits another player
-                if not self.within_bounds(bullet):
-                    player.bullets.remove(bullet)
-                hit_player_id = self.check_bullet_hit(player_id, bullet)
-                if hit_player_id:
-                    player.bullets.remove(bullet)
-                    bullet_hits.append((hit_player_id, bullet.damage))
+        bullet_hits = self.bullets.update(MAP_DATA.bullet_collision_map, self.map_width, self.map_height,
+                                          self.player_grid, PERIMETER_COLLISION)
+        for hit_player_id, damage in bullet_hits:
+            self.players[hit_player_id].take_damage(damage)
 
         return bullet_hits
 
@@ -360,15 +487,15 @@ class Game:
 
     def check_bullet_hit(self, shooter_id, bullet):
         """
-        Checks if a bullet has hit any player except the shooter.
+        Checks if a bullet has hit any player except the shooter, only testing the players in the bullet's grid cell.
         :param shooter_id: ID of the player who shot bullet
         :param bullet: The bullet to check for hits
         :return: ID of the player hit by the bullet, if any
         """
 
-        for player_id, player in self.players.items():
-            if player_id != shooter_id and player.rect.collidepoint(bullet.x, bullet.y):
-                player.take_damage(bullet.damage)
+        for player_id in self.player_grid.query_point(bullet.x, bullet.y):
+            if player_id != shooter_id:
+                self.players[player_id].take_damage(bullet.damage)
                 return player_id  # Bullet hit a player
         return None  # No hit detected
 
@@ -382,30 +509,29 @@ class Game:
         return self.players[player_id]
 
 
-def load_character_from_json(file_path, name):
+def load_character(name):
     """
-    Loads character data from a JSON file and creates a Character object.
-    :param file_path: Path to the JSON file containing character data
+    Creates a Character object from the character registry.
     :param name: Name of the character to load
-    :return: A Character object with data loaded from the file
+    :return: A Character object with the stats of the character
     """
 
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-
-    for char_data in data['characters']:
-        if char_data['name'] == name:
-            return Character(
-                name=char_data['name'],
-                hp=char_data['hp'],
-                speed=char_data['speed'],
-                bullet_speed=char_data['bullet_speed'],
-                bullet_damage=char_data['bullet_damage'],
-                bullet_lifespan=char_data['bullet_lifespan'],
-                shooting_cooldown=char_data['shooting_cooldown']
-            )
+    return Character(**CHARACTERS.get(name)._asdict())
+
 
-    raise ValueError(f"No character found with the name {name}")
+def get_spawn_index(width, height):
+    """
+    Gets the index of the free positions for objects of a given size, building it the first time it is needed.
+    :param width: Width of the objects
+    :param height: Height of the objects
+    :return: The SpawnIndex
+    """
+
+    key = (width, height)
+    if key not in SPAWN_INDEXES:
+        SPAWN_INDEXES[key] = SpawnIndex(MAP_DATA.player_collision_map, width, height)
+        logger.info(f"Indexed {len(SPAWN_INDEXES[key])} free positions for {width}x{height} objects")
+    return SPAWN_INDEXES[key]
 
 
 def get_image_dimensions(image_path):
@@ -429,24 +555,28 @@ def check_collision(x, y, width, height, is_player):
     :param width: Width of the area to check
     :param height: Height of the area to check
     :param is_player: True if checking for player collisions, False for bullet collisions
-    :return: True if a collision is detected, False otherwise
+    :return: True if the area is free, False if a collision is detected
     """
 
-    try:
-        # Loop through the edges of the rectangle
-        for i in range(x, x + width):
-            for j in [y, y + height - 1]:  # Check top and bottom borders
-                if is_colliding_at(i, j, is_player):
-                    return False
+    collision_map = MAP_DATA.player_collision_map if is_player else MAP_DATA.bullet_collision_map
+    if PERIMETER_COLLISION:
+        return collision_map.is_perimeter_free(x, y, width, height)
+    return collision_map.is_free(x, y, width, height)
+
 
-        for i in [x, x + width - 1]:
-            for j in range(y, y + height):  # Check left and right borders
-                if is_colliding_at(i, j, is_player):
-                    return False
+def check_collisions(xs, ys, width, height, is_player):
+    """
+    Checks many areas of the same size in one call.
+    :param xs: X-coordinates of the top-left corners to check
+    :param ys: Y-coordinates of the top-left corners to check
+    :param width: Width of the areas to check
+    :param height: Height of the areas to check
+    :param is_player: True if checking for player collisions, False for bullet collisions
+    :return: Boolean array, True where the area is free
+    """
 
-        return True
-    except IndexError:
-        return False
+    collision_map = MAP_DATA.player_collision_map if is_player else MAP_DATA.bullet_collision_map
+    return collision_map.are_free(xs, ys, width, height, PERIMETER_COLLISION)
 
 
 def is_colliding_at(x, y, is_player):
@@ -458,14 +588,5 @@ def is_colliding_at(x, y, is_player):
     :return: True if there is a collision at the specified point, otherwise False
     """
 
-    try:
-        int_x = int(x)
-        int_y = int(y)
-        if is_player:
-            pixel_color = PLAYER_COLLISION_MAP.getpixel((int_x, int_y))
-        else:
-            pixel_color = BULLET_COLLISION_MAP.getpixel((int_x, int_y))
-        alpha = pixel_color[3]
-        return not alpha == 0
-    except IndexError:
-        return True
+    collision_map = MAP_DATA.player_collision_map if is_player else MAP_DATA.bullet_collision_map
+    return collision_map.is_blocked(x, y)
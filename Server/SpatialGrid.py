@@ -0,0 +1,144 @@
+"""
+Author: Yoni Reichert
+Program name: SpatialGrid.py
+Description: A uniform grid over the map which knows which player rectangles touch every cell
+Date: 17-10-2026
+"""
+
+import numpy as np
+
+
+class SpatialGrid:
+    def __init__(self, map_width, map_height, cell_size):
+        """
+        Initializes an empty grid covering the map.
+        :param map_width: Width of the map
+        :param map_height: Height of the map
+        :param cell_size: Width and height of every cell, the size of a player works well
+        """
+        self.cell_size = cell_size
+        self.columns = max(1, -(-map_width // cell_size))
+        self.rows = max(1, -(-map_height // cell_size))
+        self.cells = {}  # cell index -> list of the IDs of the entities touching it
+        self.entities = {}  # entity ID -> (x, y, width, height, cell indexes)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def cells_of_rect(self, x, y, width, height):
+        """
+        Finds the cells a rectangle touches, rectangles partly outside of the map are clamped to it.
+        :return: Tuple of cell indexes
+        """
+        first_column = min(max(int(x) // self.cell_size, 0), self.columns - 1)
+        last_column = min(max(int(x + width - 1) // self.cell_size, 0), self.columns - 1)
+        first_row = min(max(int(y) // self.cell_size, 0), self.rows - 1)
+        last_row = min(max(int(y + height - 1) // self.cell_size, 0), self.rows - 1)
+        return tuple(row * self.columns + column
+                     for row in range(first_row, last_row + 1)
+                     for column in range(first_column, last_column + 1))
+
+    def update(self, entity_id, x, y, width, height):
+        """
+        Adds an entity or moves it. Only the cells the entity left or entered are changed.
+        :param entity_id: ID of the entity
+        :param x: X-coordinate of the entity's top-left corner
+        :param y: Y-coordinate of the entity's top-left corner
+        :param width: Width of the entity
+        :param height: Height of the entity
+        """
+        new_cells = self.cells_of_rect(x, y, width, height)
+        old = self.entities.get(entity_id)
+        old_cells = old[4] if old else ()
+        if new_cells != old_cells:
+            for cell in old_cells:
+                if cell not in new_cells:
+                    members = self.cells[cell]
+                    members.remove(entity_id)
+                    if not members:
+                        del self.cells[cell]
+            for cell in new_cells:
+                if cell not in old_cells:
+                    self.cells.setdefault(cell, []).append(entity_id)
+        self.entities[entity_id] = (x, y, width, height, new_cells)
+
+    def remove(self, entity_id):
+        """
+        Removes an entity from the grid.
+        :param entity_id: ID of the entity
+        """
+        old = self.entities.pop(entity_id, None)
+        if old:
+            for cell in old[4]:
+                members = self.cells[cell]
+                members.remove(entity_id)
+                if not members:
+                    del self.cells[cell]
+
+    def query_point(self, x, y):
+        """
+        Finds the entities whose rectangle contains a point.
+        :param x: X-coordinate of the point
+        :param y: Y-coordinate of the point
+        :return: List of entity IDs
+        """
+        column = int(x) // self.cell_size
+        row = int(y) // self.cell_size
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return []
+        found = []
+        for entity_id in self.cells.get(row * self.columns + column, ()):
+            ex, ey, width, height, _ = self.entities[entity_id]
+            if ex <= x < ex + width and ey <= y < ey + height:
+                found.append(entity_id)
+        return found
+
+    def query_rect(self, x, y, width, height):
+        """
+        Finds the entities whose rectangle overlaps a rectangle.
+        :param x: X-coordinate of the rectangle's top-left corner
+        :param y: Y-coordinate of the rectangle's top-left corner
+        :param width: Width of the rectangle
+        :param height: Height of the rectangle
+        :return: Set of entity IDs
+        """
+        found = set()
+        for cell in self.cells_of_rect(x, y, width, height):
+            for entity_id in self.cells.get(cell, ()):
+                if entity_id not in found:
+                    ex, ey, entity_width, entity_height, _ = self.entities[entity_id]
+                    if ex < x + width and x < ex + entity_width and ey < y + height and y < ey + entity_height:
+                        found.add(entity_id)
+        return found
+
+    def cells_of_points(self, xs, ys):
+        """
+        Finds the cell of many points at once.
+        :param xs: Array of X-coordinates
+        :param ys: Array of Y-coordinates
+        :return: Array of cell indexes, -1 for points outside of the grid
+        """
+        columns = np.floor_divide(xs, self.cell_size).astype(np.int64)
+        rows = np.floor_divide(ys, self.cell_size).astype(np.int64)
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        return np.where(inside, rows * self.columns + columns, -1)
+
+    def build_lookup(self):
+        """
+        Packs the occupied cells into arrays, so many points can be matched against them in one pass.
+        :return: entity_ids: List of the entity IDs, the other arrays index into it
+        :return rects: Array of shape (entities, 4) holding every entity's x, y, width, height
+        :return cell_rows: Array over all cells, the row of the cell in members or -1 if the cell is empty
+        :return members: Array of shape (occupied cells, most entities in one cell), entity indexes padded with -1
+        """
+        entity_ids = list(self.entities)
+        index_of = {entity_id: index for index, entity_id in enumerate(entity_ids)}
+        rects = np.array([entity[:4] for entity in self.entities.values()], dtype=np.float64).reshape(-1, 4)
+
+        cell_rows = np.full(self.columns * self.rows, -1, dtype=np.int64)
+        width = max((len(members) for members in self.cells.values()), default=0)
+        members_table = np.full((len(self.cells), width), -1, dtype=np.int64)
+        for row, (cell, members) in enumerate(self.cells.items()):
+            cell_rows[cell] = row
+            members_table[row, :len(members)] = [index_of[entity_id] for entity_id in members]
+        return entity_ids, rects, cell_rows, members_table
@@ -0,0 +1,93 @@
+"""
+Author: Yoni Reichert
+Program name: action_queues.py
+Description: Keeps a small queue of actions for every client of a room, so a flooding client can't starve the others
+Date: 17-10-2026
+"""
+
+from collections import deque
+from threading import Lock
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+MAX_QUEUED_ACTIONS = 16  # per client, actions arriving when the queue is full are dropped, except player_init
+
+MOVE_PLAYER = 'move'
+SHOOT_PLAYER = 'shoot'
+PLAYER_INIT = 'player_init'
+ACTION_TYPE = 'type'
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class ActionQueues:
+    def __init__(self, max_actions=MAX_QUEUED_ACTIONS):
+        """
+        Initialize the action queues of a room's clients.
+        :param max_actions: the most actions queued for a single client
+        """
+        self.max_actions = max_actions
+        self.queues = {}  # client id -> deque of the client's actions, in the order they arrived
+        self.last_shot_ticks = {}  # client id -> the game tick the client's last accepted shot arrived in
+        self.dropped = 0
+        self.lock = Lock()
+
+    def put(self, client_id, action, cooldown_ticks=None, tick=0):
+        """
+        Queue an action of a client.
+        A move right after another move replaces it, since only the newest position matters,
+        and a shot that arrives before the shooting cooldown passed is dropped right away.
+        A player_init is never dropped, it arrives on the reliable channel which already acknowledged it.
+        :param client_id: the client who sent the action
+        :param action: the decoded action
+        :param cooldown_ticks: the shooting cooldown of the client's character in ticks, None if it has no character
+        :param tick: the room's current game tick
+        :return: True if the action was queued
+        """
+        action_type = action[ACTION_TYPE]
+        with self.lock:
+            queue = self.queues.get(client_id)
+            if queue is None:
+                queue = self.queues[client_id] = deque()
+
+            if action_type == MOVE_PLAYER and queue and queue[-1][ACTION_TYPE] == MOVE_PLAYER:
+                queue[-1] = action
+                return True
+
+            if action_type == SHOOT_PLAYER and cooldown_ticks is not None:
+                last_shot_tick = self.last_shot_ticks.get(client_id)
+                if last_shot_tick is not None and tick - last_shot_tick < cooldown_ticks:
+                    self.dropped += 1
+                    return False
+
+            if len(queue) >= self.max_actions and action_type != PLAYER_INIT:
+                self.dropped += 1
+                return False
+            queue.append(action)
+            if action_type == SHOOT_PLAYER and cooldown_ticks is not None:
+                # only a shot that was queued starts the cooldown, a dropped one doesn't hold back the next
+                self.last_shot_ticks[client_id] = tick
+            return True
+
+    def drain(self):
+        """
+        Take all of the queued actions, one action of every client at a time, so each client gets its turn.
+        :return: list of (client id, action)
+        """
+        actions = []
+        with self.lock:
+            queues = [(client_id, queue) for client_id, queue in self.queues.items() if queue]
+            while queues:
+                for client_id, queue in queues:
+                    actions.append((client_id, queue.popleft()))
+                queues = [(client_id, queue) for client_id, queue in queues if queue]
+        return actions
+
+    def forget_client(self, client_id):
+        """
+        Drop the queue of a client that left.
+        :param client_id: the client to forget
+        """
+        with self.lock:
+            self.queues.pop(client_id, None)
+            self.last_shot_ticks.pop(client_id, None)
@@ -0,0 +1,363 @@
+"""
+Author: Yoni Reichert
+Program name: benchmark.py
+Description: Microbenchmarks of the game logic's hot functions over grids of players, bullets and characters.
+             The results are written as json, and can be compared against a stored baseline, failing (exit code 1)
+             when a benchmark got slower than the threshold allows. Run it from the Server folder, for example:
+             python benchmark.py --save-baseline baseline.json, and after a change: python benchmark.py --baseline
+             baseline.json
+Date: 17-10-2026
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+import numpy as np
+import GameLogic
+from GameLogic import Bullet, CHARACTER_WIDTH, CHARACTER_HEIGHT, BULLET_RADIUS
+
+# the game logic's messages go to the log, so they don't get mixed with the results
+logging.basicConfig(
+    filename='benchmark.log',
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s - Line: %(lineno)d',
+    datefmt='%d %H:%M:%S'
+)
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+SEED = 1234  # every benchmark starts from the same random state, so runs are comparable
+
+PLAYER_COUNTS = (2, 10, 50, 100, 500)
+BULLET_COUNTS = (0, 100, 1000, 5000, 20000)
+QUICK_PLAYER_COUNTS = (2, 50)
+QUICK_BULLET_COUNTS = (0, 1000)
+
+REPEAT = 5  # every benchmark is timed this many times, the median is reported
+TARGET_REPEAT_TIME = 0.05  # seconds, the number of calls of a repeat is chosen to take about this long
+MAX_CALLS = 100000
+POINT_COUNT = 4096  # random points the collision checks go over
+BULLET_SPEED = 5
+BULLET_LIFESPAN = 10 ** 6  # the bullets shouldn't expire while they are benchmarked
+
+DEFAULT_THRESHOLD = 0.15  # fail when a benchmark is 15% slower than the baseline
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def random_points(count, width, height):
+    """
+    :param count: number of points
+    :param width: width of the area
+    :param height: height of the area
+    :return: list of (x, y) integer points inside of the area
+    """
+    return [(random.randrange(width), random.randrange(height)) for _ in range(count)]
+
+
+def build_game(players, character_names):
+    """
+    Build a game with players, each playing the next of the characters.
+    :param players: the number of players
+    :param character_names: the characters to take turns with
+    :return: the Game
+    """
+    game = GameLogic.Game()
+    for player_id in range(1, players + 1):
+        game.create_player(player_id, character_names[player_id % len(character_names)])
+    return game
+
+
+def add_bullets(game, bullets):
+    """
+    Shoot bullets from random free positions in random directions, owned by random players.
+    :param game: the Game
+    :param bullets: the number of bullets to add
+    """
+    spawn_index = GameLogic.get_spawn_index(CHARACTER_WIDTH, CHARACTER_HEIGHT)
+    owners = list(game.players)
+    for _ in range(bullets):
+        x, y = spawn_index.sample()
+        angle = random.uniform(0, 2 * np.pi)
+        game.bullets.add(x + CHARACTER_WIDTH // 2, y + CHARACTER_HEIGHT // 2,
+                         BULLET_SPEED * np.cos(angle), BULLET_SPEED * np.sin(angle),
+                         BULLET_LIFESPAN, 1, random.choice(owners))
+
+
+def bench_check_collision(is_player):
+    """
+    :param is_player: check the player collision map, or the bullet one
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    width, height = (CHARACTER_WIDTH, CHARACTER_HEIGHT) if is_player else (BULLET_RADIUS, BULLET_RADIUS)
+    map_width, map_height = GameLogic.MAP_DATA.size
+    points = random_points(POINT_COUNT, map_width - width, map_height - height)
+
+    def run(calls):
+        check_collision = GameLogic.check_collision
+        start = time.perf_counter_ns()
+        for i in range(calls):
+            x, y = points[i % POINT_COUNT]
+            check_collision(x, y, width, height, is_player)
+        return time.perf_counter_ns() - start
+    return run
+
+
+def bench_is_colliding_at(is_player):
+    """
+    :param is_player: check the player collision map, or the bullet one
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    map_width, map_height = GameLogic.MAP_DATA.size
+    points = random_points(POINT_COUNT, map_width, map_height)
+
+    def run(calls):
+        is_colliding_at = GameLogic.is_colliding_at
+        start = time.perf_counter_ns()
+        for i in range(calls):
+            x, y = points[i % POINT_COUNT]
+            is_colliding_at(x, y, is_player)
+        return time.perf_counter_ns() - start
+    return run
+
+
+def bench_update_bullets(players, bullets, character_names):
+    """
+    Time a tick of the bullets. The bullets and the players' hp are put back before every call, untimed,
+    so every call updates the same bullets.
+    :param players: the number of players
+    :param bullets: the number of bullets
+    :param character_names: the characters the players play
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    game = build_game(players, character_names)
+    add_bullets(game, bullets)
+    saved_arrays = [array.copy() for array in game.bullets.arrays()]
+    saved_count = game.bullets.count
+    saved_hp = {player_id: player.hp for player_id, player in game.players.items()}
+
+    def run(calls):
+        elapsed = 0
+        for _ in range(calls):
+            for array, saved in zip(game.bullets.arrays(), saved_arrays):
+                array[:saved_count] = saved[:saved_count]
+            game.bullets.count = saved_count
+            for player_id, hp in saved_hp.items():
+                game.players[player_id].hp = hp
+            start = time.perf_counter_ns()
+            game.update_bullets()
+            elapsed += time.perf_counter_ns() - start
+        return elapsed
+    return run
+
+
+def bench_check_bullet_hit(players, character_names):
+    """
+    Time the hit check of single bullets, half of them are shot from inside of a player.
+    :param players: the number of players
+    :param character_names: the characters the players play
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    game = build_game(players, character_names)
+    map_width, map_height = GameLogic.MAP_DATA.size
+    shooters = list(game.players.values())
+    bullets = []
+    for i in range(POINT_COUNT):
+        if i % 2:
+            target = random.choice(shooters)
+            x, y = target.x + target.width // 2, target.y + target.height // 2
+        else:
+            x, y = random.randrange(map_width), random.randrange(map_height)
+        bullets.append((random.choice(list(game.players)),
+                        Bullet(x, y, 0, 0, BULLET_RADIUS, 0, None, BULLET_LIFESPAN)))
+
+    def run(calls):
+        check_bullet_hit = game.check_bullet_hit
+        start = time.perf_counter_ns()
+        for i in range(calls):
+            shooter_id, bullet = bullets[i % POINT_COUNT]
+            check_bullet_hit(shooter_id, bullet)
+        return time.perf_counter_ns() - start
+    return run
+
+
+def bench_find_random_free_position(players, character_names):
+    """
+    :param players: the number of players to keep away from
+    :param character_names: the characters the players play
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    game = build_game(players, character_names)
+
+    def run(calls):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            game.find_random_free_position(CHARACTER_WIDTH, CHARACTER_HEIGHT)
+        return time.perf_counter_ns() - start
+    return run
+
+
+def bench_create_player(players, character_name, character_names):
+    """
+    Time the creation of a player in a game that has players already, it is deleted again untimed.
+    :param players: the number of players already in the game
+    :param character_name: the character of the created player
+    :param character_names: the characters the existing players play
+    :return: function running the benchmark's calls, returning the nanoseconds they took
+    """
+    game = build_game(players, character_names)
+    new_player_id = players + 1
+
+    def run(calls):
+        elapsed = 0
+        for _ in range(calls):
+            start = time.perf_counter_ns()
+            game.create_player(new_player_id, character_name)
+            elapsed += time.perf_counter_ns() - start
+            game.delete_player(new_player_id)
+        return elapsed
+    return run
+
+
+def benchmark_cases(quick):
+    """
+    :param quick: use the small parameter grids
+    :return: list of (name, parameters dictionary, function building the benchmark)
+    """
+    player_counts = QUICK_PLAYER_COUNTS if quick else PLAYER_COUNTS
+    bullet_counts = QUICK_BULLET_COUNTS if quick else BULLET_COUNTS
+    character_names = GameLogic.CHARACTERS.names()
+
+    cases = []
+    for is_player in (True, False):
+        cases.append(('check_collision', {'is_player': is_player},
+                      lambda is_player=is_player: bench_check_collision(is_player)))
+        cases.append(('is_colliding_at', {'is_player': is_player},
+                      lambda is_player=is_player: bench_is_colliding_at(is_player)))
+    for players in player_counts:
+        for bullets in bullet_counts:
+            cases.append(('update_bullets', {'players': players, 'bullets': bullets},
+                          lambda players=players, bullets=bullets:
+                          bench_update_bullets(players, bullets, character_names)))
+        cases.append(('check_bullet_hit', {'players': players},
+                      lambda players=players: bench_check_bullet_hit(players, character_names)))
+        cases.append(('find_random_free_position', {'players': players},
+                      lambda players=players: bench_find_random_free_position(players, character_names)))
+        for character_name in character_names:
+            cases.append(('create_player', {'players': players, 'character': character_name},
+                          lambda players=players, character_name=character_name:
+                          bench_create_player(players, character_name, character_names)))
+    return cases
+
+
+def case_key(name, parameters):
+    """
+    :param name: the benchmark's name
+    :param parameters: the benchmark's parameters
+    :return: a string naming the benchmark and its parameters, which results are matched by
+    """
+    return name + ''.join(f' {key}={value}' for key, value in sorted(parameters.items()))
+
+
+def measure(run, repeat):
+    """
+    Time a benchmark after a warm up call, choosing the number of calls so a repeat takes about TARGET_REPEAT_TIME.
+    :param run: function running the given number of calls, returning the nanoseconds they took
+    :param repeat: how many times to time it
+    :return: dictionary of the median and fastest nanoseconds per call, and the calls of every repeat
+    """
+    run(1)  # warm up, the first call may load the map or fill caches
+    calls = 1
+    elapsed = run(calls)
+    while elapsed < TARGET_REPEAT_TIME * 1e9 / 10 and calls < MAX_CALLS:
+        calls *= 10
+        elapsed = run(calls)
+    calls = min(max(int(calls * TARGET_REPEAT_TIME * 1e9 / max(elapsed, 1)), 1), MAX_CALLS)
+    times = [run(calls) / calls for _ in range(repeat)]
+    return {'ns_per_call': statistics.median(times), 'min_ns_per_call': min(times), 'calls': calls}
+
+
+def run_benchmarks(quick=False, repeat=REPEAT, name_filter=None):
+    """
+    Run every benchmark of the grid.
+    :param quick: use the small parameter grids
+    :param repeat: how many times to time every benchmark
+    :param name_filter: only run the benchmarks whose name contains this, None for all of them
+    :return: the results dictionary
+    """
+    results = []
+    for name, parameters, build in benchmark_cases(quick):
+        if name_filter and name_filter not in name:
+            continue
+        random.seed(SEED)
+        result = measure(build(), repeat)
+        results.append({'name': name, 'parameters': parameters, 'key': case_key(name, parameters), **result})
+        print(f"{case_key(name, parameters):60} {result['ns_per_call'] / 1000:12.2f} us")
+    return {'meta': {'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'processor': platform.processor(),
+                     'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'repeat': repeat,
+                     'quick': quick},
+            'results': results}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a baseline, benchmarks missing from either of them are skipped.
+    :param results: the results dictionary
+    :param baseline: the baseline results dictionary
+    :param threshold: the fraction a benchmark may get slower by before it counts as a regression
+    :return: list of (key, baseline ns per call, ns per call) of the regressions
+    """
+    baseline_times = {result['key']: result['ns_per_call'] for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        baseline_time = baseline_times.get(result['key'])
+        if baseline_time is None:
+            continue
+        ratio = result['ns_per_call'] / baseline_time
+        status = 'REGRESSION' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else 'same'
+        print(f"{result['key']:60} {baseline_time / 1000:10.2f} -> {result['ns_per_call'] / 1000:10.2f} us "
+              f"({ratio:5.2f}x) {status}")
+        if status == 'REGRESSION':
+            regressions.append((result['key'], baseline_time, result['ns_per_call']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game logic's hot functions")
+    parser.add_argument('--quick', action='store_true', help="use the small parameter grids")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="how many times to time every benchmark")
+    parser.add_argument('--filter', help="only run the benchmarks whose name contains this")
+    parser.add_argument('--output', help="write the results as json to this file")
+    parser.add_argument('--save-baseline', help="write the results as the baseline to this file")
+    parser.add_argument('--baseline', help="compare the results against the baseline in this file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="the fraction a benchmark may get slower by before the run fails")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick, args.repeat, args.filter)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as file:
+                json.dump(results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
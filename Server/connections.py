@@ -0,0 +1,210 @@
+"""
+Author: Yoni Reichert
+Program name: connections.py
+Description: Keeps the connected clients of the server, found by address or by session token in constant time
+Date: 17-10-2026
+"""
+
+import random
+import time
+import sys
+import os
+from threading import Lock
+from timing_wheel import TimingWheel
+
+# the reliable channel is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from reliability import ReliableChannel
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+NO_SESSION = 0  # a client that didn't get its session token yet sends 0
+MAX_SESSION = 2 ** 32 - 1
+DISCONNECT_TIMEOUT = 10  # seconds a client can be quiet before it is disconnected
+EXPIRY_GRANULARITY = 0.25  # seconds, a quiet client is found at most this long after its timeout
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Connection:
+    def __init__(self, client_id, slot, address, session, encoding):
+        """
+        Initialize the state the server keeps for one client.
+        :param client_id: the client's id, which is also its player id in the game
+        :param slot: the index of the connection in the table's slot array
+        :param address: the client's (ip, port)
+        :param session: the session token the client sends in every packet header
+        :param encoding: the encoding the client talks in
+        """
+        self.client_id = client_id
+        self.slot = slot
+        self.address = address
+        self.session = session
+        self.encoding = encoding
+        self.last_active = time.time()
+        self.outbox = []  # the encoded messages waiting for the end of the tick, sent bundled together
+        self.reliable = ReliableChannel(encoding)  # player inits and hits, sent again until the client acks them
+
+        # statistics
+        self.outbound_sequence = 0
+        self.packets_received = 0
+        self.packets_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def record_received(self, size):
+        """
+        Update the activity time and statistics after receiving a datagram from the client.
+        :param size: the datagram size in bytes
+        """
+        self.last_active = time.time()
+        self.packets_received += 1
+        self.bytes_received += size
+
+    def record_sent(self, size):
+        """
+        Update the sequence and statistics after sending a datagram to the client.
+        :param size: the datagram size in bytes
+        """
+        self.outbound_sequence += 1
+        self.packets_sent += 1
+        self.bytes_sent += size
+
+
+class ConnectionTable:
+    def __init__(self, disconnect_timeout=DISCONNECT_TIMEOUT, expiry_granularity=EXPIRY_GRANULARITY):
+        """
+        Initialize an empty connection table.
+        Connections live in a dense slot array, freed slots are reused by the next client.
+        :param disconnect_timeout: seconds a client can be quiet before it expires
+        :param expiry_granularity: seconds, how late after its timeout an expired client may be found
+        """
+        self.slots: list[Connection | None] = []
+        self.free_slots = []
+        self.by_address = {}  # (ip, port) -> slot
+        self.by_session = {}  # session token -> slot
+        self.by_id = {}  # client id -> slot
+        self.id_counter = 1  # starts from 1, since id zero is the client's own player
+        self.lock = Lock()
+        self.disconnect_timeout = disconnect_timeout
+        # every client is in the slot of the deadline it had when it was put there, receiving a datagram only
+        # updates last_active, and the client is moved to its new deadline's slot when the old slot comes up
+        self.expiry = TimingWheel(disconnect_timeout, expiry_granularity)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        """
+        Iterate over a copy of the active connections, so the table can change during the iteration.
+        """
+        return iter([connection for connection in self.slots if connection])
+
+    def __contains__(self, client_id):
+        return client_id in self.by_id
+
+    def get(self, client_id):
+        """
+        Get the connection of a client by its id.
+        :param client_id: the client id
+        :return: the Connection, or None if there is no such client
+        """
+        slot = self.by_id.get(client_id)
+        return None if slot is None else self.slots[slot]
+
+    def lookup(self, address, session=NO_SESSION):
+        """
+        Find the connection a datagram belongs to.
+        The session token is checked first, so a client whose address changed (NAT rebinding) is still found.
+        :param address: the address the datagram came from
+        :param session: the session token from the packet header
+        :return: the Connection, or None if the datagram is from a new client
+        """
+        if session != NO_SESSION:
+            slot = self.by_session.get(session)
+            if slot is not None:
+                connection = self.slots[slot]
+                if connection.address != address:
+                    self.rebind(connection, address)
+                return connection
+        slot = self.by_address.get(address)
+        return None if slot is None else self.slots[slot]
+
+    def add(self, address, encoding, client_id=None, session=None):
+        """
+        Create a connection for a new client.
+        :param address: the client's address
+        :param encoding: the encoding the client talks in
+        :param client_id: the id to give the client, when another table already gave it one
+        :param session: the session token to give the client, when another table already gave it one
+        :return: the new Connection
+        """
+        with self.lock:
+            if session is None:
+                session = random.randint(1, MAX_SESSION)
+                while session in self.by_session:
+                    session = random.randint(1, MAX_SESSION)
+            if client_id is None:
+                client_id = self.id_counter
+            self.id_counter = max(self.id_counter, client_id + 1)
+
+            slot = self.free_slots.pop() if self.free_slots else len(self.slots)
+            connection = Connection(client_id, slot, address, session, encoding)
+            if slot == len(self.slots):
+                self.slots.append(connection)
+            else:
+                self.slots[slot] = connection
+
+            self.by_address[address] = slot
+            self.by_session[session] = slot
+            self.by_id[connection.client_id] = slot
+            self.expiry.schedule(connection.client_id, connection.last_active + self.disconnect_timeout)
+            return connection
+
+    def rebind(self, connection, address):
+        """
+        Move a connection to a new address.
+        :param connection: the connection whose client changed address
+        :param address: the new address
+        """
+        with self.lock:
+            self.by_address.pop(connection.address, None)
+            connection.address = address
+            self.by_address[address] = connection.slot
+
+    def remove(self, client_id):
+        """
+        Remove a client's connection and free its slot.
+        :param client_id: the client to remove
+        :return: the removed Connection, or None if there was no such client
+        """
+        with self.lock:
+            slot = self.by_id.pop(client_id, None)
+            if slot is None:
+                return None
+            connection = self.slots[slot]
+            self.slots[slot] = None
+            self.free_slots.append(slot)
+            del self.by_address[connection.address]
+            del self.by_session[connection.session]
+            return connection
+
+    def deadline_of(self, client_id):
+        """
+        :param client_id: the client id
+        :return: when the client expires if it stays quiet, None if there is no such client
+        """
+        connection = self.get(client_id)
+        return None if connection is None else connection.last_active + self.disconnect_timeout
+
+    def expired(self, current_time):
+        """
+        Find the connections that were quiet for longer than the disconnect timeout.
+        Only the clients whose deadline came up are checked, not the whole table.
+        :param current_time: the current time, in seconds
+        :return: list of the expired connections, the ones removed meanwhile aren't in it
+        """
+        with self.lock:
+            client_ids = self.expiry.advance(current_time, self.deadline_of)
+            connections = [self.get(client_id) for client_id in client_ids]
+        return [connection for connection in connections if connection is not None]
@@ -0,0 +1,237 @@
+"""
+Author: Yoni Reichert
+Program name: ingress.py
+Description: Runs N worker processes which all bind the server port with SO_REUSEPORT, so the kernel spreads the
+             datagrams between them and every worker decodes and validates its share in parallel. Every session
+             token belongs to one worker, and a datagram that reached another worker is forwarded to its owner
+Date: 17-10-2026
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+# the protocol module is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+import connections
+import server
+import sharding
+
+logger = logging.getLogger("ingress")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+WORKER_COUNT = sharding.WORKER_COUNT
+FORWARD_RING_CAPACITY = 1 << 18  # bytes of datagrams every worker to worker ring buffer holds
+
+# every forwarded datagram is preceded by the ip and port it came from
+FORWARD_RECORD = struct.Struct('!4sH')
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def owner_of(session, worker_count):
+    """
+    Find the worker a session token belongs to. A client without a session yet belongs to whoever got its datagram.
+    :param session: the session token
+    :param worker_count: how many workers there are
+    :return: the index of the owning worker, None if the session is NO_SESSION
+    """
+    if session == connections.NO_SESSION:
+        return None
+    return session % worker_count
+
+
+class IngressWorker(server.CommandsServer):
+    def __init__(self, worker_index, worker_count, forward_rings, receive_rings, stop_event,
+                 tick_rate=server.TICK_RATE):
+        """
+        Initialize a worker which receives on its own SO_REUSEPORT socket and runs the rooms of its own clients.
+        :param worker_index: the worker's index
+        :param worker_count: how many workers there are
+        :param forward_rings: dictionary of worker index -> the RingBuffer to that worker
+        :param receive_rings: list of the RingBuffers from the other workers
+        :param stop_event: a multiprocessing Event set when the worker should stop
+        :param tick_rate: how many game ticks to run every second
+        """
+        super().__init__(tick_rate)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.forward_rings = forward_rings
+        self.receive_rings = receive_rings
+        self.stop_event = stop_event
+        self.forwarded = 0
+        self.dropped = 0
+
+    def new_session(self):
+        """
+        Draw a session token owned by this worker, one that isn't used by any of its clients.
+        :return: the session token
+        """
+        while True:
+            session = random.randrange(1, connections.MAX_SESSION // self.worker_count) * self.worker_count
+            session += self.worker_index
+            if session not in self.connections.by_session:
+                return session
+
+    def handle_datagram(self, data, client_address):
+        """
+        decode and validate a datagram, then queue it if its session is owned by this worker,
+        or forward it to the worker that owns it. if the message is invalid, dump it
+        :param data: the datagram the client sent
+        :param client_address: the client who sent the message
+        """
+        game_updates, encoding = protocol.decode_datagram(data)
+        game_updates = [update for update in game_updates if server.validate_json_game_update(update)]
+        if not game_updates:
+            return
+        session = game_updates[0].get(protocol.SESSION, connections.NO_SESSION)
+        owner = owner_of(session, self.worker_count)
+        if owner is not None and owner != self.worker_index:
+            # the kernel picked this socket for the client's address, which changed since it got its session
+            record = FORWARD_RECORD.pack(socket.inet_aton(client_address[0]), client_address[1])
+            if self.forward_rings[owner].put(record, data):
+                self.forwarded += 1
+            else:
+                self.dropped += 1
+            return
+
+        connection = self.connections.lookup(client_address, session)
+        if not connection:
+            connection = self.connections.add(client_address, encoding, session=self.new_session())
+        connection.record_received(len(data))
+        for game_update in game_updates:
+            self.queue_game_update(connection, game_update)
+
+    def receive_forwarded(self):
+        """
+        Handle every datagram the other workers forwarded to this worker since the last tick.
+        """
+        for ring in self.receive_rings:
+            record = ring.get()
+            while record is not None:
+                ip, port = FORWARD_RECORD.unpack_from(record)
+                self.handle_datagram(record[FORWARD_RECORD.size:], (socket.inet_ntoa(ip), port))
+                record = ring.get()
+
+    def run_tick(self):
+        """
+        Run a single tick of every room, after taking the forwarded datagrams.
+        The worker stops once the launching process sets the stop event.
+        """
+        if self.stop_event.is_set():
+            self.stop()
+            return
+        self.receive_forwarded()
+        super().run_tick()
+
+
+def run_worker(worker_index, worker_count, map_description, forward_ring_names, receive_ring_names, stop_event,
+               tick_rate):
+    """
+    The entry point of an ingress worker process, runs the async server on its own socket until it is stopped.
+    :param worker_index: the worker's index
+    :param worker_count: how many workers there are
+    :param map_description: the description of the map data in shared memory
+    :param forward_ring_names: dictionary of worker index -> the name of the RingBuffer to that worker
+    :param receive_ring_names: list of the names of the RingBuffers from the other workers
+    :param stop_event: a multiprocessing Event set when the worker should stop
+    :param tick_rate: how many game ticks to run every second
+    """
+    memories = sharding.install_shared_map_data(map_description)
+    forward_rings = {index: sharding.RingBuffer(name=name) for index, name in forward_ring_names.items()}
+    receive_rings = [sharding.RingBuffer(name=name) for name in receive_ring_names]
+    worker = IngressWorker(worker_index, worker_count, forward_rings, receive_rings, stop_event, tick_rate)
+    logger.info(f"Ingress worker {worker_index} started")
+    try:
+        asyncio.run(worker.start_async_server())
+    except KeyboardInterrupt:
+        pass  # the launching process stops the workers
+    finally:
+        for ring in list(forward_rings.values()) + receive_rings:
+            ring.close()
+        for memory in memories:
+            memory.close()
+        logger.info(f"Ingress worker {worker_index} stopped, forwarded {worker.forwarded} datagrams")
+
+
+class IngressServer:
+    def __init__(self, worker_count=WORKER_COUNT, tick_rate=server.TICK_RATE):
+        """
+        Initialize the launcher of the ingress workers. It doesn't receive anything itself, it shares the map data,
+        creates a ring buffer for every pair of workers and waits for them.
+        :param worker_count: how many worker processes bind the server port
+        :param tick_rate: how many game ticks every worker runs every second
+        """
+        self.worker_count = worker_count
+        self.tick_rate = tick_rate
+        self.rings = {}  # (from worker, to worker) -> RingBuffer
+        self.workers = []
+        self.memories = []
+        self.stop_event = None
+        self.running = True
+
+    def start_server(self):
+        """
+        Start the workers and wait until the server is stopped.
+        """
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            logger.error("SO_REUSEPORT isn't supported on this platform, run server.py instead")
+            return
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        try:
+            self.memories, map_description = sharding.share_map_data()
+            for source in range(self.worker_count):
+                for target in range(self.worker_count):
+                    if source != target:
+                        self.rings[source, target] = sharding.RingBuffer(FORWARD_RING_CAPACITY)
+
+            for worker_index in range(self.worker_count):
+                forward_ring_names = {target: ring.name for (source, target), ring in self.rings.items()
+                                      if source == worker_index}
+                receive_ring_names = [ring.name for (source, target), ring in self.rings.items()
+                                      if target == worker_index]
+                worker = context.Process(target=run_worker,
+                                         args=(worker_index, self.worker_count, map_description, forward_ring_names,
+                                               receive_ring_names, self.stop_event, self.tick_rate),
+                                         daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            logger.info(f"Ingress server started with {self.worker_count} workers on port {server.SERVER_PORT}")
+
+            while self.running:
+                time.sleep(server.GAME_CHECKING_DELAY)
+        except Exception as e:
+            logger.error(f"Caught an expedition while running the ingress server: {e}")
+        finally:
+            logger.info("The ingress server is stopping! stopping all workers")
+            self.running = False
+            self.stop_event.set()
+            for worker in self.workers:
+                worker.join()
+            for ring in self.rings.values():
+                ring.close(unlink=True)
+            for memory in self.memories:
+                memory.close()
+                memory.unlink()
+            logger.info("All of the workers stopped!")
+
+    def stop(self):
+        """
+        Stop the server and its workers.
+        """
+        self.running = False
+
+
+if __name__ == "__main__":
+    ingress_server = IngressServer()
+    ingress_server.start_server()
@@ -0,0 +1,85 @@
+"""
+Author: Yoni Reichert
+Program name: interest.py
+Description: Finds which players every client of a room can see, so the server only sends the client updates about
+             the players around it
+Date: 17-10-2026
+"""
+
+from SpatialGrid import SpatialGrid
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+# the client's screen, its player is drawn at the center of it
+VIEW_WIDTH = 800
+VIEW_HEIGHT = 600
+
+# how far (in pixels) outside of the screen players are still sent, so they are already in place when they show up
+VIEW_MARGIN = 128
+
+# the interest grid is much coarser than the hit detection grid, since every query covers a whole screen
+INTEREST_CELL_SIZE = 256
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class InterestManager:
+    def __init__(self, map_width, map_height, cell_size=INTEREST_CELL_SIZE):
+        """
+        Initialize the area of interest of a room's clients.
+        :param map_width: Width of the map
+        :param map_height: Height of the map
+        :param cell_size: Width and height of every cell of the interest grid
+        """
+        self.grid = SpatialGrid(map_width, map_height, cell_size)
+        self.visible = {}  # client id -> set of the player ids the client can see, its own player included
+        self.known_players = set()  # the players that were in the game in the previous update
+
+    def update(self, players, client_ids):
+        """
+        Find the players every client sees now.
+        :param players: the game's players dictionary (player id -> Player)
+        :param client_ids: the ids of the room's clients
+        :return: two dictionaries of client id -> set of player ids, the players which entered the client's area
+                 since the previous update and the players which left it. Players that just joined the game aren't
+                 counted as entering, their clients sent them already, and players that left the game aren't
+                 counted as leaving, the snapshots remove them
+        """
+        for player_id in self.known_players - players.keys():
+            self.grid.remove(player_id)
+        for player_id, player in players.items():
+            self.grid.update(player_id, player.x, player.y, player.width, player.height)
+
+        entered = {}
+        left = {}
+        for client_id in client_ids:
+            player = players.get(client_id)
+            if player is None:
+                continue  # didn't choose a character yet
+            x = player.x + player.width / 2 - VIEW_WIDTH / 2 - VIEW_MARGIN
+            y = player.y + player.height / 2 - VIEW_HEIGHT / 2 - VIEW_MARGIN
+            visible = self.grid.query_rect(x, y, VIEW_WIDTH + 2 * VIEW_MARGIN, VIEW_HEIGHT + 2 * VIEW_MARGIN)
+            visible.add(client_id)
+            previous = self.visible.get(client_id)
+            if previous is not None:
+                entered[client_id] = (visible - previous) & self.known_players
+                left[client_id] = {player_id for player_id in previous - visible if player_id in players}
+            self.visible[client_id] = visible
+
+        self.known_players = set(players)
+        return entered, left
+
+    def is_visible(self, client_id, player_id):
+        """
+        :param client_id: the client
+        :param player_id: the player
+        :return: True if the client sees the player, a client always sees itself
+        """
+        return client_id == player_id or player_id in self.visible.get(client_id, ())
+
+    def forget_client(self, client_id):
+        """
+        Drop the area of a client that left.
+        :param client_id: the client to forget
+        """
+        self.visible.pop(client_id, None)
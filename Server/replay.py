@@ -0,0 +1,408 @@
+"""
+Author: Yoni Reichert
+Program name: replay.py
+Description: Records every accepted action of a match into a compact binary log, and replays a log by re-simulating
+             the game from it as fast as the cpu allows. The game loop only appends records to an in memory buffer,
+             the buffers are written to the files by a background thread. The game only moves with its tick clock,
+             so the same actions on the same ticks give back the same match
+Date: 17-10-2026
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import time
+from threading import Lock, Thread
+
+# the protocol module is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+import GameLogic
+
+logger = logging.getLogger("replay")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+REPLAY_DIRECTORY = 'replays'
+REPLAY_EXTENSION = '.replay'
+FLUSH_SIZE = 1 << 16  # bytes a log buffers before it is handed to the writer thread
+FLUSH_TICK_INTERVAL = 60  # the server hands over every log's buffer once a second at 60 ticks per second
+
+MAGIC = b'NREP'
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct('!4sBBHIQ')  # magic, format version, protocol version, tick rate, room id, start time ms
+RECORD_HEADER = struct.Struct('!IIBH')  # tick, player id, record type, length of the body that follows
+
+# the record types of the actions are their opcodes, so the log reads like the protocol
+RECORD_MOVE = protocol.OPCODE_MOVE
+RECORD_SHOOT = protocol.OPCODE_SHOOT
+RECORD_PLAYER_INIT = protocol.OPCODE_PLAYER_INIT
+RECORD_LEAVE = 64  # the player left the room
+RECORD_END = 255  # the match ended, the body is the final state of every player
+
+RECORD_TYPES = {
+    protocol.MOVE_PLAYER: RECORD_MOVE,
+    protocol.SHOOT_PLAYER: RECORD_SHOOT,
+    protocol.PLAYER_INIT: RECORD_PLAYER_INIT,
+}
+
+# bodies are doubles, so the replayed parameters are exactly the ones the server applied
+VECTOR_BODY = struct.Struct('!dd')  # x, y of a move, dx, dy of a shot
+SPAWN_BODY = struct.Struct('!dd')  # x, y the player was created in, after NAME_LENGTH and the name
+END_PLAYER = struct.Struct('!Iddh')  # player id, x, y, hp, after a COUNT of the players
+
+# the writer thread's commands
+WRITE = 'write'
+CLOSE = 'close'
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class ReplayRecorder:
+    def __init__(self, directory=REPLAY_DIRECTORY):
+        """
+        Initialize the recorder and start its writer thread, which owns every open replay file.
+        :param directory: the directory the replays are written to, created with the first replay
+        """
+        self.directory = directory
+        self.commands = queue.Queue()
+        self.logs = {}  # room id -> ReplayLog, the logs still being recorded
+        self.lock = Lock()
+        self.writer = Thread(target=self.write_files, name="replay writer", daemon=True)
+        self.writer.start()
+
+    def open_log(self, room_id, game):
+        """
+        Start recording a match.
+        :param room_id: the id of the match's room
+        :param game: the Game of the match, for its final state
+        :return: the ReplayLog of the match
+        """
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-room{room_id}{REPLAY_EXTENSION}"
+        log = ReplayLog(self, os.path.join(self.directory, name), room_id, game)
+        with self.lock:
+            self.logs[room_id] = log
+        return log
+
+    def submit(self, command, path, data=b''):
+        """
+        Hand a command to the writer thread, never waits for the file itself.
+        :param command: WRITE or CLOSE
+        :param path: the path of the replay
+        :param data: the bytes to write
+        """
+        self.commands.put((command, path, data))
+
+    def forget(self, log):
+        """
+        Stop tracking a log which was closed.
+        :param log: the ReplayLog
+        """
+        with self.lock:
+            if self.logs.get(log.room_id) is log:
+                del self.logs[log.room_id]
+
+    def write_files(self):
+        """
+        The writer thread, writes the buffers it is handed until it gets None.
+        """
+        files = {}  # path -> open file
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            action, path, data = command
+            try:
+                if action == WRITE:
+                    if path not in files:
+                        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                        files[path] = open(path, 'wb')
+                    files[path].write(data)
+                elif action == CLOSE and path in files:
+                    files.pop(path).close()
+            except OSError as e:
+                logger.error(f"Couldn't write the replay {path}: {e}")
+        for replay_file in files.values():
+            replay_file.close()
+
+    def flush(self):
+        """
+        Hand the buffer of every open log to the writer thread.
+        """
+        with self.lock:
+            logs = list(self.logs.values())
+        for log in logs:
+            log.flush()
+
+    def stop(self):
+        """
+        Close every log still being recorded, then wait for the writer thread to write everything.
+        """
+        with self.lock:
+            logs = list(self.logs.values())
+        for log in logs:
+            log.close()
+        self.commands.put(None)
+        self.writer.join()
+
+
+class ReplayLog:
+    def __init__(self, recorder, path, room_id, game):
+        """
+        Initialize the log of a single match, starting its buffer with the file header.
+        :param recorder: the ReplayRecorder writing the log
+        :param path: the path of the replay
+        :param room_id: the id of the match's room
+        :param game: the Game of the match
+        """
+        self.recorder = recorder
+        self.path = path
+        self.room_id = room_id
+        self.game = game
+        self.buffer = bytearray(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, protocol.PROTOCOL_VERSION,
+                                                 game.tick_rate, room_id,
+                                                 int(time.time() * 1000)))
+        self.lock = Lock()  # the receiving thread records leaves while the game loop records actions
+        self.closed = False
+
+    def record(self, tick, player_id, record_type, body=b''):
+        """
+        Append a record to the buffer, handing the buffer over once it is large.
+        :param tick: the tick of the game the record applies on, before the game steps it
+        :param player_id: the player of the record
+        :param record_type: the type of the record
+        :param body: the body of the record
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.buffer += RECORD_HEADER.pack(tick, player_id, record_type, len(body))
+            self.buffer += body
+            if len(self.buffer) >= FLUSH_SIZE:
+                self.flush_buffer()
+
+    def record_action(self, tick, player_id, action_type, parameters):
+        """
+        Record an action the game applied.
+        :param tick: the tick of the game the action was applied on
+        :param player_id: the player who made the action
+        :param action_type: move, shoot or player_init
+        :param parameters: the action's parameters, [name, x, y] of player_init being the position it was created in
+        """
+        record_type = RECORD_TYPES.get(action_type)
+        if record_type is None:
+            return
+        if record_type == RECORD_PLAYER_INIT:
+            name = parameters[0].encode()
+            body = encode_name(name) + SPAWN_BODY.pack(parameters[1], parameters[2])
+        else:
+            body = VECTOR_BODY.pack(parameters[0], parameters[1])
+        self.record(tick, player_id, record_type, body)
+
+    def record_leave(self, tick, player_id):
+        """
+        Record a player leaving the match.
+        :param tick: the tick of the game the player left on
+        :param player_id: the player who left
+        """
+        self.record(tick, player_id, RECORD_LEAVE)
+
+    def flush_buffer(self):
+        """
+        Hand the buffer to the writer thread, called with the lock held.
+        """
+        if self.buffer:
+            self.recorder.submit(WRITE, self.path, bytes(self.buffer))
+            self.buffer.clear()
+
+    def flush(self):
+        """
+        Hand whatever was recorded so far to the writer thread.
+        """
+        with self.lock:
+            self.flush_buffer()
+
+    def close(self):
+        """
+        End the log with the final state of the players, so a replay can check it got the same match.
+        """
+        players = list(self.game.players.items())
+        body = protocol.COUNT.pack(len(players)) + b''.join(
+            END_PLAYER.pack(player_id, player.x, player.y, player.hp) for player_id, player in players)
+        self.record(self.game.clock.tick, 0, RECORD_END, body)
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.flush_buffer()
+            self.recorder.submit(CLOSE, self.path)
+        self.recorder.forget(self)
+
+
+def encode_name(name):
+    """
+    :param name: the encoded name
+    :return: the name preceded by its length, like in the protocol
+    """
+    return protocol.NAME_LENGTH.pack(len(name)) + name
+
+
+def read_header(data):
+    """
+    Read the header of a replay.
+    :param data: the replay's bytes
+    :return: dictionary of the header's fields, None if it isn't a replay this version can read
+    """
+    if len(data) < FILE_HEADER.size:
+        return None
+    magic, format_version, protocol_version, tick_rate, room_id, start_time = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    return {'protocol_version': protocol_version, 'tick_rate': tick_rate, 'room_id': room_id,
+            'start_time': start_time / 1000}
+
+
+def read_records(data):
+    """
+    Go over the records of a replay, straight out of its bytes. A record cut off by a server that crashed
+    before writing it whole ends the replay.
+    :param data: the replay's bytes, usually a memory map of the file
+    :return: generator of (tick, player id, record type, parameters)
+    """
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        tick, player_id, record_type, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            logger.warning(f"The replay ends with a record cut off at byte {offset}")
+            return
+        if record_type == RECORD_MOVE or record_type == RECORD_SHOOT:
+            parameters = VECTOR_BODY.unpack_from(data, offset)
+        elif record_type == RECORD_PLAYER_INIT:
+            name_length, = protocol.NAME_LENGTH.unpack_from(data, offset)
+            name_start = offset + protocol.NAME_LENGTH.size
+            name = bytes(data[name_start:name_start + name_length]).decode()
+            parameters = (name,) + SPAWN_BODY.unpack_from(data, name_start + name_length)
+        elif record_type == RECORD_END:
+            count, = protocol.COUNT.unpack_from(data, offset)
+            parameters = [END_PLAYER.unpack_from(data, offset + protocol.COUNT.size + index * END_PLAYER.size)
+                          for index in range(count)]
+        else:
+            parameters = ()
+        offset += length
+        yield tick, player_id, record_type, parameters
+
+
+def final_state(game):
+    """
+    :param game: the Game
+    :return: sorted list of (player id, x, y, hp) of every player, like in the END record
+    """
+    return sorted((player_id, float(player.x), float(player.y), player.hp)
+                  for player_id, player in game.players.items())
+
+
+def resimulate(data, on_hit=None):
+    """
+    Re-simulate the match of a replay, stepping the game to the tick of every record and applying it,
+    without waiting between the ticks.
+    :param data: the replay's bytes
+    :param on_hit: optional function called with the tick, player id and damage of every hit
+    :return: dictionary of the replayed match, None if the data isn't a replay
+    """
+    header = read_header(data)
+    if header is None:
+        return None
+    game = GameLogic.Game(header['tick_rate'])
+    actions = hits = 0
+    recorded_state = None
+    started = time.perf_counter()
+    for tick, player_id, record_type, parameters in read_records(data):
+        while game.clock.tick < tick:
+            for hit_player_id, damage in game.step():
+                hits += 1
+                if on_hit:
+                    on_hit(game.clock.tick, hit_player_id, damage)
+        if record_type == RECORD_END:
+            recorded_state = sorted(parameters)
+            break
+        actions += 1
+        if record_type == RECORD_MOVE:
+            game.set_cords(player_id, *parameters)
+        elif record_type == RECORD_SHOOT:
+            game.shoot_player(player_id, *parameters)
+        elif record_type == RECORD_PLAYER_INIT:
+            game.add_player(player_id, *parameters)
+        elif record_type == RECORD_LEAVE:
+            game.delete_player(player_id)
+    elapsed = time.perf_counter() - started
+
+    replayed_state = final_state(game)
+    return {
+        **header,
+        'ticks': game.clock.tick,
+        'actions': actions,
+        'hits': hits,
+        'seconds': elapsed,
+        'ticks_per_second': game.clock.tick / elapsed if elapsed else 0,
+        'complete': recorded_state is not None,
+        'matches_recording': recorded_state == replayed_state if recorded_state is not None else None,
+        'final_state': replayed_state,
+    }
+
+
+def replay_file(path, on_hit=None):
+    """
+    Re-simulate a replay file, mapping it into memory instead of reading it.
+    :param path: the path of the replay
+    :param on_hit: optional function called with the tick, player id and damage of every hit
+    :return: dictionary of the replayed match, None if the file isn't a replay
+    """
+    with open(path, 'rb') as replay:
+        if os.fstat(replay.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(replay.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return resimulate(data, on_hit)
+
+
+def main():
+    """
+    Replay the given logs and print what happened in every one of them.
+    """
+    parser = argparse.ArgumentParser(description="Re-simulate recorded matches")
+    parser.add_argument('replays', nargs='+', help="replay files to re-simulate")
+    parser.add_argument('--hits', action='store_true', help="print every hit as it is replayed")
+    parser.add_argument('--json', action='store_true', help="print the results as json")
+    arguments = parser.parse_args()
+
+    def print_hit(tick, player_id, damage):
+        print(f"  tick {tick}: player {player_id} was hit for {damage}")
+
+    results = {}
+    failed = False
+    for path in arguments.replays:
+        result = replay_file(path, print_hit if arguments.hits and not arguments.json else None)
+        results[path] = result
+        if result is None:
+            print(f"{path}: not a replay")
+            failed = True
+            continue
+        failed = failed or result['matches_recording'] is False
+        if not arguments.json:
+            verdict = {True: "matches the recording", False: "DIFFERS from the recording",
+                       None: "the recording has no end"}[result['matches_recording']]
+            print(f"{path}: room {result['room_id']}, {result['ticks']} ticks, {result['actions']} actions, "
+                  f"{result['hits']} hits in {result['seconds'] * 1000:.1f}ms "
+                  f"({result['ticks_per_second']:.0f} ticks per second), {verdict}")
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
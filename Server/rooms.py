@@ -0,0 +1,151 @@
+"""
+Author: Yoni Reichert
+Program name: rooms.py
+Description: Runs many independent matches in one server, every client is routed to the room it plays in
+Date: 17-10-2026
+"""
+
+import logging
+from threading import Lock
+import GameLogic
+import snapshots
+import interest
+import action_queues
+
+logger = logging.getLogger("rooms")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+MAX_PLAYERS_PER_ROOM = 8
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Room:
+    def __init__(self, room_id, max_players=MAX_PLAYERS_PER_ROOM, tick_rate=GameLogic.SIMULATION_TICK_RATE):
+        """
+        Initialize a room holding a single match. The map data and spawn indexes are module level
+        in GameLogic, so every room shares one copy of them.
+        :param room_id: the room's id
+        :param max_players: the most clients the room accepts
+        :param tick_rate: how many ticks a second the room's game runs
+        """
+        self.room_id = room_id
+        self.max_players = max_players
+        self.game = GameLogic.Game(tick_rate)
+        self.snapshots = snapshots.SnapshotHistory()
+        self.interest = interest.InterestManager(self.game.map_width, self.game.map_height)
+        self.actions = action_queues.ActionQueues()  # the actions waiting for the room's next tick
+        self.new_bullets = []  # bullets shot since the last snapshot, sent with the next one
+        self.client_ids = set()
+        self.tick = 0
+        self.replay = None  # the ReplayLog recording the match, None when matches aren't recorded
+
+    def __len__(self):
+        return len(self.client_ids)
+
+    def is_open(self):
+        """
+        :return: True if new clients can join the room
+        """
+        return len(self.client_ids) < self.max_players
+
+    def check_for_game_over(self):
+        """
+        check if the match is over, which is when only one of at least two players is alive
+        :return: true if the game is over
+        """
+        if len(self.game.players) < 2:
+            return False  # only one player
+        is_player_alive = False
+        for player in self.game.players.values():
+            if player.hp > 0:
+                if is_player_alive:
+                    return False  # more than on player is alive
+                else:
+                    is_player_alive = True  # one player is alive
+        return True  # game is over
+
+
+class RoomManager:
+    def __init__(self, max_players_per_room=MAX_PLAYERS_PER_ROOM, replays=None,
+                 tick_rate=GameLogic.SIMULATION_TICK_RATE):
+        """
+        Initialize the room manager without any rooms, rooms are opened when clients need them.
+        :param max_players_per_room: the most clients in a single room
+        :param replays: optional ReplayRecorder, which records the match of every room opened
+        :param tick_rate: how many ticks a second the games of the rooms run
+        """
+        self.max_players_per_room = max_players_per_room
+        self.replays = replays
+        self.tick_rate = tick_rate
+        self.rooms = {}  # room id -> Room
+        self.room_of_client = {}  # client id -> Room
+        self.room_id_counter = 1
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def __iter__(self):
+        # iterate over a copy, so clients can join from the receiving thread meanwhile
+        return iter(list(self.rooms.values()))
+
+    def room_of(self, client_id):
+        """
+        :param client_id: the client's id
+        :return: the Room the client plays in, None if it has no room
+        """
+        return self.room_of_client.get(client_id)
+
+    def assign(self, client_id):
+        """
+        Put a client in the first room that isn't full, opening a new room if all of them are.
+        :param client_id: the client's id
+        :return: the Room the client was put in
+        """
+        with self.lock:
+            room = self.room_of_client.get(client_id)
+            if room is not None:
+                return room
+            room = next((room for room in self.rooms.values() if room.is_open()), None)
+            if room is None:
+                room = Room(self.room_id_counter, self.max_players_per_room, self.tick_rate)
+                if self.replays:
+                    room.replay = self.replays.open_log(room.room_id, room.game)
+                self.rooms[room.room_id] = room
+                self.room_id_counter += 1
+                logger.info(f"Opened room {room.room_id}")
+            room.client_ids.add(client_id)
+            self.room_of_client[client_id] = room
+            return room
+
+    def remove_client(self, client_id):
+        """
+        Take a client out of its room.
+        :param client_id: the client's id
+        :return: the Room the client was in, None if it had no room
+        """
+        with self.lock:
+            room = self.room_of_client.pop(client_id, None)
+            if room is not None:
+                room.client_ids.discard(client_id)
+            return room
+
+    def close(self, room):
+        """
+        Close a room, its clients are left without a room and a new client never joins it.
+        :param room: the Room to close
+        :return: the ids of the clients that were in the room
+        """
+        with self.lock:
+            self.rooms.pop(room.room_id, None)
+            client_ids = list(room.client_ids)
+            for client_id in client_ids:
+                self.room_of_client.pop(client_id, None)
+            room.client_ids.clear()
+            if room.replay:
+                room.replay.close()
+                room.replay = None
+            logger.info(f"Closed room {room.room_id}")
+            return client_ids
@@ -0,0 +1,159 @@
+"""
+Author: Yoni Reichert
+Program name: scheduler.py
+Description: Runs the server's game ticks at a fixed rate and measures how long every part of a tick takes
+Date: 17-10-2026
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("scheduler")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+DEFAULT_TICK_RATE = 60  # ticks per second, 30 / 60 / 128 are the usual choices
+MAX_CATCH_UP_TICKS = 5  # the most ticks run back to back after a stall, the rest are skipped
+REPORT_INTERVAL = 10  # seconds between two timing reports in the log
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class TickStats:
+    def __init__(self, tick_length):
+        """
+        Initialize the tick counters.
+        :param tick_length: the time budget of a single tick, in seconds
+        """
+        self.tick_length = tick_length
+        self.ticks = 0
+        self.over_budget_ticks = 0
+        self.skipped_ticks = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.phase_total_time = {}  # phase name -> seconds spent in it over all ticks
+        self.phase_max_time = {}  # phase name -> the longest it took in a single tick
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure a part of the tick, for example the action drain, the bullet update or the broadcast.
+        :param name: the name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.phase_total_time[name] = self.phase_total_time.get(name, 0.0) + duration
+            self.phase_max_time[name] = max(self.phase_max_time.get(name, 0.0), duration)
+
+    def record_tick(self, duration):
+        """
+        Count a finished tick.
+        :param duration: how long the whole tick took, in seconds
+        """
+        self.ticks += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        if duration > self.tick_length:
+            self.over_budget_ticks += 1
+
+    def as_dict(self):
+        """
+        Get all of the counters.
+        :return: dictionary of the counters, times are in milliseconds
+        """
+        ticks = max(self.ticks, 1)
+        return {
+            'ticks': self.ticks,
+            'over_budget_ticks': self.over_budget_ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'budget_ms': self.tick_length * 1000,
+            'average_ms': self.total_time / ticks * 1000,
+            'max_ms': self.max_time * 1000,
+            'phases': {
+                name: {'average_ms': total / ticks * 1000, 'max_ms': self.phase_max_time[name] * 1000}
+                for name, total in self.phase_total_time.items()
+            },
+        }
+
+
+class TickScheduler:
+    def __init__(self, tick_rate=DEFAULT_TICK_RATE, max_catch_up_ticks=MAX_CATCH_UP_TICKS):
+        """
+        Initialize a fixed timestep scheduler. Every tick simulates exactly 1 / tick_rate seconds,
+        and ticks that are late are run back to back (up to max_catch_up_ticks) to catch up.
+        :param tick_rate: ticks per second
+        :param max_catch_up_ticks: the most ticks to run at once after a stall
+        """
+        self.tick_rate = tick_rate
+        self.tick_length = 1 / tick_rate
+        self.max_catch_up_ticks = max_catch_up_ticks
+        self.next_tick_time = None
+        self.next_report_time = None
+        self.stats = TickStats(self.tick_length)
+
+    def due_ticks(self, now):
+        """
+        Find how many ticks should run now, and move the schedule forward by them.
+        :param now: the current time, from time.perf_counter
+        :return: the number of ticks to run
+        """
+        if self.next_tick_time is None:
+            self.next_tick_time = now
+            self.next_report_time = now + REPORT_INTERVAL
+        if now < self.next_tick_time:
+            return 0
+
+        steps = int((now - self.next_tick_time) / self.tick_length) + 1
+        if steps > self.max_catch_up_ticks:
+            # too far behind, drop the backlog instead of spiraling
+            self.stats.skipped_ticks += steps - self.max_catch_up_ticks
+            self.next_tick_time = now + self.tick_length
+            return self.max_catch_up_ticks
+        self.next_tick_time += steps * self.tick_length
+        return steps
+
+    def time_until_next_tick(self):
+        """
+        :return: seconds until the next tick is due
+        """
+        return max(0.0, self.next_tick_time - time.perf_counter())
+
+    def run_due_ticks(self, tick_function):
+        """
+        Run every tick that is due, timing each of them, and log a report once every REPORT_INTERVAL.
+        :param tick_function: the function running a single tick
+        """
+        now = time.perf_counter()
+        for _ in range(self.due_ticks(now)):
+            start = time.perf_counter()
+            tick_function()
+            self.stats.record_tick(time.perf_counter() - start)
+
+        if now >= self.next_report_time:
+            self.next_report_time = now + REPORT_INTERVAL
+            logger.info(f"Tick stats: {self.stats.as_dict()}")
+
+    def run(self, tick_function, should_continue):
+        """
+        Run ticks on the current thread until should_continue returns False.
+        :param tick_function: the function running a single tick
+        :param should_continue: function returning whether to keep running
+        """
+        while should_continue():
+            self.run_due_ticks(tick_function)
+            time.sleep(self.time_until_next_tick())
+
+    async def run_async(self, tick_function, should_continue):
+        """
+        Run ticks as an asyncio task until should_continue returns False.
+        :param tick_function: the function running a single tick
+        :param should_continue: function returning whether to keep running
+        """
+        while should_continue():
+            self.run_due_ticks(tick_function)
+            await asyncio.sleep(self.time_until_next_tick())
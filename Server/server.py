@@ -1,18 +1,31 @@
 """
 Author: Yoni Reichert
 Program name: server.py
-Description: Connects with clients and initiate them, runs the ninja game logic to broadcast hits actions to all clients
+Description: Connects with clients and initiate them, runs a ninja game for every room of clients and broadcasts
+             its hits actions to the room's clients
 Date: 17-05-2024
 """
 
 import socket
-import json
-import pygame
+import select
+import asyncio
+import sys
+import os
 from threading import Thread
-from queue import Queue
-import GameLogic
+from collections import deque
 import logging
 import time
+import math
+
+# the protocol module is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+import reliability
+import GameLogic
+import connections
+import scheduler
+import rooms
+import replay
 
 # Initialize logger
 logging.basicConfig(
@@ -29,39 +42,59 @@ logger = logging.getLogger("server")
 SERVER_IP = '0.0.0.0'
 SERVER_PORT = 12345
 DISCONNECT_TIMEOUT = 10  # seconds
+CLOSED_ROOM_LINGER = 5  # seconds the clients of a finished match are kept, so their last reliable messages are resent
 GAME_CHECKING_DELAY = 1
+TICK_RATE = scheduler.DEFAULT_TICK_RATE  # game ticks per second
+TIMEOUT_CHECK_INTERVAL = 0.25  # seconds between two checks for quiet clients, finer than a second
+USE_ASYNCIO_SERVER = True  # run everything on one event loop instead of the receive, game and timeout threads
+SNAPSHOT_TICK_INTERVAL = 3  # send a snapshot every 3 game ticks (20 per second at 60 ticks per second)
+USE_AREA_OF_INTEREST = True  # only send a client the moves, shots and hits of the players around it
+WIRE_COORDINATE_RANGE = (-2 ** 15, 2 ** 15 - 1)  # coordinates are int16 in the binary snapshots
+RECORD_REPLAYS = False  # record every match into replay.REPLAY_DIRECTORY, which replay.py re-simulates
 
 # Action types
 MOVE_PLAYER = 'move'
 SHOOT_PLAYER = 'shoot'
 PLAYER_INIT = 'player_init'
 HIT_PLAYER = 'hit'
+SNAPSHOT = 'snapshot'
+SNAPSHOT_ACK = 'snapshot_ack'
+RELIABLE = 'reliable'
+ACK = 'ack'
+LEAVE_VIEW = 'leave_view'
 
 # Action parameters
 ACTION_TYPE = 'type'
 ACTION_PARAMETERS = 'action_parameters'
 
-MESSAGE_DIVIDER = '!'
 # ----------------------------------------------------------------------------------------------------------------------
 
 
 class CommandsServer:
-    def __init__(self):
+    def __init__(self, tick_rate=TICK_RATE):
         """
-        Initialize the server, creating a server socket, game instance, action queue,
-        clients dictionary, and ID counter.
+        Initialize the server, creating a server socket, the room manager which holds a game for
+        every match, and the connection table of the clients.
+        :param tick_rate: how many game ticks to run every second
         """
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # Allow the socket to reuse the address (IP and port)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_socket.settimeout(1.0)  # Set timeout to 1 second
-        self.game = GameLogic.Game()
-        self.action_queue = Queue()
-        self.clients = {}
-        self.last_active = {}  # Stores last activity time for each client
-        self.id_counter = 1   # starts from 1, since id zero is saved for acknowledge messages
+        # every datagram of the threaded server is received into this buffer, and parsed straight out of it
+        self.receive_buffer = bytearray(protocol.MAX_DATAGRAM_SIZE)
+        self.receive_view = memoryview(self.receive_buffer)
+        self.replays = replay.ReplayRecorder() if RECORD_REPLAYS else None
+        self.rooms = rooms.RoomManager(replays=self.replays, tick_rate=tick_rate)
+        self.tick = 0
+        self.scheduler = scheduler.TickScheduler(tick_rate)
+        self.connections = connections.ConnectionTable(DISCONNECT_TIMEOUT, TIMEOUT_CHECK_INTERVAL)
         self.running = True  # to manage all the threads
         self.threads = []
+        # ids of the quiet clients, they are cleaned up by the game loop, which is the only one changing the games
+        self.pending_disconnects = deque()
+        self.closing = {}  # client id -> when the connection of a client whose match ended is removed at the latest
+        self.transport = self.server_socket  # where datagrams are sent through, replaced in the asyncio mode
 
     def start_server(self):
         """
@@ -85,21 +118,62 @@ class CommandsServer:
             self.threads.append(timeout_clients_thread)
             timeout_clients_thread.start()
 
-            game_over = False
-            while not game_over:
-                game_over = self.check_for_game_over()
+            # finished matches are recycled by the game loop, the server itself runs until it is stopped
+            while self.running:
                 time.sleep(GAME_CHECKING_DELAY)
         except Exception as e:
             logger.error(f"Caught an expedition while running the main server: {e}")
         finally:
-            logger.info("The game is over! stopping all threads and restarting")
+            logger.info("The server is stopping! stopping all threads")
             self.running = False
             time.sleep(1)
             for thread in self.threads:
                 thread.join()
                 logger.info(f"thread  {thread.name} has stopped!")
+            self.stop_replays()
             self.server_socket.close()
-            logger.info("All of the threads stopped! restarting the server")
+            logger.info("All of the threads stopped!")
+
+    async def start_async_server(self):
+        """
+        Start the server on an asyncio event loop. Receiving is done by a DatagramProtocol, and the game
+        loop and client timeouts run as tasks on the same loop, so nothing is shared between threads.
+        When the server is stopped the tasks are cancelled and awaited before the socket closes.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = []
+        try:
+            logger.info(f"Async server started, listening on {SERVER_IP}:{SERVER_PORT}")
+            self.server_socket.bind((SERVER_IP, SERVER_PORT))
+            self.transport, _ = await loop.create_datagram_endpoint(lambda: ServerProtocol(self),
+                                                                    sock=self.server_socket)
+            tasks.append(asyncio.create_task(self.run_game_loop_async()))
+            tasks.append(asyncio.create_task(self.check_for_timeouts_async()))
+            await tasks[0]  # the game loop runs until the server is stopped
+        except Exception as e:
+            logger.error(f"Caught an expedition while running the async server: {e}")
+        finally:
+            logger.info("The server is stopping! stopping all tasks")
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.stop_replays()
+            self.transport.close()
+            logger.info("All of the tasks stopped!")
+
+    def stop(self):
+        """
+        Stop the server, every match still running is dropped.
+        """
+        self.running = False
+
+    def stop_replays(self):
+        """
+        End the replays of the matches still running and wait until all of the replays are written.
+        """
+        if self.replays:
+            self.replays.stop()
 
     def handle_clients_messages(self):
         """
@@ -109,130 +183,225 @@ class CommandsServer:
         """
         while self.running:
             try:
-                message = None
-                client_address = None
-                while not message and not client_address:
-                    message, client_address = self.receive_message_from_client()
-                game_update = json.loads(message)
-                if validate_json_game_update(game_update):
-                    client_id = next((k for k, v in self.clients.items() if v == client_address), None)
-                    if not client_id:
-                        client_id = self.id_counter
-                        self.clients[self.id_counter] = client_address
-                        self.id_counter += 1
-
-                    self.last_active[client_id] = time.time()  # Update last active time
-                    self.action_queue.put((client_id, game_update))
+                self.receive_pending_messages()
             except socket.timeout:
                 continue  # No data received, loop back and check if still running
             except ConnectionResetError as cr:
                 logger.info(f"Having connection reset error as: {cr}, trying again")
 
+    def receive_pending_messages(self):
+        """
+        wait for a datagram, then handle it and every other datagram that is already waiting in the socket,
+        so a burst of datagrams is handled in one wakeup
+        """
+        size, client_address = self.receive_message_from_client()
+        self.handle_datagram(self.receive_view[:size], client_address)
+        while self.running and select.select([self.server_socket], [], [], 0)[0]:
+            size, client_address = self.receive_message_from_client()
+            self.handle_datagram(self.receive_view[:size], client_address)
+
     def receive_message_from_client(self):
         """
-        get the message from client
-        :return: message: the client message
+        get the message from client into the receive buffer, which is overwritten by the next message
+        :return: size: the size of the datagram the client sent
         :return client_address: the client who sent the message
         """
-        data, client_address = self.server_socket.recvfrom(1024)  # Adjust buffer size as needed
-        data = data.decode()
-
-        # Initialize variables to parse the message
-        length_str = ""
-        index = 0
-
-        # Read the length of the message
-        while index < len(data):
-            char = data[index]
-            if char.isdigit():
-                length_str += char
-                index += 1
-            elif char == '!':
-                index += 1
-                break
-            else:
-                logger.error(f"Invalid char while reading message length: {char}")
-                return
-
-        # Convert the length string to an integer
-        length = int(length_str)
-
-        # Read the message content of the specified length
-        message = data[index:index + length]
+        return self.server_socket.recvfrom_into(self.receive_buffer)
 
-        # Check if the message length matches the specified length
-        if len(message) != length:
-            logger.error(f"Message length mismatch. Expected {length}, got {len(message)}")
-            return
-        pass
-        return message, client_address
-
-    def check_for_game_over(self):
+    def handle_datagram(self, data, client_address):
+        """
+        decode a datagram in either the binary or the json encoding and queue it in the room of its client,
+        a new client is put in a room first. if the message is invalid, dump it
+        :param data: the datagram the client sent, it isn't used after this returns so it can be a receive buffer
+        :param client_address: the client who sent the message
         """
-        check if the game is over, is handle is_player_alive
-        :return: true if the game is over
+        game_updates, encoding = protocol.decode_datagram(data)
+        game_updates = [game_update for game_update in game_updates if validate_json_game_update(game_update)]
+        if game_updates:
+            session = game_updates[0].get(protocol.SESSION, connections.NO_SESSION)
+            connection = self.connections.lookup(client_address, session)
+            if not connection:
+                # the client's encoding is negotiated by the first message it sends
+                connection = self.connections.add(client_address, encoding)
+            connection.record_received(len(data))  # Update last active time
+            for game_update in game_updates:
+                self.queue_game_update(connection, game_update)
+
+    def queue_game_update(self, connection, game_update):
         """
-        if len(self.game.players) < 2:
-            return False  # only one player
-        is_player_alive = False
-        for player in self.game.players.values():
-            if player.hp > 0:
-                if is_player_alive:
-                    return False  # more than on player is alive
-                else:
-                    is_player_alive = True  # one player is alive
-        return True  # game is over
+        queue a valid game update in the room of its client, a client without a room is put in one first.
+        shots are checked against the cooldown of the client's character here, before they reach the game loop.
+        acks and reliable messages are taken by the client's reliable channel, which hands over the wrapped
+        messages in the order the client sent them
+        :param connection: the Connection of the client who sent the update
+        :param game_update: the decoded update
+        """
+        action_type = game_update[ACTION_TYPE]
+        if action_type == ACK:
+            connection.reliable.acknowledge(*game_update[ACTION_PARAMETERS])
+            return
+        if action_type == RELIABLE:
+            sequence, message = game_update[ACTION_PARAMETERS]
+            for delivered in connection.reliable.receive(sequence, message):
+                if validate_json_game_update(delivered) and delivered[ACTION_TYPE] != RELIABLE:
+                    self.queue_game_update(connection, delivered)
+            return
+
+        if connection.client_id in self.closing:
+            return  # the client's match is over, only its acks are taken until its connection is removed
+        room = self.rooms.room_of(connection.client_id) or self.rooms.assign(connection.client_id)
+        player = room.game.players.get(connection.client_id)
+        room.actions.put(connection.client_id, game_update,
+                         player.cooldown_ticks if player else None, room.game.clock.tick)
 
     def check_for_timeouts(self):
         """
-        a self depended on thread which checks if client didn't send a message for disconnected timeout time
+        a self depended on thread which checks if client didn't send a message for disconnected timeout time,
+        every TIMEOUT_CHECK_INTERVAL seconds
         :return:
         """
         while self.running:
-            current_time = time.time()
-            to_remove = []
-            for client_id, last_time in self.last_active.items():
-                if current_time - last_time > DISCONNECT_TIMEOUT:
-                    to_remove.append(client_id)
-
-            for client_id in to_remove:
-                self.cleanup_client(client_id)
-                logger.info(f"Client {client_id} has been disconnected due to inactivity.")
-            time.sleep(1)
+            self.disconnect_inactive_clients()
+            time.sleep(TIMEOUT_CHECK_INTERVAL)
+
+    async def check_for_timeouts_async(self):
+        """
+        the asyncio task version of check_for_timeouts, checking every TIMEOUT_CHECK_INTERVAL seconds
+        """
+        while self.running:
+            self.disconnect_inactive_clients()
+            await asyncio.sleep(TIMEOUT_CHECK_INTERVAL)
+
+    def disconnect_inactive_clients(self):
+        """
+        queue every client which didn't send a message for disconnected timeout time, the next tick cleans it up
+        """
+        for connection in self.connections.expired(time.time()):
+            self.pending_disconnects.append(connection.client_id)
+
+    def apply_disconnects(self):
+        """
+        clean up the clients queued by disconnect_inactive_clients, called by the game loop
+        """
+        while self.pending_disconnects:
+            client_id = self.pending_disconnects.popleft()
+            self.cleanup_client(client_id)
+            logger.info(f"Client {client_id} has been disconnected due to inactivity.")
 
     def run_game_loop(self):
         """
         Continuously process game actions from the action queue and update the game state,
         handling any bullet hits that occur.
         """
-        while self.running:
-            while not self.action_queue.empty():
-                player_id, action = self.action_queue.get()
-                self.process_action(player_id, action)
+        self.scheduler.run(self.run_tick, lambda: self.running)
+
+    async def run_game_loop_async(self):
+        """
+        the asyncio task version of run_game_loop
+        """
+        await self.scheduler.run_async(self.run_tick, lambda: self.running)
 
-            bullet_hits = self.game.update_bullets()
-            for bullet_hit in bullet_hits:
-                self.handle_hit(bullet_hit)
-            pygame.time.Clock().tick(60)
+    def run_tick(self):
+        """
+        Run a single game tick of every room: clean up the clients that went quiet, apply the queued actions,
+        move the bullets, handle their hits, and send a snapshot every SNAPSHOT_TICK_INTERVAL ticks. Every part
+        is timed by the scheduler's stats, summed over all of the rooms. Rooms whose match is over are closed
+        afterwards.
+        """
+        stats = self.scheduler.stats
+        self.tick += 1
+        with stats.phase('actions'):
+            self.apply_disconnects()
+            current_rooms = list(self.rooms)
+            for room in current_rooms:
+                for player_id, action in room.actions.drain():
+                    self.process_action(room, player_id, action)
+
+        with stats.phase('bullets'):
+            bullet_hits = [self.step_room(room) for room in current_rooms]
+
+        with stats.phase('broadcast'):
+            for room, room_hits in zip(current_rooms, bullet_hits):
+                try:
+                    for bullet_hit in room_hits:
+                        self.handle_hit(room, bullet_hit)
+
+                    room.tick += 1
+                    if room.tick % SNAPSHOT_TICK_INTERVAL == 0:
+                        self.broadcast_snapshot(room)
+                except Exception as e:
+                    # a broken room must not stop the scheduler, which runs every other room as well
+                    logger.error(f"caught expedition while broadcasting room {room.room_id}: {e}")
+
+        with stats.phase('send'):
+            self.flush_outboxes()
+            if self.replays and self.tick % replay.FLUSH_TICK_INTERVAL == 0:
+                self.replays.flush()
+
+        for room in current_rooms:
+            if room.check_for_game_over():
+                logger.info(f"The game in room {room.room_id} is over!")
+                self.close_room(room)
+        self.release_closed_clients()
+
+    def step_room(self, room):
+        """
+        Step the game of a room, an error is logged instead of stopping the ticks of the other rooms.
+        :param room: the Room to step
+        :return: the bullet hits of the step
+        """
+        try:
+            return room.game.step()
+        except Exception as e:
+            logger.error(f"caught expedition while stepping room {room.room_id}: {e}")
+            return []
 
-    def handle_hit(self, bullet_hit):
+    def close_room(self, room):
+        """
+        Close a room and disconnect its clients, the other rooms keep playing. The connections are kept until
+        the clients acknowledged the reliable messages they were sent, like the hit that ended the match, or for
+        CLOSED_ROOM_LINGER seconds at most. A client of the closed room that sends again afterwards is put in a
+        new room.
+        :param room: the Room to close
+        """
+        release_time = time.monotonic() + CLOSED_ROOM_LINGER
+        for client_id in self.rooms.close(room):
+            self.closing[client_id] = release_time
+
+    def release_closed_clients(self):
+        """
+        Remove the connections of the finished matches' clients that acknowledged everything, or waited long enough.
+        """
+        now = time.monotonic()
+        for client_id, release_time in list(self.closing.items()):
+            connection = self.connections.get(client_id)
+            if connection is None or not connection.reliable.unacked or now >= release_time:
+                self.connections.remove(client_id)
+                del self.closing[client_id]
+
+    def handle_hit(self, room, bullet_hit):
         """
         Process a bullet hit by determining the impacted player and sending the damage
-        action to all clients.
+        action to all of the room's clients.
+        :param room: the Room the hit happened in
         :param bullet_hit: a tuple containing the player ID and the bullet damage
         """
         player_id = bullet_hit[0]
         bullet_damage = bullet_hit[1]
+        # the hp left is sent as well, so a hit that arrives after a snapshot already showed it isn't applied twice
         action = {'type': HIT_PLAYER,
-                  'action_parameters': [bullet_damage],
+                  'action_parameters': [bullet_damage, room.game.get_player(player_id).hp],
                   }
-        self.broadcast_game_action(player_id, action)
+        # clients that don't see the player get its hp with the next snapshot
+        self.broadcast_game_action(room, player_id, action, only_visible=USE_AREA_OF_INTEREST, reliable=True)
         print("Detected and sent hit!")
 
-    def process_action(self, player_id, action):
+    def process_action(self, room, player_id, action):
         """
         Handle an action received from a client based on the action type (e.g., move, shoot,
-        or create player), and propagate it to relevant clients or update game state accordingly.
+        or create player) and update the game state of its room accordingly. Moves and shoots reach the other
+        clients through the next snapshot instead of being echoed one by one.
+        :param room: the Room the player is in
         :param player_id: the unique ID of the player who initiated the action
         :param action: the data received
         """
@@ -240,47 +409,64 @@ class CommandsServer:
             action_type = action[ACTION_TYPE]
             if action_type == MOVE_PLAYER:
                 player_x, player_y = action[ACTION_PARAMETERS][0], action[ACTION_PARAMETERS][1]
-                self.game.set_cords(player_id, player_x, player_y)
+                # recorded before it is applied, so the game never has a move its replay is missing
+                if room.replay:
+                    room.replay.record_action(room.game.clock.tick, player_id, action_type, [player_x, player_y])
+                room.game.set_cords(player_id, player_x, player_y)
             elif action_type == SHOOT_PLAYER:
                 dx, dy = action[ACTION_PARAMETERS]  # Unpacking the parameters
-                self.game.shoot_player(player_id, dx, dy)
-
-            if action_type == PLAYER_INIT:
-                self.handle_player_init(action, action_type, player_id)
-            else:
-                # Broadcast the action to all clients
-                self.broadcast_game_action(
-                    player_id,
-                    action
-                )
+                if room.replay:
+                    room.replay.record_action(room.game.clock.tick, player_id, action_type, [dx, dy])
+                bullet = room.game.shoot_player(player_id, dx, dy)
+                if bullet:
+                    room.new_bullets.append((player_id, bullet.x, bullet.y, dx, dy))
+            elif action_type == SNAPSHOT_ACK:
+                room.snapshots.acknowledge(player_id, action[ACTION_PARAMETERS][0])
+            elif action_type == PLAYER_INIT:
+                self.handle_player_init(room, action, action_type, player_id)
 
         except Exception as e:
             logger.error(f"caught expedition: {e}")
 
-    def handle_player_init(self, action, action_type, player_id):
+    def handle_player_init(self, room, action, action_type, player_id):
         """
-        send the client his own character, and all the other client
+        send the client his own character, and all the other client of its room
+        :param room:
         :param action:
         :param action_type:
         :param player_id:
         :return:
         """
         character_name = action[ACTION_PARAMETERS][0]
-        x, y = self.game.create_player(player_id, character_name)
-        logger.info(f"Created player named {character_name} in: {x},{y}")
+        x, y = room.game.create_player(player_id, character_name)
+        if room.replay:
+            room.replay.record_action(room.game.clock.tick, player_id, action_type, [character_name, x, y])
+        logger.info(f"Created player named {character_name} in room {room.room_id} in: {x},{y}")
         self.broadcast_game_action(
+            room,
             player_id,
-            {ACTION_TYPE: action_type, ACTION_PARAMETERS: [character_name, x, y]}
+            {ACTION_TYPE: action_type, ACTION_PARAMETERS: [character_name, x, y]},
+            reliable=True
         )
         # After sending the client his own character, send all other clients
-        for other_client_id, other_client_socket in self.clients.items():
-            if other_client_id != player_id:
-                player = self.game.get_player(other_client_id)
-                action = {ACTION_TYPE: PLAYER_INIT,
-                          ACTION_PARAMETERS: [player.name, player.x, player.y],
-                          'player_id': other_client_id
-                          }
-                self.send_message(self.clients[player_id], action)
+        connection = self.connections.get(player_id)
+        for other_client_id in list(room.client_ids):
+            if other_client_id != player_id and other_client_id in room.game.players:
+                self.send_player(connection, room, other_client_id)
+
+    def send_player(self, connection, room, player_id):
+        """
+        send a client another player's character and current position
+        :param connection: the Connection of the client
+        :param room: the Room both of them are in
+        :param player_id: the player to send
+        """
+        player = room.game.get_player(player_id)
+        action = {ACTION_TYPE: PLAYER_INIT,
+                  ACTION_PARAMETERS: [player.name, player.x, player.y],
+                  'player_id': player_id
+                  }
+        self.send_message(connection, action, reliable=True)
 
     def cleanup_client(self, player_id):
         """
@@ -289,35 +475,186 @@ class CommandsServer:
         :param player_id: the unique ID of the client to clean up
         """
 
-        if player_id in self.clients:
-            del self.clients[player_id]
-            del self.last_active[player_id]
-            self.game.delete_player(player_id)
+        if self.connections.remove(player_id):
+            self.closing.pop(player_id, None)
+            room = self.rooms.remove_client(player_id)
+            if room is not None:  # an empty Room is falsy
+                room.snapshots.forget_client(player_id)
+                room.interest.forget_client(player_id)
+                room.actions.forget_client(player_id)
+                if room.replay:
+                    room.replay.record_leave(room.game.clock.tick, player_id)
+                room.game.delete_player(player_id)
+                if not room.client_ids:
+                    self.rooms.close(room)  # recycle rooms which everyone left
             logger.info(f"Cleaned up data for disconnected client {player_id}.")
 
-    def broadcast_game_action(self, player_id, action):
+    def broadcast_snapshot(self, room):
         """
-        Broadcast a game action to all connected clients, including details of the player
+        Take a snapshot of a room's world and send every client of the room its delta against the last snapshot
+        it acknowledged. The ids in each delta are from the receiving client's point of view, its own player is '0'.
+        With the area of interest, a client only gets the moves and shots of the players around it, and a player
+        entering its area is sent again, so it appears where it is instead of walking there from where it was
+        last seen, and its whole state (with its hp) is in the same delta. A player leaving the area is sent once
+        more, with the move that took it away, and the client is told to hide it. The snapshots keep bringing the
+        client the hp of the players it doesn't see, so it still knows who is alive.
+        :param room: the Room to snapshot
+        """
+        room.snapshots.take_snapshot(room.game.players, room.new_bullets)
+        room.new_bullets = []
+        entered, left = room.interest.update(room.game.players, room.client_ids) if USE_AREA_OF_INTEREST else ({}, {})
+        for connection in self.room_connections(room):
+            client_id = connection.client_id
+            client_entered = entered.get(client_id, ())
+            for player_id in client_entered:
+                self.send_player(connection, room, player_id)
+            for player_id in left.get(client_id, ()):
+                # on the reliable channel, so it stays in order with the player_init of the player coming back
+                self.send_message(connection, {ACTION_TYPE: LEAVE_VIEW, ACTION_PARAMETERS: [],
+                                               'player_id': as_seen_by(client_id, player_id)}, reliable=True)
+            visible = room.interest.visible.get(client_id) if USE_AREA_OF_INTEREST else None
+            snapshot_id, baseline_id, changed, removed, bullets = room.snapshots.build_delta(client_id, visible,
+                                                                                             client_entered)
+            changed = [[as_seen_by(client_id, player[0]), *player[1:]] for player in changed]
+            removed = [as_seen_by(client_id, removed_id) for removed_id in removed]
+            bullets = [[bullet[0], as_seen_by(client_id, bullet[1]), *bullet[2:]] for bullet in bullets]
+            action = {ACTION_TYPE: SNAPSHOT,
+                      ACTION_PARAMETERS: [snapshot_id, baseline_id, changed, removed, bullets],
+                      'player_id': '0'
+                      }
+            self.send_message(connection, action)
+
+    def broadcast_game_action(self, room, player_id, action, only_visible=False, reliable=False):
+        """
+        Broadcast a game action to all of a room's clients, including details of the player
         and the action to be taken.
+        :param room: the Room whose clients get the action
         :param player_id: the unique ID of the player associated with the action
         :param action: the data to be broadcast
+        :param only_visible: only send the action to the clients whose area of interest has the player
+        :param reliable: send the action on the clients' reliable channels
+        """
+        encoded = None  # the binary encoding is done once, only the session and player id differ per client
+        for connection in self.room_connections(room):
+            if only_visible and not room.interest.is_visible(connection.client_id, player_id):
+                continue
+            seen_player_id = as_seen_by(connection.client_id, player_id)
+            if connection.encoding == protocol.ENCODING_BINARY:
+                if encoded is None:
+                    encoded = protocol.encode_binary_message(action)
+                data = protocol.patch_binary_message(encoded, connection.session, seen_player_id)
+                if reliable and connection.reliable.active:
+                    data = connection.reliable.wrap(data, connection.session)
+                connection.outbox.append(data)
+            else:
+                action_with_id = action.copy()
+                action_with_id['player_id'] = seen_player_id
+                # logger.info(f"Sent message to client id: {connection.client_id}. the message: {action}")
+                self.send_message(connection, action_with_id, reliable)
+
+    def room_connections(self, room):
         """
-        for client_id, client_socket in self.clients.items():
-            action_with_id = action.copy()
-            action_with_id['player_id'] = '0' if client_id == player_id else player_id
-            # logger.info(f"Sent message to client id: {client_id}. the message: {action}")
-            self.send_message(client_socket, action_with_id)
+        :param room: a Room
+        :return: list of the connections of the room's clients
+        """
+        room_connections = []
+        for client_id in list(room.client_ids):
+            connection = self.connections.get(client_id)
+            if connection:
+                room_connections.append(connection)
+        return room_connections
+
+    def send_message(self, connection, message, reliable=False):
+        """
+        Queue a message to a specific client, in the encoding it negotiated and with its session token.
+        It is sent at the end of the tick, bundled with the client's other messages.
+        :param connection: the client's Connection
+        :param message: the message data to be sent
+        :param reliable: send the message on the client's reliable channel, until the client acks it.
+                         clients that never used the reliable channel get it as a plain message
+        """
+        message[protocol.SESSION] = connection.session
+        data = protocol.encode_message(message, connection.encoding)
+        if reliable and connection.reliable.active:
+            data = connection.reliable.wrap(data, connection.session)
+        connection.outbox.append(data)
+
+    def flush_outboxes(self):
+        """
+        Send every client the messages queued for it during the tick, packed into as few datagrams as possible.
+        The reliable messages the client didn't ack in time are sent again, and the ack of the reliable messages
+        the client sent rides along with them.
+        """
+        for connection in self.connections:
+            connection.outbox.extend(connection.reliable.due_retransmissions())
+            ack = connection.reliable.build_ack(connection.session)
+            if ack:
+                connection.outbox.append(ack)
+            if connection.outbox:
+                for data in protocol.bundle_messages(connection.outbox, connection.encoding):
+                    self.transport.sendto(data, connection.address)
+                    connection.record_sent(len(data))
+                connection.outbox = []
+
+
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        """
+        Initialize the datagram protocol of the asyncio server mode.
+        :param server: the CommandsServer the datagrams are handed to
+        """
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        """
+        Hand a received datagram to the server.
+        :param data: the datagram
+        :param addr: the address of the client who sent it
+        """
+        self.server.handle_datagram(data, addr)
 
-    def send_message(self, client_address, message):
+    def error_received(self, exc):
         """
-        Send a message to a specific client using their address.
-        :param client_address: the socket address of the client
-        :param message: the message data to be sent, in JSON format
+        Log socket errors, such as the connection reset errors caused by clients that closed.
+        :param exc: the error
         """
-        message_str = json.dumps(message)
-        message_length = len(message_str)
-        full_message = str(message_length) + MESSAGE_DIVIDER + message_str
-        self.server_socket.sendto(full_message.encode(), client_address)
+        logger.info(f"Having socket error as: {exc}, trying again")
+
+
+def as_seen_by(client_id, player_id):
+    """
+    Translate a player id to the id a specific client knows it by.
+    :param client_id: the client receiving the message
+    :param player_id: the player the message is about
+    :return: '0' if the player is the client itself, otherwise the player id
+    """
+    return '0' if player_id == client_id else player_id
+
+
+def is_integer(value):
+    """
+    :param value: a value of a message
+    :return: True if the value is an int, bool isn't counted as one
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_number(value):
+    """
+    :param value: a value of a message
+    :return: True if the value is a finite int or float
+    """
+    return (is_integer(value) or isinstance(value, float)) and math.isfinite(value)
+
+
+def is_coordinate(value, size):
+    """
+    :param value: a coordinate of a message
+    :param size: the map's size on the coordinate's axis
+    :return: True if the coordinate is an int inside of the map, and fits the binary snapshots
+    """
+    return (is_integer(value) and 0 <= value <= size
+            and WIRE_COORDINATE_RANGE[0] <= value <= WIRE_COORDINATE_RANGE[1])
 
 
 def validate_json_game_update(game_update):
@@ -325,10 +662,19 @@ def validate_json_game_update(game_update):
         logger.error("invalid message: Message is not a dictionary")
         return False
 
+    # the session is looked up in the connection table, so it has to be a token that could come from the header
+    session = game_update.get(protocol.SESSION, connections.NO_SESSION)
+    if not is_integer(session) or not connections.NO_SESSION <= session <= connections.MAX_SESSION:
+        logger.error(f"invalid message: Invalid session {session!r}")
+        return False
+
     if ACTION_TYPE not in game_update or game_update[ACTION_TYPE] not in [MOVE_PLAYER,
                                                                           SHOOT_PLAYER,
                                                                           PLAYER_INIT,
-                                                                          HIT_PLAYER]:
+                                                                          HIT_PLAYER,
+                                                                          SNAPSHOT_ACK,
+                                                                          RELIABLE,
+                                                                          ACK]:
         logger.error("invalid message: Invalid or missing 'type' in message")
         return False
 
@@ -336,13 +682,48 @@ def validate_json_game_update(game_update):
         logger.error("invalid message: Missing 'action_parameters' in message")
         return False
 
+    # moves and shoots are checked here, a bad value would break the snapshots of the player's whole room
+    if game_update[ACTION_TYPE] == MOVE_PLAYER:
+        parameters = game_update[ACTION_PARAMETERS]
+        if not isinstance(parameters, list) or len(parameters) != 2 or not all(
+                is_coordinate(value, size) for value, size in zip(parameters, GameLogic.MAP_DATA.size)):
+            logger.error(f"invalid message: Invalid move parameters {parameters}")
+            return False
+
+    if game_update[ACTION_TYPE] == SHOOT_PLAYER:
+        parameters = game_update[ACTION_PARAMETERS]
+        if not isinstance(parameters, list) or len(parameters) != 2 or not all(
+                is_number(value) for value in parameters):
+            logger.error(f"invalid message: Invalid shoot parameters {parameters}")
+            return False
+
+    if game_update[ACTION_TYPE] == SNAPSHOT_ACK:
+        parameters = game_update[ACTION_PARAMETERS]
+        if not isinstance(parameters, list) or len(parameters) != 1 or not is_integer(parameters[0]):
+            logger.error(f"invalid message: Invalid snapshot ack parameters {parameters}")
+            return False
+
+    # unknown characters are rejected here, before the game thread ever sees them
+    if game_update[ACTION_TYPE] == PLAYER_INIT:
+        parameters = game_update[ACTION_PARAMETERS]
+        if not isinstance(parameters, list) or len(parameters) != 1 or not isinstance(parameters[0], str) \
+                or parameters[0] not in GameLogic.CHARACTERS:
+            logger.error(f"invalid message: Unknown character in {parameters}")
+            return False
+
+    if game_update[ACTION_TYPE] in (RELIABLE, ACK):
+        parameters = game_update[ACTION_PARAMETERS]
+        if not reliability.validate_parameters(game_update[ACTION_TYPE], parameters):
+            logger.error(f"invalid message: Invalid reliable channel parameters {parameters}")
+            return False
+
     return True
 
 
 if __name__ == "__main__":
     valid_message = {
         ACTION_TYPE: PLAYER_INIT,
-        ACTION_PARAMETERS: "[DarkNinja]",
+        ACTION_PARAMETERS: ["Shadow"],
     }
     invalid_message = {
         ACTION_TYPE: 'move_player',  # invalid action type
@@ -351,5 +732,11 @@ if __name__ == "__main__":
     assert validate_json_game_update(valid_message)
     logger.info("Ignore the next error message, just assertion purpose")
     assert not validate_json_game_update(invalid_message)
+    assert validate_json_game_update({ACTION_TYPE: RELIABLE, ACTION_PARAMETERS: [1, valid_message]})
+    assert not validate_json_game_update({ACTION_TYPE: RELIABLE, ACTION_PARAMETERS: [1, None]})
+    assert not validate_json_game_update({ACTION_TYPE: ACK, ACTION_PARAMETERS: [2 ** 32, 0]})
     cmd_server = CommandsServer()
-    cmd_server.start_server()
+    if USE_ASYNCIO_SERVER:
+        asyncio.run(cmd_server.start_async_server())
+    else:
+        cmd_server.start_server()
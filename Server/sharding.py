@@ -0,0 +1,456 @@
+"""
+Author: Yoni Reichert
+Program name: sharding.py
+Description: Runs the rooms across a pool of worker processes. The front process owns the UDP socket and passes
+             the datagrams to the workers through shared memory ring buffers, and the collision maps are placed
+             in shared memory once, so every worker uses the same copy of them
+Date: 17-10-2026
+"""
+
+import logging
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+from threading import Thread
+import numpy as np
+
+# the protocol module is shared with the client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+import protocol
+import GameLogic
+import connections
+import server
+from CollisionMap import CollisionMap, SpawnIndex
+
+logger = logging.getLogger("sharding")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+WORKER_COUNT = os.cpu_count() or 1
+RING_CAPACITY = 1 << 20  # bytes of datagrams every ring buffer holds
+POLL_INTERVAL = 0.001  # seconds the front waits when none of the workers has anything to send
+
+# every datagram going to a worker is preceded by: client id, session, ip, port, whether the client talks binary
+INBOUND_RECORD = struct.Struct('!II4sHB')
+# every datagram coming from a worker is preceded by the ip and port to send it to
+OUTBOUND_RECORD = struct.Struct('!4sH')
+
+RECORD_LENGTH = struct.Struct('<I')
+WRAP_MARKER = 0xFFFFFFFF  # a record length meaning the rest of the ring is empty, continue from its start
+RING_HEADER_SIZE = 16  # the write and read counters
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class RingBuffer:
+    def __init__(self, capacity=RING_CAPACITY, name=None):
+        """
+        Initialize a ring buffer of length prefixed records in shared memory, for one writing process
+        and one reading process. The header holds two ever growing byte counters, where the writer has
+        written up to and where the reader has read up to.
+        :param capacity: the size of the records area in bytes, only used when creating the buffer
+        :param name: the name of an existing buffer to attach to, None creates a new one
+        """
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=RING_HEADER_SIZE + capacity)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.capacity = self.memory.size - RING_HEADER_SIZE
+        self.counters = np.ndarray((2,), dtype=np.uint64, buffer=self.memory.buf)  # [written, read]
+        self.data = self.memory.buf[RING_HEADER_SIZE:RING_HEADER_SIZE + self.capacity]
+        if name is None:
+            self.counters[:] = 0
+
+    def put(self, *parts):
+        """
+        Write a record made of the given parts.
+        :param parts: bytes-like objects, written one after the other
+        :return: True if the record was written, False if the buffer is too full for it
+        """
+        length = sum(len(part) for part in parts)
+        written, read = int(self.counters[0]), int(self.counters[1])
+        position = written % self.capacity
+        padding = 0
+        if position + RECORD_LENGTH.size + length > self.capacity:
+            padding = self.capacity - position  # the record doesn't fit at the end, write it at the start
+        if padding + RECORD_LENGTH.size + length > self.capacity - (written - read):
+            return False
+
+        if padding:
+            if padding >= RECORD_LENGTH.size:
+                RECORD_LENGTH.pack_into(self.data, position, WRAP_MARKER)
+            position = 0
+        RECORD_LENGTH.pack_into(self.data, position, length)
+        position += RECORD_LENGTH.size
+        for part in parts:
+            self.data[position:position + len(part)] = part
+            position += len(part)
+        # the counter is moved last, so the reader never sees a half written record
+        self.counters[0] = written + padding + RECORD_LENGTH.size + length
+        return True
+
+    def get(self):
+        """
+        Read the next record.
+        :return: the record's bytes, None if the buffer is empty
+        """
+        written, read = int(self.counters[0]), int(self.counters[1])
+        while read != written:
+            position = read % self.capacity
+            left = self.capacity - position
+            if left < RECORD_LENGTH.size:
+                read += left
+                continue
+            length, = RECORD_LENGTH.unpack_from(self.data, position)
+            if length == WRAP_MARKER:
+                read += left
+                continue
+            start = position + RECORD_LENGTH.size
+            record = bytes(self.data[start:start + length])
+            self.counters[1] = read + RECORD_LENGTH.size + length
+            return record
+        self.counters[1] = read
+        return None
+
+    def close(self, unlink=False):
+        """
+        Detach from the buffer.
+        :param unlink: also free the shared memory, done by the process that created it
+        """
+        del self.counters
+        self.data.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class RingTransport:
+    def __init__(self, ring):
+        """
+        Stands in for the socket of a worker's server, every datagram is passed to the front process to send.
+        :param ring: the RingBuffer from the worker to the front process
+        """
+        self.ring = ring
+        self.dropped = 0
+
+    def sendto(self, data, address):
+        """
+        Pass a datagram to the front process, it is dropped if the ring is full like a full socket buffer would.
+        :param data: the datagram
+        :param address: the client's (ip, port)
+        """
+        if not self.ring.put(OUTBOUND_RECORD.pack(socket.inet_aton(address[0]), address[1]), data):
+            self.dropped += 1
+
+    def close(self):
+        pass
+
+
+class WorkerServer(server.CommandsServer):
+    def __init__(self, inbound, outbound, tick_rate=server.TICK_RATE):
+        """
+        Initialize the server running inside a worker process. It doesn't have a socket of its own,
+        it gets its datagrams from the front process and gives them back to it to send.
+        :param inbound: the RingBuffer from the front process
+        :param outbound: the RingBuffer to the front process
+        :param tick_rate: how many game ticks to run every second
+        """
+        super().__init__(tick_rate)
+        self.server_socket.close()
+        self.inbound = inbound
+        self.transport = RingTransport(outbound)
+        self.next_timeout_check = 0
+
+    def receive_forwarded(self):
+        """
+        Queue every datagram the front process forwarded since the last tick.
+        """
+        record = self.inbound.get()
+        while record is not None:
+            client_id, session, ip, port, is_binary = INBOUND_RECORD.unpack_from(record)
+            data = record[INBOUND_RECORD.size:]
+            address = (socket.inet_ntoa(ip), port)
+            game_updates, _ = protocol.decode_datagram(data)
+            game_updates = [update for update in game_updates if server.validate_json_game_update(update)]
+            if game_updates:
+                connection = self.connections.get(client_id)
+                if not connection:
+                    encoding = protocol.ENCODING_BINARY if is_binary else protocol.ENCODING_JSON
+                    connection = self.connections.add(address, encoding, client_id, session)
+                elif connection.address != address:
+                    self.connections.rebind(connection, address)
+                connection.record_received(len(data))
+                for game_update in game_updates:
+                    self.queue_game_update(connection, game_update)
+            record = self.inbound.get()
+
+    def run_worker_tick(self):
+        """
+        Run a single tick of the worker: take the forwarded datagrams, run the tick of every room,
+        and disconnect inactive clients every TIMEOUT_CHECK_INTERVAL.
+        """
+        self.receive_forwarded()
+        self.run_tick()
+        now = time.monotonic()
+        if now >= self.next_timeout_check:
+            self.next_timeout_check = now + server.TIMEOUT_CHECK_INTERVAL
+            self.disconnect_inactive_clients()
+
+
+def share_array(array):
+    """
+    Copy an array into a new block of shared memory.
+    :param array: the numpy array
+    :return: the SharedMemory, and a picklable description other processes attach to it with
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+def attach_array(description):
+    """
+    Attach to an array another process shared.
+    :param description: the description share_array returned
+    :return: the SharedMemory, which must stay open while the array is used, and the array
+    """
+    name, shape, dtype = description
+    memory = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+    array.flags.writeable = False
+    return memory, array
+
+
+def share_map_data():
+    """
+    Load the map data once and place the collision maps, their summed-area tables and the spawn index of
+    the players in shared memory.
+    :return: list of the SharedMemory blocks, and the picklable description of the map data
+    """
+    memories = []
+    description = {'size': GameLogic.MAP_DATA.size}
+    spawn_index = GameLogic.get_spawn_index(GameLogic.CHARACTER_WIDTH, GameLogic.CHARACTER_HEIGHT)
+    arrays = {
+        'player_blocked': GameLogic.MAP_DATA.player_collision_map.blocked,
+        'player_table': GameLogic.MAP_DATA.player_collision_map.table,
+        'bullet_blocked': GameLogic.MAP_DATA.bullet_collision_map.blocked,
+        'bullet_table': GameLogic.MAP_DATA.bullet_collision_map.table,
+        'spawn_positions': spawn_index.positions,
+    }
+    for name, array in arrays.items():
+        memory, description[name] = share_array(array)
+        memories.append(memory)
+    return memories, description
+
+
+def install_shared_map_data(description):
+    """
+    Make this process's GameLogic use the map data in shared memory instead of loading its own.
+    :param description: the description share_map_data returned
+    :return: list of the SharedMemory blocks, which must stay open while the game runs
+    """
+    memories = []
+    arrays = {}
+    for name in ('player_blocked', 'player_table', 'bullet_blocked', 'bullet_table', 'spawn_positions'):
+        memory, arrays[name] = attach_array(description[name])
+        memories.append(memory)
+    player_collision_map = CollisionMap(arrays['player_blocked'], arrays['player_table'])
+    bullet_collision_map = CollisionMap(arrays['bullet_blocked'], arrays['bullet_table'])
+    GameLogic.MAP_DATA.install(description['size'], player_collision_map, bullet_collision_map)
+    key = (GameLogic.CHARACTER_WIDTH, GameLogic.CHARACTER_HEIGHT)
+    GameLogic.SPAWN_INDEXES[key] = SpawnIndex(player_collision_map, *key, positions=arrays['spawn_positions'])
+    return memories
+
+
+def run_worker(worker_index, map_description, inbound_name, outbound_name, stop_event, tick_rate):
+    """
+    The entry point of a worker process, runs rooms until the front process stops it.
+    :param worker_index: the worker's index, for the log
+    :param map_description: the description of the map data in shared memory
+    :param inbound_name: the name of the RingBuffer from the front process
+    :param outbound_name: the name of the RingBuffer to the front process
+    :param stop_event: a multiprocessing Event set when the worker should stop
+    :param tick_rate: how many game ticks to run every second
+    """
+    memories = install_shared_map_data(map_description)
+    inbound = RingBuffer(name=inbound_name)
+    outbound = RingBuffer(name=outbound_name)
+    worker = WorkerServer(inbound, outbound, tick_rate)
+    logger.info(f"Worker {worker_index} started")
+    try:
+        worker.scheduler.run(worker.run_worker_tick, lambda: not stop_event.is_set())
+    except KeyboardInterrupt:
+        pass  # the front process stops the workers
+    finally:
+        worker.stop_replays()
+        inbound.close()
+        outbound.close()
+        for memory in memories:
+            memory.close()
+        logger.info(f"Worker {worker_index} stopped")
+
+
+class ShardedServer:
+    def __init__(self, worker_count=WORKER_COUNT, tick_rate=server.TICK_RATE):
+        """
+        Initialize the front process of the sharded server, it owns the socket and the connection table,
+        and every client is given to the worker with the fewest clients when it first connects.
+        :param worker_count: how many worker processes run rooms
+        :param tick_rate: how many game ticks every worker runs every second
+        """
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.settimeout(1.0)
+        self.receive_buffer = bytearray(protocol.MAX_DATAGRAM_SIZE)
+        self.receive_view = memoryview(self.receive_buffer)
+        self.worker_count = worker_count
+        self.tick_rate = tick_rate
+        self.connections = connections.ConnectionTable(server.DISCONNECT_TIMEOUT, server.TIMEOUT_CHECK_INTERVAL)
+        self.worker_of_client = {}  # client id -> worker index
+        self.worker_loads = [0] * worker_count  # how many clients every worker has
+        self.inbound_rings = []
+        self.outbound_rings = []
+        self.workers = []
+        self.memories = []
+        self.stop_event = None
+        self.running = True
+        self.threads = []
+        self.dropped = 0
+
+    def start_server(self):
+        """
+        Share the map data, start the worker processes, and forward datagrams between the socket
+        and the workers until the server is stopped.
+        """
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        try:
+            self.memories, map_description = share_map_data()
+            for worker_index in range(self.worker_count):
+                inbound, outbound = RingBuffer(), RingBuffer()
+                self.inbound_rings.append(inbound)
+                self.outbound_rings.append(outbound)
+                worker = context.Process(target=run_worker,
+                                         args=(worker_index, map_description, inbound.name, outbound.name,
+                                               self.stop_event, self.tick_rate),
+                                         daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+            logger.info(f"Sharded server started with {self.worker_count} workers, "
+                        f"listening on {server.SERVER_IP}:{server.SERVER_PORT}")
+            self.server_socket.bind((server.SERVER_IP, server.SERVER_PORT))
+            for target in (self.handle_clients_messages, self.send_worker_messages, self.check_for_timeouts):
+                thread = Thread(target=target)
+                self.threads.append(thread)
+                thread.start()
+
+            while self.running:
+                time.sleep(server.GAME_CHECKING_DELAY)
+        except Exception as e:
+            logger.error(f"Caught an expedition while running the sharded server: {e}")
+        finally:
+            logger.info("The sharded server is stopping! stopping all threads and workers")
+            self.running = False
+            self.stop_event.set()
+            for thread in self.threads:
+                thread.join()
+            for worker in self.workers:
+                worker.join()
+            for ring in self.inbound_rings + self.outbound_rings:
+                ring.close(unlink=True)
+            for memory in self.memories:
+                memory.close()
+                memory.unlink()
+            self.server_socket.close()
+            logger.info("All of the threads and workers stopped!")
+
+    def stop(self):
+        """
+        Stop the server and its workers.
+        """
+        self.running = False
+
+    def handle_clients_messages(self):
+        """
+        receive the clients' datagrams into the receive buffer and forward each of them to its client's worker,
+        every datagram already waiting is forwarded in the same wakeup
+        """
+        while self.running:
+            try:
+                size, client_address = self.server_socket.recvfrom_into(self.receive_buffer)
+                self.forward_datagram(self.receive_view[:size], client_address)
+                while self.running and select.select([self.server_socket], [], [], 0)[0]:
+                    size, client_address = self.server_socket.recvfrom_into(self.receive_buffer)
+                    self.forward_datagram(self.receive_view[:size], client_address)
+            except socket.timeout:
+                continue
+            except ConnectionResetError as cr:
+                logger.info(f"Having connection reset error as: {cr}, trying again")
+
+    def forward_datagram(self, data, client_address):
+        """
+        Find the client a datagram belongs to and pass the datagram to its worker, which decodes it again.
+        Invalid datagrams are dumped here, so they never reach a worker.
+        :param data: the datagram
+        :param client_address: the client who sent it
+        """
+        game_updates, encoding = protocol.decode_datagram(data)
+        game_updates = [update for update in game_updates if server.validate_json_game_update(update)]
+        if not game_updates:
+            return
+        connection = self.connections.lookup(client_address, game_updates[0].get(protocol.SESSION,
+                                                                                 connections.NO_SESSION))
+        if not connection:
+            connection = self.connections.add(client_address, encoding)
+            worker_index = self.worker_loads.index(min(self.worker_loads))
+            self.worker_of_client[connection.client_id] = worker_index
+            self.worker_loads[worker_index] += 1
+        connection.record_received(len(data))
+
+        header = INBOUND_RECORD.pack(connection.client_id, connection.session,
+                                     socket.inet_aton(connection.address[0]), connection.address[1],
+                                     connection.encoding == protocol.ENCODING_BINARY)
+        if not self.inbound_rings[self.worker_of_client[connection.client_id]].put(header, data):
+            self.dropped += 1
+
+    def send_worker_messages(self):
+        """
+        send the datagrams the workers produced, waiting POLL_INTERVAL whenever none of them has any
+        """
+        while self.running:
+            sent = False
+            for ring in self.outbound_rings:
+                record = ring.get()
+                while record is not None:
+                    ip, port = OUTBOUND_RECORD.unpack_from(record)
+                    try:
+                        self.server_socket.sendto(record[OUTBOUND_RECORD.size:], (socket.inet_ntoa(ip), port))
+                    except OSError as e:
+                        logger.info(f"Having socket error as: {e}, trying again")
+                    sent = True
+                    record = ring.get()
+            if not sent:
+                time.sleep(POLL_INTERVAL)
+
+    def check_for_timeouts(self):
+        """
+        forget the clients which didn't send a message for the disconnect timeout,
+        their workers disconnect them on their own
+        """
+        while self.running:
+            for connection in self.connections.expired(time.time()):
+                if self.connections.remove(connection.client_id):
+                    self.worker_loads[self.worker_of_client.pop(connection.client_id)] -= 1
+            time.sleep(server.TIMEOUT_CHECK_INTERVAL)
+
+
+if __name__ == "__main__":
+    sharded_server = ShardedServer()
+    sharded_server.start_server()
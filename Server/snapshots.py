@@ -0,0 +1,134 @@
+"""
+Author: Yoni Reichert
+Program name: snapshots.py
+Description: Keeps the recent world snapshots of the server and builds the delta each client should receive
+Date: 17-10-2026
+"""
+
+from collections import deque
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+# how many snapshots are kept as possible baselines, a client that acked something older gets a full snapshot
+SNAPSHOT_HISTORY_SIZE = 64
+
+# snapshot id 0 means "no baseline", the first snapshot taken is 1
+FULL_SNAPSHOT_BASELINE = 0
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class SnapshotHistory:
+    def __init__(self, history_size=SNAPSHOT_HISTORY_SIZE):
+        """
+        Initialize an empty history of world snapshots.
+        :param history_size: the number of snapshots to keep as baselines
+        """
+        self.history_size = history_size
+        self.snapshots = {}  # snapshot id -> {player id: (x, y, hp)}
+        self.bullets = {}  # snapshot id -> list of [snapshot id, owner id, x, y, dx, dy] shot in that snapshot
+        self.order = deque()
+        self.current_id = FULL_SNAPSHOT_BASELINE
+        self.acks = {}  # client id -> last snapshot id the client acknowledged
+        # client id -> {snapshot id: ({player id: (x, y, hp)} as the client knows it, the players it saw)}
+        self.views = {}
+
+    def take_snapshot(self, players, new_bullets):
+        """
+        Record the state of the world at the current tick.
+        :param players: the game's players dictionary (player id -> Player)
+        :param new_bullets: list of (owner id, x, y, dx, dy) of the bullets shot since the previous snapshot
+        :return: the id of the new snapshot
+        """
+        self.current_id += 1
+        self.snapshots[self.current_id] = {
+            player_id: (int(player.x), int(player.y), player.hp) for player_id, player in players.items()
+        }
+        self.bullets[self.current_id] = [[self.current_id, *bullet] for bullet in new_bullets]
+        self.order.append(self.current_id)
+
+        while len(self.order) > self.history_size:
+            old_id = self.order.popleft()
+            del self.snapshots[old_id]
+            del self.bullets[old_id]
+        return self.current_id
+
+    def acknowledge(self, client_id, snapshot_id):
+        """
+        Mark a snapshot as received by a client, so the next delta can be built against it.
+        :param client_id: the client who sent the acknowledgement
+        :param snapshot_id: the acknowledged snapshot id
+        """
+        if snapshot_id > self.acks.get(client_id, FULL_SNAPSHOT_BASELINE) and snapshot_id <= self.current_id:
+            self.acks[client_id] = snapshot_id
+
+    def forget_client(self, client_id):
+        """
+        Drop the acknowledgement state of a client that left.
+        :param client_id: the client to forget
+        """
+        self.acks.pop(client_id, None)
+        self.views.pop(client_id, None)
+
+    def build_delta(self, client_id, visible=None, forced=()):
+        """
+        Build the delta between the latest snapshot and the last snapshot the client acknowledged.
+        If the acknowledged snapshot is too old (or there is none), the delta is a full snapshot.
+        :param client_id: the client the delta is built for
+        :param visible: set of the player ids the client sees, None if it sees everyone. Players it doesn't see
+                        keep the state the client last got, unless their hp changed, so it still knows who is alive.
+                        Players it saw in the baseline are sent as well, so it gets the move that took them away
+        :param forced: player ids whose whole state is sent even if the baseline has it, like players that just
+                       entered the client's area
+        :return: [snapshot id, baseline id, changed players, removed player ids, new bullets]
+        """
+        current = self.snapshots[self.current_id]
+        baseline_id = self.acks.get(client_id, FULL_SNAPSHOT_BASELINE)
+        baseline_visible = ()
+        if visible is None:
+            baseline = self.snapshots.get(baseline_id)
+        else:
+            baseline, baseline_visible = self.views.get(client_id, {}).get(baseline_id, (None, ()))
+        if baseline is None:
+            baseline_id = FULL_SNAPSHOT_BASELINE
+            baseline = {}
+
+        if visible is None or baseline_id == FULL_SNAPSHOT_BASELINE:
+            view = current
+        else:
+            view = {}
+            for player_id, state in current.items():
+                known = baseline.get(player_id)
+                if (player_id in visible or player_id in baseline_visible
+                        or known is None or known[2] != state[2]):
+                    view[player_id] = state
+                else:
+                    view[player_id] = known
+        if visible is not None:
+            self.remember_view(client_id, view, visible)
+
+        changed = [[player_id, *state] for player_id, state in view.items()
+                   if baseline.get(player_id) != state or player_id in forced]
+        removed = [player_id for player_id in baseline if player_id not in current]
+
+        # a full snapshot only carries the latest bullets, older ones would be replayed from where they were shot
+        bullets = []
+        first_id = baseline_id + 1 if baseline_id != FULL_SNAPSHOT_BASELINE else self.current_id
+        for snapshot_id in range(first_id, self.current_id + 1):
+            bullets.extend(self.bullets[snapshot_id])
+        if visible is not None:
+            bullets = [bullet for bullet in bullets if bullet[1] in visible]
+
+        return [self.current_id, baseline_id, changed, removed, bullets]
+
+    def remember_view(self, client_id, view, visible):
+        """
+        Keep the state a client will know once it gets the latest snapshot, as a baseline for its next deltas.
+        :param client_id: the client
+        :param view: {player id: (x, y, hp)} the client is sent
+        :param visible: set of the player ids the client sees
+        """
+        views = self.views.setdefault(client_id, {})
+        views[self.current_id] = (view, frozenset(visible))
+        for snapshot_id in [snapshot_id for snapshot_id in views if snapshot_id not in self.snapshots]:
+            del views[snapshot_id]
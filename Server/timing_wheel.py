@@ -0,0 +1,69 @@
+"""
+Author: Yoni Reichert
+Program name: timing_wheel.py
+Description: A hashed timing wheel of deadlines, finding the expired ones costs only as much as there are of them
+Date: 17-10-2026
+"""
+
+
+class TimingWheel:
+    def __init__(self, span, granularity):
+        """
+        Initialize an empty wheel. Time is cut into ticks of granularity seconds, and every tick has a slot,
+        reused every span seconds. Deadlines are only ever checked when their slot's tick passes.
+        :param span: the longest usual deadline from now, in seconds, later ones are checked again when they come up
+        :param granularity: the length of a wheel tick in seconds, deadlines are noticed at most this late
+        """
+        self.granularity = granularity
+        self.slots = [{} for _ in range(int(-(-span // granularity)) + 1)]  # slot -> {key: None}
+        self.current_tick = None  # the next wheel tick to check, None until the wheel first advances
+
+    def tick_of(self, time_point):
+        """
+        :param time_point: a time, in seconds
+        :return: the wheel tick the time falls in
+        """
+        return int(time_point // self.granularity)
+
+    def schedule(self, key, deadline):
+        """
+        Put a key in the slot of its deadline. A key whose deadline later moves doesn't have to be scheduled again,
+        when its slot comes up it's put back in the slot of its new deadline.
+        :param key: the key, for example a client id
+        :param deadline: when the key expires, in seconds
+        """
+        tick = self.tick_of(deadline)
+        if self.current_tick is not None:
+            tick = max(tick, self.current_tick)  # a deadline that already passed is checked on the next advance
+        self.slots[tick % len(self.slots)][key] = None
+
+    def advance(self, now, deadline_of):
+        """
+        Check the slots of every tick up to now.
+        :param now: the current time, in seconds
+        :param deadline_of: function returning a key's current deadline, or None if the key was removed
+        :return: list of the keys whose deadline passed, each of them is dropped from the wheel
+        """
+        now_tick = self.tick_of(now)
+        if self.current_tick is None:
+            self.current_tick = now_tick
+        # after a long pause, one turn of the wheel already goes over every slot
+        last_tick = min(now_tick, self.current_tick + len(self.slots) - 1)
+
+        expired = {}
+        for tick in range(self.current_tick, last_tick + 1):
+            index = tick % len(self.slots)
+            slot = self.slots[index]
+            if not slot:
+                continue
+            self.slots[index] = {}
+            for key in slot:
+                deadline = deadline_of(key)
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    expired[key] = None
+                else:
+                    self.slots[max(self.tick_of(deadline), now_tick + 1) % len(self.slots)][key] = None
+        self.current_tick = now_tick + 1
+        return list(expired)
@@ -0,0 +1,96 @@
+"""
+Author: Yoni Reichert
+Program name: CharacterRegistry.py
+Description: Loads the character stats from the Characters.json file once, and again only when the file changes
+Date: 17-10-2026
+"""
+
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+
+logger = logging.getLogger("CharacterRegistry")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+# the least amount of seconds between two checks of the file's modification time
+MTIME_CHECK_INTERVAL = 1.0
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+CharacterStats = namedtuple('CharacterStats', ['name',
+                                               'hp',
+                                               'speed',
+                                               'bullet_speed',
+                                               'bullet_damage',
+                                               'bullet_lifespan',
+                                               'shooting_cooldown'])
+
+
+class CharacterRegistry:
+    def __init__(self, file_path, check_interval=MTIME_CHECK_INTERVAL):
+        """
+        Initialize the registry and load the characters file.
+        :param file_path: path to the characters json file
+        :param check_interval: the least amount of seconds between two checks of the file's modification time
+        """
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self.characters = MappingProxyType({})  # name -> CharacterStats, replaced as a whole on reload
+        self.mtime = None
+        self.next_check_time = 0
+        self.lock = Lock()
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """
+        Parse the characters file again if it was modified since it was last loaded.
+        If the new file is invalid, the previous characters are kept.
+        """
+        now = time.monotonic()
+        if now < self.next_check_time:
+            return
+        with self.lock:
+            self.next_check_time = now + self.check_interval
+            try:
+                mtime = os.stat(self.file_path).st_mtime_ns
+                if mtime == self.mtime:
+                    return
+                with open(self.file_path, 'r') as file:
+                    data = json.load(file)
+                characters = {char_data['name']: CharacterStats(**{field: char_data[field]
+                                                                    for field in CharacterStats._fields})
+                              for char_data in data['characters']}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Failed to load characters from {self.file_path}: {e}")
+                return
+            self.characters = MappingProxyType(characters)
+            self.mtime = mtime
+            logger.info(f"Loaded {len(characters)} characters from {self.file_path}")
+
+    def get(self, name):
+        """
+        Get the stats of a character.
+        :param name: the character's name
+        :return: the CharacterStats of the character
+        """
+        self.reload_if_changed()
+        try:
+            return self.characters[name]
+        except KeyError:
+            raise ValueError(f"No character found with the name {name}")
+
+    def __contains__(self, name):
+        self.reload_if_changed()
+        return name in self.characters
+
+    def names(self):
+        """
+        :return: list of all of the character names
+        """
+        self.reload_if_changed()
+        return list(self.characters)
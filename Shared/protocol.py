@@ -0,0 +1,437 @@
+"""
+Author: Yoni Reichert
+Program name: protocol.py
+Description: Encodes and decodes the game messages sent between the server and the clients
+Date: 17-10-2026
+"""
+
+import struct
+import json
+import logging
+
+logger = logging.getLogger("protocol")
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+PROTOCOL_VERSION = 2
+
+# Message encodings, the binary one is preferred and the json one is kept for older clients
+ENCODING_BINARY = 'binary'
+ENCODING_JSON = 'json'
+
+# Action types
+MOVE_PLAYER = 'move'
+SHOOT_PLAYER = 'shoot'
+PLAYER_INIT = 'player_init'
+HIT_PLAYER = 'hit'
+SNAPSHOT = 'snapshot'
+SNAPSHOT_ACK = 'snapshot_ack'
+RELIABLE = 'reliable'  # a message of the reliable channel, wrapping another message
+ACK = 'ack'  # acknowledges the reliable messages received
+LEAVE_VIEW = 'leave_view'  # the player left the client's area of interest, it is sent again when it comes back
+
+# Message keys
+ACTION_TYPE = 'type'
+ACTION_PARAMETERS = 'action_parameters'
+PLAYER_ID = 'player_id'
+SESSION = 'session'  # the token the server gave the client, 0 until the client got one
+
+# the id the server uses when a message is about the receiving client itself
+SELF_PLAYER_ID = '0'
+
+MESSAGE_DIVIDER = '!'
+
+MAX_DATAGRAM_SIZE = 65507
+
+# the most bytes bundled into one datagram, leaves room in a 1500 byte MTU for the IP and UDP headers and tunnels
+MTU_PAYLOAD_SIZE = 1200
+
+# Binary opcodes
+OPCODE_MOVE = 1
+OPCODE_SHOOT = 2
+OPCODE_PLAYER_INIT = 3
+OPCODE_HIT = 4
+OPCODE_SNAPSHOT = 5
+OPCODE_SNAPSHOT_ACK = 6
+OPCODE_RELIABLE = 8
+OPCODE_ACK = 9
+OPCODE_LEAVE_VIEW = 10
+
+OPCODES = {
+    MOVE_PLAYER: OPCODE_MOVE,
+    SHOOT_PLAYER: OPCODE_SHOOT,
+    PLAYER_INIT: OPCODE_PLAYER_INIT,
+    HIT_PLAYER: OPCODE_HIT,
+    SNAPSHOT: OPCODE_SNAPSHOT,
+    SNAPSHOT_ACK: OPCODE_SNAPSHOT_ACK,
+    RELIABLE: OPCODE_RELIABLE,
+    ACK: OPCODE_ACK,
+    LEAVE_VIEW: OPCODE_LEAVE_VIEW,
+}
+ACTION_TYPES = {opcode: action_type for action_type, opcode in OPCODES.items()}
+
+# a datagram holding several binary messages, each of them preceded by its length
+OPCODE_BUNDLE = 7
+
+# Binary layouts (network byte order)
+HEADER = struct.Struct('!BBII')  # version, opcode, session token, player id
+HEADER_IDS = struct.Struct('!II')  # the session token and player id inside of the header
+HEADER_IDS_OFFSET = 2
+MOVE_BODY = struct.Struct('!hh')  # x, y
+SHOOT_BODY = struct.Struct('!ff')  # dx, dy
+NAME_LENGTH = struct.Struct('!B')  # length of the character name that follows
+POSITION_BODY = struct.Struct('!hh')  # x, y of a created player, only sent by the server
+HIT_BODY = struct.Struct('!hh')  # damage, hp left after the hit
+SNAPSHOT_HEADER = struct.Struct('!II')  # snapshot id, baseline snapshot id (0 for a full snapshot)
+SNAPSHOT_ACK_BODY = struct.Struct('!I')  # acknowledged snapshot id
+COUNT = struct.Struct('!H')  # number of entries in the list that follows
+SNAPSHOT_PLAYER = struct.Struct('!Ihhh')  # player id, x, y, hp
+SNAPSHOT_REMOVED = struct.Struct('!I')  # player id
+SNAPSHOT_BULLET = struct.Struct('!IIhhff')  # spawn snapshot id, owner id, x, y, dx, dy
+BUNDLE_PART_LENGTH = struct.Struct('!H')  # length of the bundled message that follows
+RELIABLE_SEQUENCE = struct.Struct('!I')  # sequence of the reliable message, the wrapped message follows
+ACK_BODY = struct.Struct('!II')  # every sequence up to it was received, bitfield of the 32 sequences after it
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def encode_message(message, encoding=ENCODING_BINARY):
+    """
+    Serialize a message dictionary into the bytes of a single datagram.
+    :param message: the message dictionary (type, action_parameters and optionally player_id and session)
+    :param encoding: ENCODING_BINARY or ENCODING_JSON
+    :return: the encoded bytes
+    """
+    if encoding == ENCODING_JSON:
+        return encode_json_message(message)
+    return encode_binary_message(message)
+
+
+def encode_json_message(message):
+    """
+    Serialize a message in the legacy "<length>!<json>" format.
+    :param message: the message dictionary
+    :return: the encoded bytes
+    """
+    message_str = json.dumps(message)
+    return (str(len(message_str)) + MESSAGE_DIVIDER + message_str).encode()
+
+
+def encode_binary_message(message):
+    """
+    Serialize a message into the struct packed binary format.
+    :param message: the message dictionary
+    :return: the encoded bytes
+    """
+    action_type = message[ACTION_TYPE]
+    parameters = message[ACTION_PARAMETERS]
+    opcode = OPCODES[action_type]
+    header = HEADER.pack(PROTOCOL_VERSION,
+                         opcode,
+                         message.get(SESSION, 0),
+                         player_id_to_wire(message.get(PLAYER_ID, 0)))
+
+    if opcode == OPCODE_MOVE:
+        return header + MOVE_BODY.pack(int(parameters[0]), int(parameters[1]))
+    if opcode == OPCODE_SHOOT:
+        return header + SHOOT_BODY.pack(parameters[0], parameters[1])
+    if opcode == OPCODE_HIT:
+        # older servers only sent the damage
+        hp = parameters[1] if len(parameters) > 1 else -1
+        return header + HIT_BODY.pack(int(parameters[0]), int(hp))
+    if opcode == OPCODE_SNAPSHOT_ACK:
+        return header + SNAPSHOT_ACK_BODY.pack(parameters[0])
+    if opcode == OPCODE_SNAPSHOT:
+        return header + encode_snapshot_body(*parameters)
+    if opcode == OPCODE_ACK:
+        return header + ACK_BODY.pack(parameters[0], parameters[1])
+    if opcode == OPCODE_RELIABLE:
+        return header + RELIABLE_SEQUENCE.pack(parameters[0]) + bytes(parameters[1])
+    if opcode == OPCODE_LEAVE_VIEW:
+        return header  # the player is the header's player id
+
+    # player init, the name is followed by the position only when the server sends it
+    name = parameters[0].encode()
+    body = NAME_LENGTH.pack(len(name)) + name
+    if len(parameters) >= 3:
+        body += POSITION_BODY.pack(int(parameters[1]), int(parameters[2]))
+    return header + body
+
+
+def patch_binary_message(data, session, player_id):
+    """
+    Copy an encoded binary message with another session token and player id, without encoding it again.
+    Both are at a fixed offset of the header, so a broadcast is only encoded once for all of its recipients.
+    :param data: the encoded binary message
+    :param session: the recipient's session token
+    :param player_id: the player id as the recipient knows it
+    :return: the patched bytes
+    """
+    patched = bytearray(data)
+    HEADER_IDS.pack_into(patched, HEADER_IDS_OFFSET, session, player_id_to_wire(player_id))
+    return patched
+
+
+def encode_reliable_message(sequence, message, encoding=ENCODING_BINARY, session=0):
+    """
+    Wrap an encoded message in a message of the reliable channel.
+    :param sequence: the reliable message's sequence
+    :param message: the encoded message to wrap
+    :param encoding: ENCODING_BINARY or ENCODING_JSON, the wrapped message is in the same one
+    :param session: the session token to put on the wrapper
+    :return: the encoded bytes
+    """
+    if encoding == ENCODING_JSON:
+        return encode_json_message({ACTION_TYPE: RELIABLE,
+                                    ACTION_PARAMETERS: [sequence, str(message, 'utf-8')],
+                                    SESSION: session})
+    return encode_binary_message({ACTION_TYPE: RELIABLE, ACTION_PARAMETERS: [sequence, message], SESSION: session})
+
+
+def decode_message(data):
+    """
+    Parse a datagram in either of the supported encodings.
+    :param data: the received bytes
+    :return: a tuple of (message dictionary, encoding), or (None, None) if the datagram is invalid
+    """
+    if not data:
+        return None, None
+    try:
+        if data[0] == PROTOCOL_VERSION:
+            return decode_binary_message(data), ENCODING_BINARY
+        if chr(data[0]).isdigit():
+            return decode_json_message(data), ENCODING_JSON
+        logger.error(f"Unknown message version: {data[0]}")
+    except (struct.error, KeyError, IndexError, ValueError, UnicodeDecodeError) as e:
+        logger.error(f"Failed to decode message: {e}")
+    return None, None
+
+
+def bundle_messages(messages, encoding=ENCODING_BINARY, max_size=MTU_PAYLOAD_SIZE):
+    """
+    Pack encoded messages into as few datagrams as possible, keeping their order.
+    A message that is bigger than max_size on its own, like a big snapshot, is sent in a datagram of its own.
+    :param messages: list of the messages' bytes, all of them in the same encoding
+    :param encoding: ENCODING_BINARY or ENCODING_JSON
+    :param max_size: the most bytes to put in a datagram
+    :return: list of the datagrams
+    """
+    # json messages are already preceded by their length, so they are just concatenated
+    overhead, part_overhead = (HEADER.size, BUNDLE_PART_LENGTH.size) if encoding == ENCODING_BINARY else (0, 0)
+    groups = []
+    group, group_size = [], overhead
+    for message in messages:
+        if group and group_size + part_overhead + len(message) > max_size:
+            groups.append(group)
+            group, group_size = [], overhead
+        group.append(message)
+        group_size += part_overhead + len(message)
+    if group:
+        groups.append(group)
+
+    datagrams = []
+    for group in groups:
+        if len(group) == 1:
+            datagrams.append(group[0])  # a single message isn't wrapped, older peers can read it
+        elif encoding == ENCODING_JSON:
+            datagrams.append(b''.join(group))
+        else:
+            parts = [HEADER.pack(PROTOCOL_VERSION, OPCODE_BUNDLE, 0, 0)]
+            for message in group:
+                parts.append(BUNDLE_PART_LENGTH.pack(len(message)))
+                parts.append(message)
+            datagrams.append(b''.join(parts))
+    return datagrams
+
+
+def decode_datagram(data):
+    """
+    Parse a datagram that may hold several bundled messages.
+    :param data: the received bytes
+    :return: a tuple of (list of the message dictionaries, encoding), the list is empty if the datagram is invalid
+    """
+    try:
+        if len(data) >= HEADER.size and data[0] == PROTOCOL_VERSION and data[1] == OPCODE_BUNDLE:
+            messages = []
+            offset = HEADER.size
+            while offset < len(data):
+                length, = BUNDLE_PART_LENGTH.unpack_from(data, offset)
+                offset += BUNDLE_PART_LENGTH.size
+                messages.append(decode_binary_message(data[offset:offset + length]))
+                offset += length
+            return messages, ENCODING_BINARY
+        if data and chr(data[0]).isdigit():
+            return decode_json_messages(data), ENCODING_JSON
+    except (struct.error, KeyError, IndexError, ValueError, UnicodeDecodeError) as e:
+        logger.error(f"Failed to decode bundle: {e}")
+        return [], None
+    message, encoding = decode_message(data)
+    return ([message] if message else []), encoding
+
+
+def decode_json_messages(data):
+    """
+    Parse one or more concatenated messages in the legacy "<length>!<json>" format.
+    :param data: the received bytes, or a memoryview of them
+    :return: list of the message dictionaries, stopping at the first invalid one
+    """
+    messages = []
+    text = str(data, 'utf-8')
+    while text:
+        length_str, _, rest = text.partition(MESSAGE_DIVIDER)
+        length = int(length_str)
+        if len(rest) < length:
+            logger.error(f"Message length mismatch. Expected {length}, got {len(rest)}")
+            break
+        messages.append(unwrap_json_reliable(json.loads(rest[:length])))
+        text = rest[length:]
+    return messages
+
+
+def decode_json_message(data):
+    """
+    Parse a message in the legacy "<length>!<json>" format.
+    :param data: the received bytes, or a memoryview of them
+    :return: the message dictionary, or None if the length doesn't match
+    """
+    text = str(data, 'utf-8')
+    length_str, _, message = text.partition(MESSAGE_DIVIDER)
+    length = int(length_str)
+    message = message[:length]
+    if len(message) != length:
+        logger.error(f"Message length mismatch. Expected {length}, got {len(message)}")
+        return None
+    return unwrap_json_reliable(json.loads(message))
+
+
+def unwrap_json_reliable(message):
+    """
+    Decode the message a json reliable message wraps, so it looks the same as a decoded binary one.
+    :param message: a decoded json message
+    :return: the message, with the wrapped message decoded if it is a reliable one
+    """
+    if isinstance(message, dict) and message.get(ACTION_TYPE) == RELIABLE:
+        parameters = message.get(ACTION_PARAMETERS)
+        if isinstance(parameters, list) and len(parameters) == 2 and isinstance(parameters[1], str):
+            parameters[1] = decode_json_message(parameters[1].encode())
+    return message
+
+
+def decode_binary_message(data):
+    """
+    Parse a message in the struct packed binary format. Every field is unpacked in place,
+    so data can be a memoryview of a receive buffer without copying it.
+    :param data: the received bytes, or a memoryview of them
+    :return: the message dictionary
+    """
+    _, opcode, session, player_id = HEADER.unpack_from(data)
+    offset = HEADER.size
+    action_type = ACTION_TYPES[opcode]
+
+    if opcode == OPCODE_MOVE:
+        parameters = list(MOVE_BODY.unpack_from(data, offset))
+    elif opcode == OPCODE_SHOOT:
+        parameters = list(SHOOT_BODY.unpack_from(data, offset))
+    elif opcode == OPCODE_HIT:
+        damage, hp = HIT_BODY.unpack_from(data, offset)
+        parameters = [damage] if hp < 0 else [damage, hp]
+    elif opcode == OPCODE_SNAPSHOT_ACK:
+        parameters = list(SNAPSHOT_ACK_BODY.unpack_from(data, offset))
+    elif opcode == OPCODE_SNAPSHOT:
+        parameters = decode_snapshot_body(data, offset)
+    elif opcode == OPCODE_ACK:
+        parameters = list(ACK_BODY.unpack_from(data, offset))
+    elif opcode == OPCODE_RELIABLE:
+        sequence, = RELIABLE_SEQUENCE.unpack_from(data, offset)
+        parameters = [sequence, decode_binary_message(data[offset + RELIABLE_SEQUENCE.size:])]
+    elif opcode == OPCODE_LEAVE_VIEW:
+        parameters = []
+    else:
+        name_length, = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        parameters = [bytes(data[offset:offset + name_length]).decode()]
+        offset += name_length
+        if len(data) - offset >= POSITION_BODY.size:
+            parameters.extend(POSITION_BODY.unpack_from(data, offset))
+
+    return {ACTION_TYPE: action_type,
+            ACTION_PARAMETERS: parameters,
+            PLAYER_ID: player_id_from_wire(player_id),
+            SESSION: session}
+
+
+def encode_snapshot_body(snapshot_id, baseline_id, players, removed, bullets):
+    """
+    Pack the parameters of a snapshot message.
+    :param snapshot_id: the id of the snapshot
+    :param baseline_id: the snapshot the delta is relative to, 0 if it is a full snapshot
+    :param players: list of [player id, x, y, hp] of the players that changed since the baseline
+    :param removed: list of the player ids that left since the baseline
+    :param bullets: list of [spawn snapshot id, owner id, x, y, dx, dy] of the bullets shot since the baseline
+    :return: the packed bytes
+    """
+    parts = [SNAPSHOT_HEADER.pack(snapshot_id, baseline_id), COUNT.pack(len(players))]
+    for player_id, x, y, hp in players:
+        parts.append(SNAPSHOT_PLAYER.pack(player_id_to_wire(player_id), int(x), int(y), int(hp)))
+    parts.append(COUNT.pack(len(removed)))
+    for player_id in removed:
+        parts.append(SNAPSHOT_REMOVED.pack(player_id_to_wire(player_id)))
+    parts.append(COUNT.pack(len(bullets)))
+    for spawn_id, owner_id, x, y, dx, dy in bullets:
+        parts.append(SNAPSHOT_BULLET.pack(spawn_id, player_id_to_wire(owner_id), int(x), int(y), dx, dy))
+    return b''.join(parts)
+
+
+def decode_snapshot_body(data, offset):
+    """
+    Unpack the parameters of a snapshot message.
+    :param data: the received bytes
+    :param offset: where the snapshot body starts
+    :return: [snapshot id, baseline id, players, removed, bullets], in the layout of encode_snapshot_body
+    """
+    snapshot_id, baseline_id = SNAPSHOT_HEADER.unpack_from(data, offset)
+    offset += SNAPSHOT_HEADER.size
+
+    players = []
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        player_id, x, y, hp = SNAPSHOT_PLAYER.unpack_from(data, offset)
+        players.append([player_id_from_wire(player_id), x, y, hp])
+        offset += SNAPSHOT_PLAYER.size
+
+    removed = []
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        player_id, = SNAPSHOT_REMOVED.unpack_from(data, offset)
+        removed.append(player_id_from_wire(player_id))
+        offset += SNAPSHOT_REMOVED.size
+
+    bullets = []
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        spawn_id, owner_id, x, y, dx, dy = SNAPSHOT_BULLET.unpack_from(data, offset)
+        bullets.append([spawn_id, player_id_from_wire(owner_id), x, y, dx, dy])
+        offset += SNAPSHOT_BULLET.size
+
+    return [snapshot_id, baseline_id, players, removed, bullets]
+
+
+def player_id_to_wire(player_id):
+    """
+    Convert a player id to its fixed width representation, the client's own player ('0') becomes 0.
+    :param player_id: the player id as used by the game
+    :return: the integer written into the header
+    """
+    return 0 if player_id == SELF_PLAYER_ID else int(player_id)
+
+
+def player_id_from_wire(player_id):
+    """
+    Convert a player id read from the header back into the id used by the game.
+    :param player_id: the integer read from the header
+    :return: SELF_PLAYER_ID for 0, otherwise the id itself
+    """
+    return SELF_PLAYER_ID if player_id == 0 else player_id
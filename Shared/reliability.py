@@ -0,0 +1,212 @@
+"""
+Author: Yoni Reichert
+Program name: reliability.py
+Description: A reliable, ordered channel over UDP for the messages that must arrive, like player_init and hit.
+             Every reliable message has a sequence number, the other side acknowledges every sequence up to the
+             last one it delivered, with a bitfield of the 32 sequences after it that arrived early. The acks ride
+             along with the datagrams it sends anyway, and a message that isn't acknowledged within the round trip
+             time estimate is sent again
+Date: 17-10-2026
+"""
+
+import time
+from threading import Lock
+import protocol
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+INITIAL_RETRANSMIT_TIMEOUT = 0.2  # seconds, until the first round trip time is measured
+MIN_RETRANSMIT_TIMEOUT = 0.05
+MAX_RETRANSMIT_TIMEOUT = 2.0
+ACK_BITS = 32  # how many sequences after the cumulative one an ack covers
+MAX_OUT_OF_ORDER = 1024  # the most messages held back while waiting for an earlier one, later ones are dropped
+MAX_WIRE_VALUE = 2 ** 32 - 1  # sequences, acks and ack bitfields are uint32 in the binary protocol
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def is_wire_value(value):
+    """
+    :param value: a sequence, ack or ack bitfield of a message
+    :return: True if the value is an int (bool isn't counted as one) that fits the binary protocol
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_WIRE_VALUE
+
+
+def validate_parameters(action_type, parameters):
+    """
+    Make sure the parameters of a reliable message or an ack can be handed to a ReliableChannel.
+    :param action_type: protocol.RELIABLE or protocol.ACK
+    :param parameters: [sequence, decoded message] of a reliable message, [ack, ack bitfield] of an ack
+    :return: True if the parameters are valid
+    """
+    if not isinstance(parameters, list) or len(parameters) != 2 or not is_wire_value(parameters[0]):
+        return False
+    if action_type == protocol.ACK:
+        return is_wire_value(parameters[1])
+    # a wrapped message that failed to decode comes as None, it must not take up its sequence
+    return isinstance(parameters[1], dict)
+
+
+class ReliableChannel:
+    def __init__(self, encoding=protocol.ENCODING_BINARY):
+        """
+        Initialize both directions of a reliable channel with one peer.
+        :param encoding: the encoding the peer talks in
+        """
+        self.encoding = encoding
+        self.lock = Lock()
+        self.active = False  # set once the peer sent a reliable message or an ack, older peers don't know them
+
+        # sending
+        self.next_sequence = 1
+        self.unacked = {}  # sequence -> [data, last send time, first send time, was resent, retransmit timeout]
+        self.smoothed_rtt = None
+        self.rtt_variation = None
+        self.retransmit_timeout = INITIAL_RETRANSMIT_TIMEOUT
+
+        # receiving
+        self.next_delivery = 1
+        self.out_of_order = {}  # sequence -> message that arrived before an earlier one
+        self.ack_pending = False
+
+    def wrap(self, message, session):
+        """
+        Make an encoded message reliable, it is sent again until the peer acknowledges it.
+        :param message: the encoded message
+        :param session: the session token to put on the wrapper
+        :return: the encoded reliable message
+        """
+        now = time.monotonic()
+        with self.lock:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            data = protocol.encode_reliable_message(sequence, message, self.encoding, session)
+            self.unacked[sequence] = [data, now, now, False, self.retransmit_timeout]
+        return data
+
+    def due_retransmissions(self):
+        """
+        Find the messages that weren't acknowledged in time, each of them waits twice as long before the next try.
+        :return: list of the encoded reliable messages to send again
+        """
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            for entry in self.unacked.values():
+                if now - entry[1] >= entry[4]:
+                    entry[1] = now
+                    entry[3] = True
+                    entry[4] = min(entry[4] * 2, MAX_RETRANSMIT_TIMEOUT)
+                    due.append(entry[0])
+        return due
+
+    def acknowledge(self, ack, ack_bits):
+        """
+        Drop the messages the peer acknowledged, and measure the round trip time from the ones that were sent once.
+        :param ack: the peer got every sequence up to this one
+        :param ack_bits: bit i is set if the peer got sequence ack + 1 + i ahead of the ones before it
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.active = True
+            acked = [sequence for sequence in self.unacked if sequence <= ack]
+            acked += [ack + 1 + i for i in range(ACK_BITS) if ack_bits >> i & 1]
+            for sequence in acked:
+                entry = self.unacked.pop(sequence, None)
+                if entry and not entry[3]:
+                    self.update_rtt(now - entry[2])
+
+    def update_rtt(self, sample):
+        """
+        Update the round trip time estimate and the retransmit timeout, like TCP does (RFC 6298).
+        :param sample: a measured round trip time, in seconds
+        """
+        if self.smoothed_rtt is None:
+            self.smoothed_rtt = sample
+            self.rtt_variation = sample / 2
+        else:
+            self.rtt_variation = 0.75 * self.rtt_variation + 0.25 * abs(self.smoothed_rtt - sample)
+            self.smoothed_rtt = 0.875 * self.smoothed_rtt + 0.125 * sample
+        self.retransmit_timeout = min(max(self.smoothed_rtt + 4 * self.rtt_variation, MIN_RETRANSMIT_TIMEOUT),
+                                      MAX_RETRANSMIT_TIMEOUT)
+
+    def receive(self, sequence, message):
+        """
+        Take a reliable message from the peer.
+        :param sequence: the message's sequence
+        :param message: the decoded message inside of it
+        :return: list of the messages that can be handled now, in the order they were sent
+        """
+        with self.lock:
+            self.active = True
+            self.ack_pending = True  # a duplicate means the ack was lost, so it is sent again too
+            if sequence < self.next_delivery or sequence in self.out_of_order:
+                return []
+            if sequence >= self.next_delivery + MAX_OUT_OF_ORDER:
+                return []
+            self.out_of_order[sequence] = message
+
+            delivered = []
+            while self.next_delivery in self.out_of_order:
+                delivered.append(self.out_of_order.pop(self.next_delivery))
+                self.next_delivery += 1
+            return delivered
+
+    def build_ack(self, session):
+        """
+        Build an ack of the received messages, if something was received since the last one.
+        :param session: the session token to put on the ack
+        :return: the encoded ack message, or None if there is nothing new to acknowledge
+        """
+        with self.lock:
+            if not self.ack_pending:
+                return None
+            self.ack_pending = False
+            # everything delivered is acknowledged at once, however far behind the newest message it is
+            ack = self.next_delivery - 1
+            ack_bits = 0
+            for i in range(ACK_BITS):
+                if ack + 1 + i in self.out_of_order:
+                    ack_bits |= 1 << i
+        return protocol.encode_message({protocol.ACTION_TYPE: protocol.ACK,
+                                        protocol.ACTION_PARAMETERS: [ack, ack_bits],
+                                        protocol.SESSION: session}, self.encoding)
+
+
+if __name__ == "__main__":
+    sender, receiver = ReliableChannel(), ReliableChannel()
+    first = sender.wrap(protocol.encode_message({protocol.ACTION_TYPE: protocol.PLAYER_INIT,
+                                                 protocol.ACTION_PARAMETERS: ["Shadow"]}), 1)
+    second = sender.wrap(protocol.encode_message({protocol.ACTION_TYPE: protocol.HIT_PLAYER,
+                                                  protocol.ACTION_PARAMETERS: [10, 90]}), 1)
+
+    # the second message arrives first, it is held back until the first one is received
+    reliable = protocol.decode_binary_message(second)
+    assert validate_parameters(protocol.RELIABLE, reliable[protocol.ACTION_PARAMETERS])
+    assert receiver.receive(*reliable[protocol.ACTION_PARAMETERS]) == []
+    ack = protocol.decode_binary_message(receiver.build_ack(1))[protocol.ACTION_PARAMETERS]
+    assert ack == [0, 0b10]  # nothing delivered yet, bit 1 is sequence 2
+    sender.acknowledge(*ack)
+    assert list(sender.unacked) == [1]
+
+    # the first message was lost, so it is sent again once its retransmit timeout passes
+    assert sender.due_retransmissions() == []
+    sender.unacked[1][1] -= INITIAL_RETRANSMIT_TIMEOUT
+    assert sender.due_retransmissions() == [first]
+    delivered = receiver.receive(*protocol.decode_binary_message(first)[protocol.ACTION_PARAMETERS])
+    assert [message[protocol.ACTION_TYPE] for message in delivered] == [protocol.PLAYER_INIT, protocol.HIT_PLAYER]
+
+    # a duplicate isn't delivered again, but it is acknowledged again
+    assert receiver.receive(*protocol.decode_binary_message(first)[protocol.ACTION_PARAMETERS]) == []
+    ack = protocol.decode_binary_message(receiver.build_ack(1))[protocol.ACTION_PARAMETERS]
+    assert ack == [2, 0]
+    sender.acknowledge(*ack)
+    assert sender.unacked == {}
+    assert receiver.build_ack(1) is None
+
+    assert not validate_parameters(protocol.ACK, [True, 0])
+    assert not validate_parameters(protocol.ACK, [1, MAX_WIRE_VALUE + 1])
+    assert not validate_parameters(protocol.RELIABLE, [-1, {}])
+    assert not validate_parameters(protocol.RELIABLE, [1, None])
+    assert not validate_parameters(protocol.RELIABLE, [1, [protocol.MOVE_PLAYER]])
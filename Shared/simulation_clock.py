@@ -0,0 +1,55 @@
+"""
+Author: Yoni Reichert
+Program name: simulation_clock.py
+Description: The clock of the game simulation, which only moves when the game steps a tick, never with the wall
+             clock. Cooldowns are counted in ticks, so a game runs the same way whether it steps in realtime or as
+             fast as it can, and the same actions on the same ticks always give the same game
+Date: 17-10-2026
+"""
+
+import math
+
+# ------------------------------------------------ CONSTANTS ----------------------------------------------------------
+
+# the tick rate the character stats are tuned for, the cooldowns in Characters.json are in milliseconds at this rate
+SIMULATION_TICK_RATE = 60
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class SimulationClock:
+    def __init__(self, tick=0):
+        """
+        Initialize the clock.
+        :param tick: the tick to start from
+        """
+        self.tick = tick
+
+    def advance(self, ticks=1):
+        """
+        Move the clock forward.
+        :param ticks: how many ticks to move
+        :return: the current tick
+        """
+        self.tick += ticks
+        return self.tick
+
+
+def ms_to_ticks(milliseconds, tick_rate=SIMULATION_TICK_RATE):
+    """
+    Convert a duration to ticks, rounded up so a cooldown never gets shorter.
+    :param milliseconds: the duration
+    :param tick_rate: ticks per second
+    :return: the duration in ticks
+    """
+    return math.ceil(milliseconds * tick_rate / 1000)
+
+
+def scale_ticks(ticks, tick_rate):
+    """
+    Convert a duration in ticks at SIMULATION_TICK_RATE, like a bullet's lifespan, to the same duration at another rate.
+    :param ticks: the duration in ticks at SIMULATION_TICK_RATE
+    :param tick_rate: the ticks per second the game actually runs at
+    :return: the duration in ticks at tick_rate, at least a tick
+    """
+    return max(1, round(ticks * tick_rate / SIMULATION_TICK_RATE))